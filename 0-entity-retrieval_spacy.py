@@ -10,65 +10,73 @@
 """
 
 #%% imports
-import numpy as np
-from bs4 import BeautifulSoup
-import datetime as dt
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
-import spacy
-from spacy.matcher import Matcher
 import timeit
 
-from helpers.spacy_pattern_from_list import spacy_pattern_from_list
-from helpers.count_tup_first_values import count_tup_first_values
-from helpers.tokenize_df_explode import tokenize_df_explode
-
-# spacy.cli.download("en_core_web_lg")  # download spacy corpus
-nlp = spacy.load('en_core_web_lg')  # load spacy corpus
-
-
-#%% load data
-newsletters: pd.DataFrame = pd.read_json("./data/raw/Newsletters - Morning tech.json")  # load data
-
-#%% clean data
-newsletters.set_index('id', inplace=True)  # set index
-newsletters['date'] = pd.to_datetime(newsletters['date']).dt.date
-
-newsletters = newsletters[['date', 'text']]
-
-#%% split into paragraphs
-
-print(f"The data frame 'newsletters' has {newsletters.shape[0]} rows and {newsletters.shape[1]} columns.")  # (1758, 2)
-newsletter_paragraphs: pd.DataFrame = tokenize_df_explode(df=newsletters, textcol_in="text", split_on = "new_line", textcol_out="paragraph")
-# The operation took 2.618 seconds.
-print(f"The data frame 'newsletters' now has {newsletter_paragraphs.shape[0]} rows and {newsletter_paragraphs.shape[1]} columns.")  # (124519, 4)
-
-newsletter_paragraphs.rename(columns={"date": "newsletter_date"}, inplace=True)
-# newsletter_paragraphs.drop(columns="newsletter_index", inplace=True)  # contains errors
-
-newsletter_paragraphs = newsletter_paragraphs[['newsletter_date', 'paragraph']]
-newsletter_paragraphs['newsletter_date'] = pd.to_datetime(pd.to_datetime(newsletter_paragraphs['newsletter_date']).dt.date)
-
-#%% convert paragraphs to spacy objects
-
-starttime = timeit.default_timer()
-newsletter_paragraphs['paragraph_spacy'] = [doc for doc in nlp.pipe(newsletter_paragraphs['paragraph'].tolist())]  # convert to spacy object
-print(f"The creation of spaCy objects took {timeit.default_timer() - starttime:.3f} seconds.")
-del starttime
-
-type(newsletter_paragraphs.at[0, 'paragraph_spacy'])
+from helpers.docbin_cache import DocBinCache, text_hash
+from helpers.entity_catalogue import build_matcher, build_phrase_matcher, compile_entity_phrases, read_entity_catalogue
+from helpers.keyword_prefilter import benchmark_prefilter, build_keyword_automaton
+from helpers.load_spacy_pipeline import compare_pipe_throughput, load_spacy_pipeline
+from helpers.match_newsletter_paragraphs import match_newsletter_paragraphs
+from helpers.mention_index import write_mention_index
+from helpers.paragraph_dedup import ParagraphCache, dedup_summary
+from helpers.paragraph_vectors import has_vectors, remove_paragraph_vectors, save_paragraph_vectors
+from helpers.parallel_retrieval import run_parallel_retrieval
+from helpers.parquet_tables import write_table
+from helpers.quarterly_aggregates import load_incremental_state, merge_partial_aggregates, partial_quarterly_aggregates,\
+    save_incremental_state, sort_by_newsletter_order
+from helpers.read_json_records import read_json_chunks
+from helpers.run_metrics import RunMetrics
+from helpers.script_settings import apply_overrides
+from helpers.term_extraction import terms_of
+from helpers.token_store import TokenStore, extract_terms
+from helpers.topic_tokens import export_topic_tokens
+
+#%% settings
+spacy_model: str = 'en_core_web_lg'  # model name or path; 'lg', 'sm' or 'blank' (tokenizer only, no download needed)
+matching_mode: str = 'tokenizer'  # 'tokenizer': the matchers below only use LOWER; 'full': run the complete pipeline
+matching_engine: str = 'token_store'  # 'token_store': vectorized matching on token attribute arrays; 'spacy': spaCy Matcher per Doc
+pipe_batch_size: int = 1000  # batch_size passed to nlp.pipe
+pipe_n_process: int = 1  # number of processes used by nlp.pipe
+use_prefilter: bool = True  # only parse & match paragraphs that contain a rapporteur name (or, with a mention index, a topic word) in the raw text
+newsletters_path: str = "./data/raw/Newsletters - Morning tech.json"  # JSON array or JSON Lines file
+newsletters_chunksize: int = 250  # number of newsletters split, parsed and matched at once
+incremental_mode: bool = False  # True: only process newsletters whose id is not in the stored state (daily updates)
+state_path: str = "./data/state/retrieval_state.pkl"  # processed ids & mergeable quarterly aggregates
+n_workers: int = 1  # > 1: split, parse, match and aggregate chunks of newsletters in a pool of worker processes
+entity_catalogue_path: str = "./data/preprocessed/entity_catalogue.json"  # entities & aliases (see helpers/entity_catalogue.py)
+entity_types: tuple = ('rapporteur', )  # entity types of the catalogue that are matched & counted
+cooccurrence_window: int = None  # rapporteur x topic/rapporteur co-occurrence within blocks of this many sentences; None: per paragraph
+mention_index_path: str = "./data/output_ready/mention_index"  # inverted index of the matched paragraphs for python -m helpers.mention_index (None: no index)
+topic_tokens_path: str = "./data/preprocessed/topic_tokens"  # lemma & POS of the non-AI rapporteur paragraphs for 1-retrieval-words.py (None: no export)
+paragraph_vectors_path: str = "./data/preprocessed/paragraph_vectors"  # mean word vector of every parsed paragraph (models with vectors only; None: not stored)
+report_path: str = "./data/reports/run_retrieval.json"  # per-stage wall/CPU time, peak RSS, rows & docs/sec of this run
+profile_stage: str = None  # e.g. 'parse' or 'match_rapp': cProfile dump of that stage to ./data/reports/profiles/
+apply_overrides(globals())  # settings given on the command line (python cli.py retrieve ...); none when run cell by cell
+
+metrics = RunMetrics(script="0-entity-retrieval_spacy.py", profile_stage=profile_stage,
+                     settings={'spacy_model': spacy_model, 'matching_mode': matching_mode, 'use_prefilter': use_prefilter,
+                               'matching_engine': matching_engine, 'newsletters_chunksize': newsletters_chunksize, 'incremental_mode': incremental_mode,
+                               'n_workers': n_workers})
+
+metrics.start("load_pipeline")
+nlp = load_spacy_pipeline(model=spacy_model, mode=matching_mode)  # load spacy corpus (tokenizer only unless 'full')
+metrics.stop("load_pipeline")
+
+with_vectors: bool = paragraph_vectors_path is not None and has_vectors(nlp)  # keep the vectors of the parsed paragraphs
 
 #%% match topics (AI act & AI)
-matcher_topic = Matcher(nlp.vocab)  # instantiate matcher for topic (AI act vs. AI vs. none)
+topic_patterns: dict = {}  # match id: patterns (kept as data so that worker processes can compile the matchers)
 
 # pattern to match artificial intelligence IF NOT followed by "act"
-matcher_topic.add(100, [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act', 'OP': '!'}],
-                          [{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act', 'OP': '!'}],
-                          [{'LOWER': 'ai'}, {'LOWER': 'act', 'OP': '!'}]])
+topic_patterns[100] = [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act', 'OP': '!'}],
+                       [{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act', 'OP': '!'}],
+                       [{'LOWER': 'ai'}, {'LOWER': 'act', 'OP': '!'}]]
 
 # pattern to match AI act
-matcher_topic.add(101, [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act'}], [{'LOWER': 'ai'}, {'LOWER': 'act'}]])
+topic_patterns[101] = [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act'}], [{'LOWER': 'ai'}, {'LOWER': 'act'}]]
+
+matcher_topic = build_matcher(nlp.vocab, topic_patterns, engine=matching_engine)  # instantiate matcher for topic (AI act vs. AI vs. none)
 
 topic_values: tuple = (100, 101)
 topic_colmapper: dict = {100: "AIgen", 101: "AIact"}
@@ -78,182 +86,214 @@ if False:  # matcher testing:
         "AI should match theAIpattern. gAIn not. Artificial Intelligence and AI and artificial intelligence should match theAIpattern. AID not. Atrificial intelligence not."
         "AI act, artificial intelligence act should match theAIACTpattern, not PArtificial intelligence act, not artificial intelligence.")
 
-    matches = matcher_topic(doc)
+    matches = matcher_topic(doc) if matching_engine == 'spacy' else matcher_topic(TokenStore.from_docs([doc]))[0]
 
     for match_id, start, end in matches:
         string_id = nlp.vocab.strings[match_id]  # Get string representation
         span = doc[start:end]  # The matched span
         print(f"match pattern: {string_id}, start match: {start}, end match: {end}, match text: {span.text}")
 
-# apply matcher
-newsletter_paragraphs['matches_topic'] = newsletter_paragraphs['paragraph_spacy'].apply(matcher_topic)  # match patterns
-
-# manipulate emotion matches
-newsletter_paragraphs = newsletter_paragraphs.join(newsletter_paragraphs['matches_topic'].apply(
-    count_tup_first_values, args=(topic_values, )))  # aggregate matches: extract values & rejoin
-
-# rename columns
-newsletter_paragraphs = newsletter_paragraphs.rename(columns=topic_colmapper)  # optional columns renaming
-
-#%% clean matched topics: each paragraph counted only once
-
-newsletter_paragraphs.loc[:, ['AIgen', 'AIact']] = \
-    newsletter_paragraphs.loc[:, ['AIgen', 'AIact']].replace(
-        [i for i in range(1, (newsletter_paragraphs.loc[:, ['AIgen', 'AIact']].max().max() + 1))], 1)  # count each paragraph mentioning a topic only once
-
-
 #%% match rapporteurs
 
-matcher_rapps = spacy.matcher.Matcher(nlp.vocab)  # instantiate matcher for rapporteurs
-
-rapporteur_patterns_spacy: dict = {}
+entities: list = read_entity_catalogue(entity_catalogue_path, types=entity_types)  # ids, names, types & aliases
+rapp_phrases: dict = compile_entity_phrases(entities, nlp, first_id=1001)  # int id: tokenized aliases (cached per catalogue)
 
-with open("./data/preprocessed/rapporteur_patterns.txt", "r") as f:  # load rapporteur lastname patterns
-    for line in f.readlines():
-        rap_pat = [i.strip() for i in line.split(',')][0]  # only the all lower-case version is needed
+rapp_values: list = list(rapp_phrases.keys())  # to be transformed to tuple; holds int values of rapporteurs
+rapp_colmapper: dict = {int_id: entity['id'] for int_id, entity in zip(rapp_values, entities)}  # int id to entity id
 
-        if len(rap_pat.split(" ")) == 2:
-            name = rap_pat.replace(" ", "_")
-            patt = [[{'LOWER': rap_pat.split(" ")[0]}, {'LOWER': rap_pat.split(" ")[1]}]]
+# every token the matchers need first: the last token of every alias and the topic words
+prefilter_keywords: dict = {'rapporteur': [phrase[-1] for phrases in rapp_phrases.values() for phrase in phrases],
+                            'topic': ['ai', 'artificial']}
+prefilter_require: tuple = ('rapporteur', 'topic') if mention_index_path is not None else ('rapporteur', )  # the index also holds topic-only paragraphs
 
-        else:  # len(rap_pat.split(" ")) == 1
-            name = rap_pat
-            patt = [[{'LOWER': rap_pat}]]
+matcher_rapps = build_phrase_matcher(nlp.vocab, rapp_phrases, engine=matching_engine)  # instantiate matcher for rapporteurs
+rapp_names: list = [rapp_colmapper[i] for i in rapp_values]  # column names (in the order of rapp_values)
 
-        rapporteur_patterns_spacy[name] = patt
+#%% incremental mode: only newsletters not processed in a previous run are split, parsed and matched
 
-del f, line, rap_pat,  name, patt
+state_key: str = text_hash(repr((rapp_names, rapp_phrases, topic_colmapper, cooccurrence_window, prefilter_require, mention_index_path is not None, with_vectors, "mention_cube")))  # stored counts are only valid for the same patterns (and aggregates)
+state = load_incremental_state(state_path, state_key) if incremental_mode else None
 
-int_id_pattern: int = 1001  # int number of rapporteurs
-rapp_values: list = []  # to be transformed to tuple; holds int values of rapporteus
-rapp_colmapper: dict = {}  # to rename columns after mapping; int to name of rapporteur pattern
+if state is None:  # full recompute
+    state = {'state_key': state_key, 'processed_ids': set(), 'aggregates': None}
 
-for rapp in rapporteur_patterns_spacy.keys():
+#%% load, split, parse and match newsletters in chunks (streaming: memory is bounded by the chunk size)
 
-    print(f"int id: {int_id_pattern}, rapp patt: {rapporteur_patterns_spacy[rapp]}, rapp name: {rapp}")
-    # pattern to match AI act
-    matcher_rapps.add(int_id_pattern, rapporteur_patterns_spacy[rapp])
+prefilter_automaton = build_keyword_automaton(prefilter_keywords) if use_prefilter else None
 
-    rapp_values.append(int_id_pattern)
-    rapp_colmapper[int_id_pattern] = rapp
-
-    int_id_pattern += 1
-
-del int_id_pattern, rapp, rapporteur_patterns_spacy
+starttime = timeit.default_timer()
 
-# apply matcher
-newsletter_paragraphs['matches_rapp'] = newsletter_paragraphs['paragraph_spacy'].apply(matcher_rapps)  # match patterns
+if n_workers > 1:  # map-reduce: chunks are split, parsed, matched and aggregated by a pool of worker processes
+    aggregates, newsletter_order = run_parallel_retrieval(
+        newsletters_path, n_workers=n_workers, chunksize=newsletters_chunksize, skip_ids=state['processed_ids'],
+        metrics=metrics,
+        config={'spacy_model': spacy_model, 'matching_mode': matching_mode, 'matching_engine': matching_engine,
+                'pipe_batch_size': pipe_batch_size,
+                'split_on': "new_line", 'cache_dir': "./data/cache/docbin",
+                'use_prefilter': use_prefilter, 'prefilter_keywords': prefilter_keywords, 'prefilter_require': prefilter_require,
+                'topic_patterns': topic_patterns, 'topic_values': topic_values, 'topic_colmapper': topic_colmapper,
+                'rapp_phrases': rapp_phrases, 'rapp_values': tuple(rapp_values), 'rapp_names': rapp_names,
+                'cooccurrence_window': cooccurrence_window, 'with_index': mention_index_path is not None,
+                'with_vectors': with_vectors,
+                'profile_stage': profile_stage, 'profile_dir': metrics.profile_dir})
+
+else:
+    doc_cache = DocBinCache(nlp, cache_dir="./data/cache/docbin")  # previously parsed paragraphs are loaded from disk
+    paragraph_cache = ParagraphCache()  # repeated paragraphs (boilerplate) are matched once per run
+    newsletter_order: list = []  # all newsletter ids in the order of the file (incl. previously processed ones)
+    sample_paragraphs: list = []  # first paragraphs (for the throughput & prefilter tests below)
+    partials: list = []  # partial aggregates per chunk (the paragraphs themselves are not kept)
+    n_paragraphs: int = 0
+
+    for newsletters in read_json_chunks(newsletters_path, columns=('id', 'date', 'text'), chunksize=newsletters_chunksize):
+        newsletter_order.extend(newsletters['id'].tolist())
+        newsletters = newsletters.loc[~newsletters['id'].isin(state['processed_ids']), :]  # skip processed newsletters
+
+        if newsletters.shape[0] == 0:
+            continue
+
+        newsletter_paragraphs: pd.DataFrame = \
+            match_newsletter_paragraphs(newsletters, nlp, matchers={'topic': matcher_topic, 'rapp': matcher_rapps},
+                                        automaton=prefilter_automaton, require=prefilter_require, doc_cache=doc_cache,
+                                        split_on="new_line", sentences=cooccurrence_window is not None,
+                                        vectors=with_vectors, paragraph_cache=paragraph_cache, metrics=metrics, batch_size=pipe_batch_size,
+                                        n_process=pipe_n_process)
+        n_paragraphs += newsletter_paragraphs.shape[0]
+        sample_paragraphs.extend(newsletter_paragraphs['paragraph'].tolist()[:10000 - len(sample_paragraphs)])
+
+        # counts & non-AI paragraphs of the chunk (see partial_quarterly_aggregates); the matched paragraphs of the
+        # chunk are dropped, so memory does not grow with the size of the archive
+        metrics.start("aggregate", rows_in=newsletter_paragraphs.shape[0])
+        partials.append(partial_quarterly_aggregates(newsletter_paragraphs, topic_values, topic_colmapper,
+                                                     tuple(rapp_values), rapp_names, window=cooccurrence_window,
+                                                     with_index=mention_index_path is not None,
+                                                     with_vectors=with_vectors))
+        metrics.stop("aggregate", rows_out=partials[-1]['topic_paragraphs_rapp'].shape[0])
+        del newsletter_paragraphs
+
+    aggregates = merge_partial_aggregates(partials)  # as in helpers/parallel_retrieval.py
+    del partials
+    print(f"{n_paragraphs} paragraphs were split, parsed and matched.")  # 124519
+
+print(f"Splitting, parsing, matching and aggregating took {timeit.default_timer() - starttime:.3f} seconds.")
+del starttime
 
-# manipulate rapporteur matches
-newsletter_paragraphs = newsletter_paragraphs.join(newsletter_paragraphs['matches_rapp'].apply(
-    count_tup_first_values, args=(tuple(rapp_values), )))  # aggregate matches: extract values & rejoin
+if False:  # throughput testing: tokenizer-only vs. full pipeline on a sample of paragraphs
+    compare_pipe_throughput(sample_paragraphs[:5000], model=spacy_model,
+                            batch_size=pipe_batch_size, n_process=pipe_n_process)
 
-# rename columns
-newsletter_paragraphs = newsletter_paragraphs.rename(columns=rapp_colmapper)  # optional columns renaming
+if False:  # prefilter testing: fraction skipped, end-to-end speedup and identical matches on a sample of paragraphs
+    benchmark_prefilter(sample_paragraphs[:10000], nlp,
+                        [build_matcher(nlp.vocab, topic_patterns), build_phrase_matcher(nlp.vocab, rapp_phrases)],
+                        build_keyword_automaton(prefilter_keywords), require='rapporteur', batch_size=pipe_batch_size)
 
 #%% inspect rapporteur matching results & save relevant info (quarterly data) in separate data frame
 
-newsletter_paragraphs[[i for i in rapp_colmapper.values()]].sum()  # matching worked - matches found
-# newsletter_paragraphs['newsletter_date'] = pd.to_datetime(pd.to_datetime(newsletter_paragraphs['newsletter_date']).dt.date)  # remove if no error thrown; if error thrown: remove "#" to make code functional
-
-# 1) overall mentions (mere name count; one paragraph can be multiple counts)
-rapp_overall_q_mentions_tmp =\
-    newsletter_paragraphs.groupby(newsletter_paragraphs['newsletter_date'].dt.to_period("Q"))\
-        [[i for i in rapp_colmapper.values()]].sum().reset_index()  # mentions overall (one paragraph can give two mentions)
-
-rapp_q_mentions = pd.melt(rapp_overall_q_mentions_tmp, id_vars='newsletter_date',
-                          value_vars=[i for i in rapp_colmapper.values()],
-                          value_name='mentions_overall_total', var_name='rapporteur')
-
-# 2) paragraph mentions (each paragraph counts once, no matter if mentioning the name once or more often)
-newsletter_paragraphs.loc[:, [i for i in rapp_colmapper.values()]] =\
-    newsletter_paragraphs.loc[:, [i for i in rapp_colmapper.values()]].replace(
-        [i for i in range(1, (newsletter_paragraphs.loc[:, [i for i in rapp_colmapper.values()]].max().max()+1))], 1)
-    # across all columns _counting_ the number of rapporteur matches, replace
-    # any number between 1 and [the maximum of the numbers in these columns] + 1 with 1
-
-rapp_overall_q_mentions_tmp =\
-    newsletter_paragraphs.groupby(newsletter_paragraphs['newsletter_date'].dt.to_period("Q"))\
-        [[i for i in rapp_colmapper.values()]].sum().reset_index()  # paragraph mentions (1 paragraph = max 1 mention)
-
-rapp_q_mentions_para = pd.melt(rapp_overall_q_mentions_tmp, id_vars='newsletter_date',
-                               value_vars=[i for i in rapp_colmapper.values()],
-                               value_name='mentions_overall_paragraph', var_name='rapporteur')
-
-rapp_q_mentions = pd.merge(rapp_q_mentions, rapp_q_mentions_para, how='outer', on=['newsletter_date', 'rapporteur'])
-
-#3) AIact & AIgen mentions
-
-for rapp in rapp_colmapper.values():
-    # create a new column rapporteur_AIxxx that is one for each paragraph containing both the rapporteur and AIxxx
-    newsletter_paragraphs.loc[:, rapp + "_AIact"] = \
-        np.where((newsletter_paragraphs[rapp] > 0) & (newsletter_paragraphs["AIact"] > 0), 1, 0)
-
-    newsletter_paragraphs.loc[:, rapp + "_AIgen"] = \
-        np.where((newsletter_paragraphs[rapp] > 0) & (newsletter_paragraphs["AIgen"] > 0), 1, 0)
-
-rapp_AIact = newsletter_paragraphs[['newsletter_date'] + [i for i in newsletter_paragraphs.columns if i.endswith("_AIact")]]  # date & _AIact columns
-rapp_AIgen = newsletter_paragraphs[['newsletter_date'] + [i for i in newsletter_paragraphs.columns if i.endswith("_AIgen")]]  # date & _AIgen columns
-
-rapp_AIact_q_raw = rapp_AIact.groupby(rapp_AIact['newsletter_date'].dt.to_period("Q")).sum().reset_index()  # quarterly AIact mentions (1 paragraph = max 1 mention)
-rapp_AIgen_q_raw = rapp_AIgen.groupby(rapp_AIgen['newsletter_date'].dt.to_period("Q")).sum().reset_index()  # quarterly AIgen mentions (1 paragraph = max 1 mention)
-
-rapp_AIact_q = pd.melt(rapp_AIact_q_raw, id_vars='newsletter_date', value_vars=[i for i in rapp_AIact_q_raw.columns if not 'newsletter_dat' in i], value_name='mentions_AIact', var_name='rapporteur')  # transform wide to long
-rapp_AIgen_q = pd.melt(rapp_AIgen_q_raw, id_vars='newsletter_date', value_vars=[i for i in rapp_AIgen_q_raw.columns if not 'newsletter_dat' in i], value_name='mentions_AIgen', var_name='rapporteur')  # transform wide to long
+# add the counts & paragraphs of previously processed newsletters (incremental mode)
+aggregates = merge_partial_aggregates([state['aggregates'], aggregates])
+if aggregates is None:
+    raise ValueError(f"No newsletters to process in {newsletters_path}.")
 
-rapp_AIact_q["rapporteur"] = rapp_AIact_q["rapporteur"].str.replace("_AIact", "")  # remove superfluous trainling description
-rapp_AIgen_q["rapporteur"] = rapp_AIgen_q["rapporteur"].str.replace("_AIgen", "")  # remove superfluous trainling description
+aggregates['mention_cube'].total('overall_total')  # matching worked - matches found
 
-rapp_q_mentions = pd.merge(rapp_q_mentions, rapp_AIact_q, how='outer', on=['newsletter_date', 'rapporteur'])
-rapp_q_mentions = pd.merge(rapp_q_mentions, rapp_AIgen_q, how='outer', on=['newsletter_date', 'rapporteur'])
-del rapp_AIact, rapp_AIgen, rapp_AIact_q_raw, rapp_AIgen_q_raw, rapp_AIact_q, rapp_AIgen_q
-
-# transform to long (one row: time/rapporteur/mention type)
-rapp_q_mentions_long = pd.melt(rapp_q_mentions, id_vars=['newsletter_date', 'rapporteur'],
-                               value_vars=['mentions_overall_total', 'mentions_overall_paragraph',
-                                           'mentions_AIact', 'mentions_AIgen'],
-                               value_name='mentions', var_name='mention_type')
-rapp_q_mentions_long['mention_type'] = rapp_q_mentions_long['mention_type'].str.replace("mentions_", "")  # remove supervluous description
+# roll the daily mention cube up to quarters (one row: time/rapporteur/mention type)
+metrics.start("export_counts")
+rapp_q_mentions_long = aggregates['mention_cube'].rollup("Q", entities=rapp_names)
 
 rapp_q_mentions_long['mentions'].sum()
 rapp_q_mentions_long.groupby(['mention_type'])['mentions'].sum()
 rapp_q_mentions_long.groupby(['rapporteur', 'mention_type'])['mentions'].sum()
 
-rapp_q_mentions_long.to_csv("./data/output_ready/mentions_qrtr_rapp_type.csv")
+# typed, compressed Parquet with a 'quarter' column (read with helpers/parquet_tables.read_table or arrow in R)
+write_table(rapp_q_mentions_long, "./data/output_ready/mentions_qrtr_rapp_type.parquet", quarter_column='newsletter_date',
+            categories=('rapporteur', 'mention_type'))
+
+# co-occurrence per quarter (paragraphs or windows of cooccurrence_window sentences; non-zero counts only)
+write_table(aggregates['cooccurrence']['rapporteur_topic'], "./data/output_ready/cooccurrence_qrtr_rapp_topic.parquet",
+            quarter_column='newsletter_date', categories=('rapporteur', 'topic'))
+write_table(aggregates['cooccurrence']['rapporteur_rapporteur'], "./data/output_ready/cooccurrence_qrtr_rapp_rapp.parquet",
+            quarter_column='newsletter_date', categories=('rapporteur', 'rapporteur_other'))
+
+# daily mention cube for rollups to other periods & rolling windows, e.g.
+#   python -m helpers.mention_cube --per M --entities benifei voss --types AIact
+aggregates['mention_cube'].save("./data/output_ready/mentions_daily_cube")
+metrics.stop("export_counts", rows_out=rapp_q_mentions_long.shape[0])
+
+# inverted index (rapporteur / topic: paragraphs) for local queries, e.g.
+#   python -m helpers.mention_index "benifei AND AIact" --start 2022-07-01 --end 2022-09-30 --per M
+if mention_index_path is not None:
+    metrics.start("export_index", rows_in=aggregates['mention_index'].shape[0])
+    write_mention_index(aggregates['mention_index'], mention_index_path,
+                        term_types={**{entity['id']: entity['type'] for entity in entities},
+                                    **{topic_name: 'topic' for topic_name in topic_colmapper.values()}})
+    metrics.stop("export_index", rows_out=aggregates['mention_index'].shape[0])
+
+# mean word vectors of all parsed paragraphs (keyed by newsletter id & paragraph position) for the topic clusters of
+# 1-retrieval-words.py
+if with_vectors:
+    metrics.start("export_vectors", rows_in=aggregates['paragraph_vectors'].shape[0])
+    save_paragraph_vectors(aggregates['paragraph_vectors'], paragraph_vectors_path)
+    metrics.stop("export_vectors", rows_out=aggregates['paragraph_vectors'].shape[0])
+elif paragraph_vectors_path is not None:  # vectors of an earlier run with another model
+    remove_paragraph_vectors(paragraph_vectors_path)
 
 #%% prepare analysis of non-AI related topics
-newsletter_paragraphs_topic =\
-    newsletter_paragraphs.loc[
-        ((newsletter_paragraphs['matches_rapp'].apply(len) > 0) &
-         (newsletter_paragraphs['matches_topic'].apply(len) < 1)), :]  # keep row with a rapporteur but not AI(act)
 
-newsletter_paragraphs_topic = \
-    newsletter_paragraphs_topic[[i for i in newsletter_paragraphs.columns if
-                                 ('AIact' not in i) and ('AI' not in i) and
-                                 ('paragraph_spacy' not in i) and ('matches_' not in i)]]  # drop unneeded columns
+# paragraphs with a rapporteur but not AI(act), in the order of the file
+metrics.start("export_topics", rows_in=aggregates['topic_paragraphs'].shape[0])
+newsletter_paragraphs_topic = sort_by_newsletter_order(aggregates['topic_paragraphs'], newsletter_order)
+
+# rapporteur-specific data (one row per paragraph and rapporteur mentioned in it)
+date_rapporteur_topics = sort_by_newsletter_order(aggregates['topic_paragraphs_rapp'], newsletter_order)
 
 # create data frame with quarterly documents of paragraphs mentioning rapporteurs (1 line = all par.s in that quarter with non-AI(act) related rapporteur mentions)
 quarterly_overall_topics =\
     newsletter_paragraphs_topic.groupby(newsletter_paragraphs_topic['newsletter_date'].dt.to_period("Q"))['paragraph'].apply('\n'.join).reset_index()
 
-# create rapporteur-specific data
-date_rapporteur_topics = pd.melt(newsletter_paragraphs_topic,
-                                 id_vars=['newsletter_date', 'paragraph'],
-                                 value_vars=[i for i in rapp_colmapper.values()],
-                                 value_name='mentioned', var_name='rapporteur')
-date_rapporteur_topics =\
-    date_rapporteur_topics.loc[date_rapporteur_topics['mentioned']!=0, ['newsletter_date', 'rapporteur', 'paragraph']]
-    # drop date/rapporteurs combinations with 0 mentions of that rapporteur
-
-date_rapporteur_topics['newsletter_date'] = date_rapporteur_topics['newsletter_date'].dt.to_period("Q")  # new column for grouping
-
 quarterly_rapporteur_topics =\
-    date_rapporteur_topics.groupby(['newsletter_date', 'rapporteur'])['paragraph'].apply('\n'.join).reset_index()
+    date_rapporteur_topics.groupby([date_rapporteur_topics['newsletter_date'].dt.to_period("Q"), 'rapporteur'])['paragraph'].apply('\n'.join).reset_index()
 
 # export data
 quarterly_overall_topics['rapporteur'] = 'any one or more'
 quarterly_topics = pd.concat([quarterly_overall_topics, quarterly_rapporteur_topics])
 del quarterly_overall_topics, quarterly_rapporteur_topics
 
-quarterly_topics.to_csv('./data/preprocessed/quarterly-topics.csv')
+write_table(quarterly_topics, './data/preprocessed/quarterly-topics', quarter_column='newsletter_date', partition=True,
+            categories=('rapporteur', ))  # one directory per quarter
+metrics.stop("export_topics", rows_out=quarterly_topics.shape[0])
+
+# parse the non-AI rapporteur paragraphs once with the full pipeline (LEMMA & POS) and export their tokens
+if topic_tokens_path is not None:
+    nlp_full = nlp if matching_mode == 'full' else load_spacy_pipeline(model=spacy_model, mode='full')
+
+    metrics.start("export_topic_tokens", rows_in=newsletter_paragraphs_topic.shape[0])
+    topic_token_store = export_topic_tokens(newsletter_paragraphs_topic, date_rapporteur_topics, nlp_full, topic_tokens_path,
+                                            doc_cache=DocBinCache(nlp_full, cache_dir="./data/cache/docbin"),
+                                            batch_size=pipe_batch_size)
+    metrics.stop("export_topic_tokens", rows_out=topic_token_store.n_tokens)
+
+    if False:  # term extraction as a pipeline component (helpers/term_extraction.py): same terms as on the token store
+        nlp_full.add_pipe("term_extractor", config={'keep_pos': ["NOUN"], 'exclude': ["rapporteur", "politico"]})
+        sample_docs = list(nlp_full.pipe(newsletter_paragraphs_topic['paragraph'].tolist()[:1000], batch_size=pipe_batch_size))
+        [terms_of(doc) for doc in sample_docs] == extract_terms(TokenStore.from_docs(sample_docs), exclude=("rapporteur", "politico"))
+        nlp_full.remove_pipe("term_extractor")
+
+#%% store state for the next incremental run
+
+state['processed_ids'] = state['processed_ids'] | set(newsletter_order)
+state['aggregates'] = aggregates
+
+metrics.start("save_state")
+save_incremental_state(state_path, state)
+metrics.stop("save_state")
+
+#%% run report
+
+dedup: dict = dedup_summary(metrics.stages)
+if dedup is not None:
+    print(f"Paragraph dedup: {dedup['processed']} of {dedup['paragraphs']} paragraphs processed "
+          f"(dedup ratio {dedup['dedup_ratio']:.1%}, about {dedup['estimated_seconds_saved']:.1f}s saved).")
+    metrics.meta['dedup'] = dedup
 
+metrics.summary()
+metrics.write_report(report_path)
@@ -1,23 +1,39 @@
 
 #%% imports
-
-#%pip install bertopic
-from bertopic import BERTopic
-import spacy
-import pandas as pd
-spacy.cli.download("en_core_web_lg")
-nlp = spacy.load('en_core_web_lg')  # load spacy corpus
-
-#%% load topic data
-quarterly_topics: pd.DataFrame = pd.read_csv('./data/preprocessed/quarterly-topics.csv')
-
-quarterly_topics_overall = quarterly_topics.loc[quarterly_topics['rapporteur'] == 'any one or more', :]
-quarterly_topics_rapporteurs = quarterly_topics.loc[quarterly_topics['rapporteur'] != 'any one or more', :]
-
-del quarterly_topics
-
-#%% transform to spaCy-object
-quarterly_topics_overall['paragraph_spacy'] = [doc for doc in nlp.pipe(quarterly_topics_overall['paragraph'].tolist())]  # convert to spacy object
+import os
+
+from helpers.document_term_matrix import bow_corpus, document_term_matrix, gensim_vocabulary, group_rows, top_terms
+from helpers.lda_sweep import local_minima, run_lda_sweep
+from helpers.paragraph_vectors import load_paragraph_vectors, vectors_of
+from helpers.parquet_tables import write_table
+from helpers.run_metrics import RunMetrics
+from helpers.script_settings import apply_overrides
+from helpers.token_store import extract_terms
+from helpers.topic_clusters import TopicClusters, quarterly_cluster_topics
+from helpers.topic_inference import document_topic_matrix, top_topics
+from helpers.topic_tokens import load_topic_tokens, quarterly_token_lists
+
+root_path: str = "./data/output_ready"  # output directory (read by 2-visualize.R)
+topic_tokens_path: str = "./data/preprocessed/topic_tokens"  # tokens of the non-AI rapporteur paragraphs (exported by 0-entity-retrieval_spacy.py)
+paragraph_vectors_path: str = "./data/preprocessed/paragraph_vectors"  # vectors of all paragraphs parsed by 0-entity-retrieval_spacy.py
+read_quarters: list = None  # e.g. ['2022Q1', '2022Q2']: only the paragraphs of these quarters are read & counted; None: all
+lda_sweep_dir: str = "./data/cache/lda_sweep"  # coherence of every trained number of topics (reruns resume)
+lda_n_workers: int = 4  # processes training models of the sweep in parallel
+lda_coarse_step: int = None  # e.g. 5: coarse grid first, then refined around its local minima; None: every number of topics
+lda_model_path: str = "./data/cache/lda_model/lda"  # final LDA model; its document-topic matrix is cached next to it
+report_path: str = "./data/reports/run_words.json"  # per-stage wall/CPU time, peak RSS, rows & docs/sec of this run
+profile_stage: str = None  # e.g. 'parse' or 'lda_sweep': cProfile dump of that stage to ./data/reports/profiles/
+topic_model: bool = True  # False: only the term counts (python cli.py terms); True: also the topics (python cli.py topics)
+topic_method: str = 'lda'  # 'lda': LDA sweep & model; 'clusters': minibatch k-means over the paragraph vectors of stage 0 (model with vectors, e.g. en_core_web_lg)
+cluster_n: int = 10  # number of topic clusters
+cluster_model_path: str = "./data/cache/topic_clusters/kmeans.pkl"  # fitted clusters; later runs only fit paragraphs of new quarters
+apply_overrides(globals())  # settings given on the command line (cli.py); none when run cell by cell
+metrics = RunMetrics(script="1-retrieval-words.py", profile_stage=profile_stage)
+
+#%% load topic data: paragraphs mentioning rapporteurs but not AI(act), parsed in 0-entity-retrieval_spacy.py (no re-parsing)
+metrics.start("read_topic_tokens")
+token_store, topic_paragraphs, topic_paragraph_rapporteurs = load_topic_tokens(topic_tokens_path, quarters=read_quarters)  # token attributes are memory-mapped
+metrics.stop("read_topic_tokens", rows_out=topic_paragraphs.shape[0])
 
 #%% clean text columns with spacy
 del_pos= [# POS tags to remove (all POS tags listed; those to keep commented out from removal list)
@@ -50,145 +66,170 @@ rapp_names_lower = ['solís pérez', 'cutajar', 'kolaja', 'maydell', 'benifei',
 
 exclude_toks = rapp_names_lower + ['datum', 'e', '-', '’s', 'rapporteur', '.&nbsp', 'politico']
 
-tokens_rowwise = []
-for row in nlp.pipe(quarterly_topics_overall['paragraph']):
-  proj_tok = [token.lemma_.lower() for token in row if token.pos_ in keep_pos and token.lower_ not in exclude_toks]
-  #proj_tok = [token.lemma_.lower() for token in row if token.pos_ not in del_pos and token.lower_ not in exclude_toks]
-
-  #for tok in row:
-    #if "datu" in tok.lower_:
-      #print(tok.lower_)
-  
-  # remove tokens according to POS tag and if they're a rapporteur name
-
-  tokens_rowwise.append(proj_tok)
-
-
-# manually clean tokens
-for row in tokens_rowwise:
-  for i in row:
-    if i in exclude_toks:
-      row.remove(i)
-
-quarterly_topics_overall['tokens'] = pd.Series(tokens_rowwise)
+metrics.start("tokens", rows_in=len(token_store))
+# lower-cased lemmas of tokens with a POS tag in keep_pos; tokens or lemmas in exclude_toks (e.g. rapporteur names) are removed
+paragraph_terms: list = extract_terms(token_store, keep_pos=tuple(keep_pos), exclude=tuple(exclude_toks))  # one list per paragraph of the store
+topic_paragraphs['tokens'] = [paragraph_terms[i] for i in topic_paragraphs['paragraph_id']]  # paragraphs read (read_quarters)
+del paragraph_terms
 
-from gensim.corpora.dictionary import Dictionary
-dictionary = Dictionary(quarterly_topics_overall['tokens']) # apply the Dictionary Object from Gensim, which maps each word to their unique ID. To inspect: print(dictionary.token2id)
+# quarterly documents (1 line = all paragraphs of a quarter), built from the paragraph ids
+quarterly_topics_overall = quarterly_token_lists(topic_paragraphs)
+quarterly_topics_overall['rapporteur'] = 'any one or more'
+metrics.stop("tokens", rows_out=quarterly_topics_overall.shape[0])
 
-trykey = 'politico' # '.&nbsp' # 'rapporteur'  # datum
-try:
-  dictionary.token2id[trykey]
-except KeyError:
-  print(f"No dictionary key '{trykey}'. This is desired")
+#%% document-term matrix: paragraphs x terms (one pass); quarters & rapporteurs are sparse row-group sums of it
+metrics.start("document_term_matrix", rows_in=len(token_store))
+dtm, vocabulary = document_term_matrix(token_store, keep_pos=tuple(keep_pos), exclude=tuple(exclude_toks))
 
-dictionary.filter_extremes(no_below=5, no_above=0.5, keep_n=1000) # filter out low-frequency tokens (must appear in at least 5 documents, i.e. paragraphs) and high-frequency tokens (cannot appear in more than 50% of documens), also limit the vocabulary to a max of 1000 words:
-
-corpus = [dictionary.doc2bow(doc) for doc in quarterly_topics_overall['tokens']]  # construct corpus using dictionary & doc2bow function (which counts each word's occurrences, converts word to its int id and returns the result as a sparse vector)
+dtm_quarters, quarters = group_rows(dtm, topic_paragraphs['newsletter_date'].dt.to_period("Q"),
+                                    rows=topic_paragraphs['paragraph_id'])  # rows: quarterly_topics_overall
+dtm_rapporteurs, rapporteurs = group_rows(dtm, topic_paragraph_rapporteurs['rapporteur'],
+                                          rows=topic_paragraph_rapporteurs['paragraph_id'])  # a paragraph counts for each rapporteur in it
+metrics.stop("document_term_matrix", rows_out=dtm.shape[1])
 
 #%% Return most frequent words overall
+metrics.start("term_counts", rows_in=dtm.shape[0])
 quarterly_topics_overall['tokens'] = [' '.join(map(str, l)) for l in quarterly_topics_overall['tokens']]
 
-from collections import Counter
-
-term_counts = pd.DataFrame(Counter(" ".join(quarterly_topics_overall["tokens"]).split()).most_common(1000), columns=['term', 'counts'])
-
-term_counts.to_csv(root_path + '/_term_counts_overall.csv')
-
-#%% Return most frequent word by rapporteur
-
-tokens_rowwise = []
-for row in nlp.pipe(quarterly_topics_rapporteurs['paragraph']):
-  proj_tok = [token.lemma_.lower() for token in row if token.pos_ in keep_pos and token.lower_ not in exclude_toks]
-  #proj_tok = [token.lemma_.lower() for token in row if token.pos_ not in del_pos and token.lower_ not in exclude_toks]
-
-  #for tok in row:
-    #if "datu" in tok.lower_:
-      #print(tok.lower_)
-  
-  # remove tokens according to POS tag and if they're a rapporteur name
-
-  tokens_rowwise.append(proj_tok)
-
-
-# manually clean tokens
-for row in tokens_rowwise:
-  for i in row:
-    if i in exclude_toks:
-      row.remove(i)
-
-quarterly_topics_rapporteurs['tokens'] = pd.Series(tokens_rowwise)
-
-quarterly_topics_rapporteurs_exploded=quarterly_topics_rapporteurs.explode('tokens').groupby('rapporteur')['tokens'].value_counts()  #Explode and count
-
-top_terms_rapporteurs = pd.DataFrame(quarterly_topics_rapporteurs_exploded).rename(columns = {'tokens': 'count'}).reset_index().rename(columns={'tokens':'token'})
-
-
-top_term_raps = top_terms_rapporteurs.loc[top_terms_rapporteurs.reset_index().groupby(['rapporteur'])['count'].idxmax(), :]  # what is the top term for each rapporteur?
-top_term_raps.to_csv(root_path + '/_top_terms_rapporteurs.csv')
-
-
-#%% topic models (LDA) model building
-
-from gensim.models import LdaMulticore
-# lda_model = LdaMulticore(corpus=corpus, id2word=dictionary, iterations=50, num_topics=10, workers = 4, passes=10)  # alternative: gensim.models.ldamodel.LdaModel
-
-import matplotlib.pyplot as plt
-from gensim.models import CoherenceModel
-import warnings
-
-warnings.filterwarnings("ignore", category=DeprecationWarning)
-
-# inspect topic coherence across topic numbers
-
-# performance based on https://www.baeldung.com/cs/topic-modeling-coherence-score
-# 1) 'u_mass' scores (negative numbers; higher absolute numbers are better)
-topics = []
-score = []
-
-for i in range(1, 55, 1):
-    lda_model = LdaMulticore(corpus=corpus, id2word=dictionary, iterations=10, num_topics=i, workers=4, passes=10,
-                             random_state=100)
-    cm = CoherenceModel(model=lda_model, corpus=corpus, dictionary=dictionary, coherence='u_mass')
-    topics.append(i)
-    score.append(cm.get_coherence())
-
-_ = plt.plot(topics, score)
-_ = plt.xlabel('Number of Topics')
-_ = plt.ylabel('UMass Coherence Score (lower is better)')
-plt.show()
-
-print("1st local minimum:", dict(zip(score[:10], topics[:10]))[min(score[:10])])  # 1st local minimum
-print("2nd local minimum:", dict(zip(score[10:20], topics[10:20]))[min(score[10:20])])  # 2nd local minimum
-print("2nd local minimum:", dict(zip(score[20:30], topics[20:30]))[min(score[20:30])])  # 2nd local minimum
-print("2nd local minimum:", dict(zip(score[30:40], topics[30:40]))[min(score[30:40])])  # 2nd local minimum
-print("Overall minimum in measured area:", dict(zip(score, topics))[min(score)])  # minimum at 49 topics
-# dict(zip(topics, score))
-
-topic_n = 10  # ..
-
-lda_model = LdaMulticore(corpus=corpus, id2word=dictionary, iterations=100, num_topics=topic_n, workers=4, passes=100)
-
-# %% print and visualize topics
-
-# lda_model.print_topics(-1)  # print all topics
-# print one document
-# quarterly_topics['paragraph'][0]  # first document
-# lda_model[corpus][0]  # belongs to topic 38 (index 37)
+term_counts = top_terms(dtm[topic_paragraphs['paragraph_id'].to_numpy()].sum(axis=0), vocabulary, k=1000)  # columns 'term', 'counts'
 
-# visualize the topics and the words in each topic
-# %pip install pyLDAvis -qq
-import pyLDAvis.gensim_models
+write_table(term_counts, root_path + '/_term_counts_overall.parquet')
+metrics.stop("term_counts", rows_out=term_counts.shape[0])
+
+#%% Return most frequent word by rapporteur and quarter
+
+metrics.start("top_terms_rapporteurs", rows_in=dtm_rapporteurs.shape[0])
 
-pyLDAvis.enable_notebook()  # visualise inside a notebook
+top_term_raps = top_terms(dtm_rapporteurs, vocabulary, k=1, labels=rapporteurs)\
+    .rename(columns={'group': 'rapporteur', 'term': 'token', 'counts': 'count'})  # what is the top term for each rapporteur?
+write_table(top_term_raps, root_path + '/_top_terms_rapporteurs.parquet', categories=('rapporteur', ))
 
-lda_display = pyLDAvis.gensim_models.prepare(lda_model, corpus, dictionary)
-pyLDAvis.display(lda_display)
+top_terms_quarters = top_terms(dtm_quarters, vocabulary, k=10, labels=quarters)\
+    .rename(columns={'group': 'newsletter_date'})  # top 10 terms per quarter
+write_table(top_terms_quarters, root_path + '/_top_terms_quarters.parquet', quarter_column='newsletter_date')
+metrics.stop("top_terms_rapporteurs", rows_out=top_term_raps.shape[0])
 
-# add topics to df
-quarterly_topics_overall['topic'] = [" ".join(["topic", str(sorted(lda_model[corpus][text])[0][0])]) for text in
-                                     range(len(quarterly_topics_overall['paragraph']))]
-# quarterly_topics['topic'].value_counts()
 
-pyLDAvis.save_html(lda_display, root_path + '/_topics.html')
-quarterly_topics_overall.to_csv(root_path + '/_quarterly-topics_overall_LDA.csv')
+#%% topic clusters: paragraph vectors (memory-mapped, looked up by newsletter id & paragraph position) clustered by minibatch k-means
+if topic_model and topic_method == 'clusters':
+    stored_vectors = load_paragraph_vectors(paragraph_vectors_path)
+    if stored_vectors is None:
+        raise ValueError(f"No paragraph vectors in {paragraph_vectors_path}; run stage 0 with a model with word vectors (e.g. en_core_web_lg).")
+    vector_keys, paragraph_vectors = stored_vectors
 
+    metrics.start("cluster_fit", rows_in=topic_paragraphs.shape[0])
+    topic_clusters = TopicClusters.load(cluster_model_path, n_clusters=cluster_n, dimensions=paragraph_vectors.shape[1])\
+        or TopicClusters(n_clusters=cluster_n)
+    paragraph_quarters = topic_paragraphs['newsletter_date'].dt.to_period("Q")
+    vectors_read = vectors_of(topic_paragraphs, vector_keys, paragraph_vectors)  # rows of topic_paragraphs (read_quarters)
+    new_quarters = topic_clusters.fit_quarters(vectors_read, paragraph_quarters)
+    topic_clusters.save(cluster_model_path)
+    metrics.stop("cluster_fit", rows_out=len(new_quarters))
+    print(f"Fitted the topic clusters on {len(new_quarters)} new quarters ({len(topic_clusters.fitted_quarters)} in total).")
+
+    metrics.start("assign_topics", rows_in=topic_paragraphs.shape[0])
+    cluster_labels, cluster_similarity = topic_clusters.predict(vectors_read)
+    quarterly_topics_overall = quarterly_topics_overall.drop(columns=['topic', 'topic_probability'], errors='ignore')\
+        .merge(quarterly_cluster_topics(cluster_labels, paragraph_quarters), how='left', on='newsletter_date')
+
+    # describe every cluster by its most frequent terms
+    dtm_clusters, clusters = group_rows(dtm, cluster_labels[cluster_labels >= 0],
+                                        rows=topic_paragraphs['paragraph_id'].to_numpy()[cluster_labels >= 0])
+    cluster_terms = top_terms(dtm_clusters, vocabulary, k=10, labels=["topic " + str(i) for i in clusters])\
+        .rename(columns={'group': 'topic'})
+    metrics.stop("assign_topics", rows_out=quarterly_topics_overall.shape[0])
+
+    metrics.start("export_topics")
+    write_table(cluster_terms, root_path + '/_cluster_terms.parquet', categories=('topic', ))
+    write_table(quarterly_topics_overall, root_path + '/_quarterly-topics_overall_clusters', quarter_column='newsletter_date',
+                partition=True, categories=('rapporteur', 'topic'))
+    metrics.stop("export_topics")
+
+#%% topic models (LDA) model building (skipped if topic_model is False)
+if topic_model and topic_method == 'lda':
+    from gensim.corpora.dictionary import Dictionary
+    metrics.start("corpus", rows_in=dtm_quarters.shape[0])
+
+    trykey = 'politico' # '.&nbsp' # 'rapporteur'  # datum
+    if trykey not in set(vocabulary):
+      print(f"No dictionary key '{trykey}'. This is desired")
+
+    # filter out low-frequency tokens (must appear in at least 5 documents, i.e. quarters) and high-frequency tokens (cannot appear in more than 50% of documens), also limit the vocabulary to a max of 1000 words (as Dictionary.filter_extremes)
+    vocabulary_lda = gensim_vocabulary(dtm_quarters, vocabulary, no_below=5, no_above=0.5, keep_n=1000)
+
+    corpus = bow_corpus(dtm_quarters, vocabulary_lda)  # one sparse vector (word id, count) per quarter, as dictionary.doc2bow
+    dictionary = Dictionary.from_corpus(corpus, id2word=dict(enumerate(vocabulary[vocabulary_lda])))  # maps each word to its id
+    metrics.stop("corpus", rows_out=len(dictionary))
+
+    from gensim.models import LdaMulticore
+    # lda_model = LdaMulticore(corpus=corpus, id2word=dictionary, iterations=50, num_topics=10, workers = 4, passes=10)  # alternative: gensim.models.ldamodel.LdaModel
+
+    import matplotlib.pyplot as plt
+    import warnings
+
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    # inspect topic coherence across topic numbers
+
+    # performance based on https://www.baeldung.com/cs/topic-modeling-coherence-score
+    # 1) 'u_mass' scores (negative numbers; higher absolute numbers are better)
+    metrics.start("lda_sweep", rows_in=len(corpus))
+    lda_sweep = run_lda_sweep(corpus, dictionary, sweep_dir=lda_sweep_dir, topic_range=(1, 54), coarse_step=lda_coarse_step,
+                              n_workers=lda_n_workers, lda_kwargs={'iterations': 10, 'passes': 10, 'random_state': 100})
+    topics = lda_sweep['num_topics'].tolist()
+    score = lda_sweep['coherence'].tolist()
+    metrics.stop("lda_sweep", rows_out=len(topics))
+
+    _ = plt.plot(topics, score)
+    _ = plt.xlabel('Number of Topics')
+    _ = plt.ylabel('UMass Coherence Score (lower is better)')
+    plt.show()
+
+    print("Local minima:", local_minima(lda_sweep))
+    print("Overall minimum in measured area:", dict(zip(score, topics))[min(score)])  # minimum at 49 topics
+    # dict(zip(topics, score))
+
+    topic_n = 10  # ..
+
+    metrics.start("lda_final", rows_in=len(corpus))
+    lda_model = LdaMulticore(corpus=corpus, id2word=dictionary, iterations=100, num_topics=topic_n, workers=4, passes=100)
+    os.makedirs(os.path.dirname(lda_model_path), exist_ok=True)
+    lda_model.save(lda_model_path)
+    metrics.stop("lda_final")
+
+    # print and visualize topics
+
+    # lda_model.print_topics(-1)  # print all topics
+    # print one document
+    # quarterly_topics['paragraph'][0]  # first document
+    # document_topic_matrix(lda_model, corpus, cache_path=lda_model_path)[0]  # topic distribution of the first document
+
+    # visualize the topics and the words in each topic
+    # %pip install pyLDAvis -qq
+    import pyLDAvis.gensim_models
+
+    pyLDAvis.enable_notebook()  # visualise inside a notebook
+
+    lda_display = pyLDAvis.gensim_models.prepare(lda_model, corpus, dictionary)
+    pyLDAvis.display(lda_display)
+
+    # add topics to df
+    metrics.start("assign_topics", rows_in=quarterly_topics_overall.shape[0])
+    # topic distributions of all documents in one pass (cached next to the model); each document gets its most probable topic
+    doc_topics = document_topic_matrix(lda_model, corpus, cache_path=lda_model_path)
+    topic_ids, topic_probabilities = top_topics(doc_topics, k=1)
+    quarterly_topics_overall['topic'] = ["topic " + str(i) for i in topic_ids[:, 0]]
+    quarterly_topics_overall['topic_probability'] = topic_probabilities[:, 0]
+    metrics.stop("assign_topics", rows_out=quarterly_topics_overall.shape[0])
+    # quarterly_topics['topic'].value_counts()
+
+    metrics.start("export_topics")
+    pyLDAvis.save_html(lda_display, root_path + '/_topics.html')
+    write_table(quarterly_topics_overall, root_path + '/_quarterly-topics_overall_LDA', quarter_column='newsletter_date',
+                partition=True, categories=('rapporteur', 'topic'))
+    metrics.stop("export_topics")
+
+#%% run report
+
+metrics.summary()
+metrics.write_report(report_path)
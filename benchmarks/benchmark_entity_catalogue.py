@@ -0,0 +1,114 @@
+"""
+    This file: benchmark the entity matching for growing entity catalogues (see helpers/entity_catalogue.py)
+        the rapporteurs of the AI act are padded with synthetic entities (1 to 3 aliases of 1 to 3 tokens each) up to
+        every size in --sizes; the same synthetic paragraphs (see synthetic_newsletters.py) are matched with
+            phrase_token_store:  TokenStorePhraseMatcher (engine 'token_store')
+            phrase_spacy:        PhraseMatcher (engine 'spacy')
+            rules_token_store:   one TokenStoreMatcher rule per alias (the previous approach; only up to --rules-max)
+        per size, the time to tokenize the aliases (compile) and to load them from the cache (load_cached) are
+        measured as well; the phrase matchers should match about as many paragraphs per second for every size
+    usage (from the repository root):
+        python -m benchmarks.benchmark_entity_catalogue --model blank --sizes 18 100 1000 10000 --output bench_entities.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+
+import pandas as pd
+import spacy
+
+from benchmarks.benchmark_stages import _git_revision, measure
+from benchmarks.synthetic_newsletters import generate_newsletters, rapporteurs_default
+from helpers.entity_catalogue import build_matcher, build_phrase_matcher, compile_entity_phrases
+from helpers.load_spacy_pipeline import load_spacy_pipeline
+from helpers.token_store import TokenStore
+from helpers.tokenize_df_explode import tokenize_df_explode
+
+_syllables: list = ["ka", "lo", "mer", "van", "de", "stra", "ni", "o", "ber", "tu", "za", "qui", "ros", "elle", "gor", "ix"]
+
+
+def synthetic_entities(n_entities: int, seed: int = 42):
+    """ Returns a catalogue of n_entities entities: the AI act rapporteurs followed by synthetic entities """
+    rng = random.Random(seed)
+    entities: list = [{'id': rapp.replace(" ", "_"), 'name': rapp, 'type': 'rapporteur', 'aliases': [rapp]}
+                      for rapp in rapporteurs_default]
+
+    while len(entities) < n_entities:
+        aliases: list = [" ".join("".join(rng.choices(_syllables, k=rng.randint(2, 4))) for _ in range(rng.randint(1, 3)))
+                         for _ in range(rng.randint(1, 3))]
+        entities.append({'id': f"entity_{len(entities)}", 'name': aliases[0], 'type': rng.choice(['mep', 'company']),
+                         'aliases': aliases})
+
+    return entities[:n_entities]
+
+
+def run_benchmarks(sizes: list, n_newsletters: int, model: str, repeat: int, rules_max: int, seed: int):
+    """ Generates the corpus and measures compiling & matching for every catalogue size. Returns the stage records """
+    newsletters = pd.DataFrame(generate_newsletters(n_newsletters=n_newsletters, seed=seed)).set_index('id')[['date', 'text']]
+    texts: list = tokenize_df_explode(newsletters, split_on="new_line", textcol_in="text", textcol_out="paragraph")['paragraph'].tolist()
+
+    nlp = spacy.blank("en") if model == "blank" else load_spacy_pipeline(model=model, mode="tokenizer")
+    docs: list = list(nlp.pipe(texts, batch_size=1000))
+    store = TokenStore.from_docs(docs, attrs=("LOWER", ))
+    cache_dir: str = tempfile.mkdtemp(prefix="entity_matcher_")
+
+    records: list = []
+    try:
+        for size in sizes:
+            entities: list = synthetic_entities(size, seed=seed)
+            print(f"--- {size} entities ({sum(len(i['aliases']) for i in entities)} aliases)")
+
+            phrases, record = measure(f"compile_{size}", lambda: compile_entity_phrases(entities, nlp, cache_dir=None),
+                                      repeat=repeat, rows_in=size)
+            records.append(record)
+            compile_entity_phrases(entities, nlp, cache_dir=cache_dir)  # fill the cache
+            _, record = measure(f"load_cached_{size}", lambda: compile_entity_phrases(entities, nlp, cache_dir=cache_dir),
+                                repeat=repeat, rows_in=size)
+            records.append(record)
+
+            matcher = build_phrase_matcher(nlp.vocab, phrases, engine="token_store")
+            _, record = measure(f"phrase_token_store_{size}", lambda: matcher(store), repeat=repeat, rows_in=len(docs))
+            records.append(record)
+
+            phrase_matcher = build_phrase_matcher(nlp.vocab, phrases, engine="spacy")
+            _, record = measure(f"phrase_spacy_{size}", lambda: [phrase_matcher(doc) for doc in docs], repeat=repeat,
+                                rows_in=len(docs))
+            records.append(record)
+
+            if size <= rules_max:
+                rules = build_matcher(nlp.vocab, {match_id: [[{'LOWER': i} for i in phrase] for phrase in phrs]
+                                                  for match_id, phrs in phrases.items()}, engine="token_store")
+                _, record = measure(f"rules_token_store_{size}", lambda: rules(store), repeat=repeat, rows_in=len(docs))
+                records.append(record)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark entity matching for growing entity catalogues.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[18, 100, 1000, 10000])
+    parser.add_argument("--n-newsletters", type=int, default=200)
+    parser.add_argument("--model", default="en_core_web_lg", help="spaCy model name or path; 'blank' for a blank English tokenizer")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rules-max", type=int, default=1000, help="largest catalogue matched with one rule per alias")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_entities.json")
+    args = parser.parse_args()
+
+    results: dict = {'meta': {'git_revision': _git_revision(), 'timestamp': pd.Timestamp.now().isoformat(),
+                              'python': platform.python_version(), 'spacy': spacy.__version__, 'model': args.model,
+                              'n_newsletters': args.n_newsletters, 'sizes': args.sizes, 'repeat': args.repeat,
+                              'seed': args.seed},
+                     'stages': run_benchmarks(args.sizes, args.n_newsletters, args.model, args.repeat, args.rules_max,
+                                              args.seed)}
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {os.path.abspath(args.output)}.")
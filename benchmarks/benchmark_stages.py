@@ -0,0 +1,266 @@
+"""
+    This file: benchmark every stage of the pipeline on its own, on a synthetic corpus (see synthetic_newsletters.py)
+        stages
+            split:             tokenize_df_explode (newsletters -> paragraphs)
+            parse:             nlp.pipe (paragraphs -> spaCy objects)
+            match_topic:       topic matcher (AI act & AI), engine 'spacy' (Matcher per Doc)
+            match_rapp:        rapporteur phrase matcher (see helpers/entity_catalogue.py), engine 'spacy'
+            token_store:       TokenStore.from_docs (token attributes of all Docs; needed by the 'token_store' engine)
+            match_topic_store: topic matcher, engine 'token_store' (TokenStoreMatcher; default of the pipeline)
+            match_rapp_store:  rapporteur phrase matcher, engine 'token_store' (TokenStorePhraseMatcher; default)
+            count_tup:         count_tup_first_values per paragraph & join (previous aggregation)
+            sparse_matrix:     sparse_match_matrix (current aggregation)
+            quarterly:         quarterly counts, non-AI paragraphs & long format (as in 0-entity-retrieval_spacy.py)
+            term_counter:      Counter / explode / value_counts term counts (previous term counting)
+            term_counts:       document-term matrix, rapporteur row sums & top terms (as in 1-retrieval-words.py)
+        for every stage the wall time (best of --repeat runs), the peak memory allocated by Python (tracemalloc) and the
+        number of rows in & out are written to a JSON file; --compare reports the change against an earlier result file
+    usage (from the repository root):
+        python -m benchmarks.benchmark_stages --n-newsletters 500 --model blank --output bench.json
+        python -m benchmarks.benchmark_stages --n-newsletters 500 --model blank --compare bench.json --fail-above 1.25
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import timeit
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import spacy
+from spacy.parts_of_speech import IDS as POS_IDS
+
+from benchmarks.synthetic_newsletters import generate_newsletters, rapporteurs_default
+from helpers.count_tup_first_values import count_tup_first_values
+from helpers.document_term_matrix import document_term_matrix, group_rows, top_terms
+from helpers.entity_catalogue import build_matcher, build_phrase_matcher
+from helpers.load_spacy_pipeline import load_spacy_pipeline
+from helpers.quarterly_aggregates import partial_quarterly_aggregates
+from helpers.sparse_match_matrix import binarize_sparse, sparse_match_matrix
+from helpers.token_store import TokenStore
+from helpers.tokenize_df_explode import tokenize_df_explode
+
+topic_patterns: dict = {100: [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act', 'OP': '!'}],
+                              [{'LOWER': 'ai'}, {'LOWER': 'act', 'OP': '!'}]],
+                        101: [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act'}],
+                              [{'LOWER': 'ai'}, {'LOWER': 'act'}]]}
+topic_colmapper: dict = {100: "AIgen", 101: "AIact"}
+
+
+def _n_rows(result):
+    """ Returns the number of rows of a stage result (data frame, sparse matrix or list) """
+    if hasattr(result, "shape"):
+        return int(result.shape[0])
+    return len(result) if hasattr(result, "__len__") else None
+
+
+def measure(stage: str, func, repeat: int = 3, rows_in: int = None):
+    """ Runs func() 'repeat' times and once more under tracemalloc. Returns (result of func, record of the stage)
+    :param stage: str
+    :param func: callable without arguments
+    :param repeat: int
+    :param rows_in: int; number of input rows of the stage
+    :return: tuple
+    """
+    durations: list = []
+    for _ in range(repeat):
+        starttime = timeit.default_timer()
+        result = func()
+        durations.append(timeit.default_timer() - starttime)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rows_out = _n_rows(result[0] if isinstance(result, tuple) else result)
+    record: dict = {'stage': stage, 'seconds': min(durations), 'seconds_all': durations,
+                    'peak_mb': peak / 1024 ** 2, 'rows_in': rows_in, 'rows_out': rows_out,
+                    'rows_per_second': rows_in / min(durations) if rows_in and min(durations) > 0 else None}
+
+    print(f"{stage:<18} {record['seconds']:9.3f} s {record['peak_mb']:9.1f} MB  rows in: {rows_in}, rows out: {rows_out}")
+
+    return result, record
+
+
+def term_counter(tokens: pd.Series, rapporteurs: pd.Series):
+    """ Previous term counting of 1-retrieval-words.py (Counter, explode & value_counts): top 1000 terms overall &
+        the top term per rapporteur """
+    overall = pd.DataFrame(Counter(" ".join(tokens.apply(" ".join)).split()).most_common(1000), columns=['term', 'counts'])
+
+    exploded = pd.DataFrame({'rapporteur': rapporteurs, 'tokens': tokens})\
+        .explode('tokens').groupby('rapporteur')['tokens'].value_counts()
+    top_terms = pd.DataFrame(exploded).rename(columns={'tokens': 'count'}).reset_index().rename(columns={'tokens': 'token'})
+    top_term_raps = top_terms.loc[top_terms.groupby(['rapporteur'])['count'].idxmax(), :]
+
+    return overall, top_term_raps
+
+
+def term_counts(store: TokenStore, paragraph_pos: np.ndarray, rapporteurs: np.ndarray, attr: str = "LEMMA"):
+    """ Term counting as in 1-retrieval-words.py: document-term matrix of the store, top 1000 terms overall & the top
+        term per rapporteur (rapporteur rows: sums of the rows at paragraph_pos) """
+    dtm, vocabulary = document_term_matrix(store, keep_pos=("NOUN", ), attr=attr)
+    overall = top_terms(dtm.sum(axis=0), vocabulary, k=1000)
+    dtm_rapporteurs, labels = group_rows(dtm, rapporteurs, rows=paragraph_pos)  # a paragraph counts for each rapporteur
+    top_term_raps = top_terms(dtm_rapporteurs, vocabulary, k=1, labels=labels)
+
+    return overall, top_term_raps
+
+
+def run_benchmarks(n_newsletters: int, paragraphs: tuple, model: str, mode: str, repeat: int, seed: int):
+    """ Generates the corpus and measures all stages. Returns the list of stage records """
+    newsletters = pd.DataFrame(generate_newsletters(n_newsletters=n_newsletters, paragraphs=paragraphs, seed=seed))
+    newsletters = newsletters.set_index('id')[['date', 'text']]
+
+    nlp = spacy.blank("en") if model == "blank" else load_spacy_pipeline(model=model, mode=mode)
+
+    rapp_phrases: dict = {1001 + pos: [rapp.split()] for pos, rapp in enumerate(rapporteurs_default)}
+    rapp_values: tuple = tuple(rapp_phrases.keys())
+    rapp_names: list = [rapp.replace(" ", "_") for rapp in rapporteurs_default]
+    matcher_topic = build_matcher(nlp.vocab, topic_patterns)
+    matcher_rapps = build_phrase_matcher(nlp.vocab, rapp_phrases)
+
+    records: list = []
+
+    paragraphs_df, record = measure("split", lambda: tokenize_df_explode(newsletters, split_on="new_line", textcol_in="text",
+                                                                        textcol_out="paragraph"),
+                                    repeat=repeat, rows_in=newsletters.shape[0])
+    records.append(record)
+    texts: list = paragraphs_df['paragraph'].tolist()
+
+    docs, record = measure("parse", lambda: list(nlp.pipe(texts, batch_size=1000)), repeat=repeat, rows_in=len(texts))
+    records.append(record)
+
+    matches_topic, record = measure("match_topic", lambda: [matcher_topic(doc) for doc in docs], repeat=repeat,
+                                    rows_in=len(docs))
+    records.append(record)
+
+    matches_rapp, record = measure("match_rapp", lambda: [matcher_rapps(doc) for doc in docs], repeat=repeat,
+                                   rows_in=len(docs))
+    records.append(record)
+
+    # engine 'token_store' (default of 0-entity-retrieval_spacy.py): the matchers run on the token attributes
+    matcher_topic_store = build_matcher(nlp.vocab, topic_patterns, engine="token_store")
+    matcher_rapps_store = build_phrase_matcher(nlp.vocab, rapp_phrases, engine="token_store")
+    store_attrs: tuple = tuple(sorted(matcher_topic_store.attrs() | matcher_rapps_store.attrs()))
+
+    store, record = measure("token_store", lambda: TokenStore.from_docs(docs, attrs=store_attrs), repeat=repeat,
+                            rows_in=len(docs))
+    record['rows_out'] = len(store)
+    records.append(record)
+
+    for stage, matcher, matches in [("match_topic_store", matcher_topic_store, matches_topic),
+                                    ("match_rapp_store", matcher_rapps_store, matches_rapp)]:
+        matches_store, record = measure(stage, lambda: matcher(store), repeat=repeat, rows_in=len(docs))
+        records.append(record)
+        if [sorted(i) for i in matches_store] != [sorted(i) for i in matches]:
+            print(f"{stage}: the matches differ from those of the spaCy engine.")
+
+    matches_rapp_series = pd.Series(matches_rapp)
+    _, record = measure("count_tup", lambda: paragraphs_df.join(matches_rapp_series.apply(count_tup_first_values,
+                                                                                          args=(rapp_values, ))),
+                        repeat=repeat, rows_in=len(docs))
+    records.append(record)
+
+    _, record = measure("sparse_matrix", lambda: sparse_match_matrix(matches_rapp, rapp_values), repeat=repeat,
+                        rows_in=len(docs))
+    records.append(record)
+
+    matched = pd.DataFrame({'newsletter_id': paragraphs_df['old_id'],
+                            'paragraph_pos': paragraphs_df.groupby('old_id').cumcount(),
+                            'newsletter_date': pd.to_datetime(paragraphs_df['date']),
+                            'paragraph': paragraphs_df['paragraph'],
+                            'matches_topic': matches_topic, 'matches_rapp': matches_rapp})
+
+    def quarterly():
+        aggregates = partial_quarterly_aggregates(matched, tuple(topic_colmapper.keys()), topic_colmapper, rapp_values, rapp_names)
+        return aggregates['mention_cube'].rollup("Q", entities=rapp_names), aggregates
+
+    (_, aggregates), record = measure("quarterly", quarterly, repeat=repeat, rows_in=len(docs))
+    records.append(record)
+
+    # previous term counting: lower-cased words of the non-AI rapporteur paragraphs stand in for the noun lemmas
+    topic_paragraphs_rapp = aggregates['topic_paragraphs_rapp']
+    tokens = topic_paragraphs_rapp['paragraph'].str.lower().str.findall(r"[a-z]+")
+    _, record = measure("term_counter", lambda: term_counter(tokens, topic_paragraphs_rapp['rapporteur']),
+                        repeat=repeat, rows_in=len(tokens))
+    records.append(record)
+
+    # current term counting on the token attributes of the non-AI rapporteur paragraphs (as exported by stage 0);
+    # without a tagger (blank model, tokenizer mode) alphabetic tokens stand in for nouns and LOWER for the lemma
+    topic_rows = np.flatnonzero(((matched['matches_rapp'].apply(len) > 0) & (matched['matches_topic'].apply(len) < 1)).to_numpy())
+    topic_store = TokenStore.from_docs([docs[i] for i in topic_rows], attrs=("LOWER", "LEMMA", "POS", "IS_ALPHA"))
+    term_attr: str = "LEMMA"
+    if not topic_store.columns["POS"].any():
+        topic_store.columns["POS"] = np.where(topic_store.columns["IS_ALPHA"] > 0, POS_IDS["NOUN"], 0).astype(np.uint16)
+        term_attr = "LOWER"
+    paragraph_pos, rapp_pos = binarize_sparse(sparse_match_matrix(matched['matches_rapp'].iloc[topic_rows], rapp_values)).nonzero()
+    rapporteurs = np.asarray(rapp_names, dtype=object)[rapp_pos]
+    _, record = measure("term_counts", lambda: term_counts(topic_store, paragraph_pos, rapporteurs, attr=term_attr),
+                        repeat=repeat, rows_in=len(topic_store))
+    records.append(record)
+
+    return records
+
+
+def _git_revision():
+    """ Returns the current git revision (or None outside a git checkout) """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current: dict, previous: dict, fail_above: float = None):
+    """ Prints the ratio current/previous of the wall time of every stage; returns the stages slower than fail_above """
+    previous_seconds: dict = {i['stage']: i['seconds'] for i in previous['stages']}
+    regressions: list = []
+
+    print(f"Comparison against {previous['meta'].get('git_revision')} ({previous['meta'].get('timestamp')}):")
+    for record in current['stages']:
+        if record['stage'] not in previous_seconds or previous_seconds[record['stage']] == 0:
+            continue
+        ratio = record['seconds'] / previous_seconds[record['stage']]
+        flag = " <== slower" if fail_above is not None and ratio > fail_above else ""
+        print(f"{record['stage']:<18} {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(record['stage'])
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on a synthetic newsletter corpus.")
+    parser.add_argument("--n-newsletters", type=int, default=500)
+    parser.add_argument("--min-paragraphs", type=int, default=20)
+    parser.add_argument("--max-paragraphs", type=int, default=120)
+    parser.add_argument("--model", default="en_core_web_lg", help="spaCy model name or path; 'blank' for a blank English tokenizer")
+    parser.add_argument("--mode", default="tokenizer", choices=["tokenizer", "full"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    parser.add_argument("--fail-above", type=float, default=None, help="exit with 1 if a stage is slower by this factor")
+    args = parser.parse_args()
+
+    results: dict = {'meta': {'git_revision': _git_revision(), 'timestamp': pd.Timestamp.now().isoformat(),
+                              'python': platform.python_version(), 'spacy': spacy.__version__, 'pandas': pd.__version__,
+                              'model': args.model, 'mode': args.mode, 'n_newsletters': args.n_newsletters,
+                              'paragraphs': [args.min_paragraphs, args.max_paragraphs], 'repeat': args.repeat,
+                              'seed': args.seed},
+                     'stages': run_benchmarks(args.n_newsletters, (args.min_paragraphs, args.max_paragraphs),
+                                              args.model, args.mode, args.repeat, args.seed)}
+
+    regressions: list = []
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            regressions = compare_results(results, json.load(f), fail_above=args.fail_above)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if regressions:
+        raise SystemExit(1)
@@ -0,0 +1,149 @@
+"""
+    This file: generate a synthetic, newsletter-shaped corpus for benchmarks (the real data is not part of the repository)
+        every newsletter is a record {'id', 'date', 'title', 'text'} like in ./data/raw/Newsletters - Morning tech.json;
+        its text consists of paragraphs separated by line breaks (and occasional empty lines);
+        the share of paragraphs mentioning a rapporteur, AI or the AI act is configurable
+    usage (from the repository root):
+        python -m benchmarks.synthetic_newsletters --n-newsletters 2000 --output ./data/raw/synthetic.json
+"""
+
+import argparse
+import datetime as dt
+import json
+import random
+
+rapporteurs_default: list = ['solís pérez', 'cutajar', 'kolaja', 'maydell', 'benifei', 'tudorache', 'voss', 'clune',
+                             'hahn', 'van sparrentak', 'lacapelle', 'otowski', 'konečná', 'vitanov', 'lagodinsky',
+                             'rooken', 'madison', 'ernst']
+
+_vocabulary: list = ("the commission parliament council said data rules platform market privacy regulation digital "
+                     "services act vote committee member state company tech tax competition chip cloud security "
+                     "cyber network telecom spectrum content moderation online child safety proposal draft report "
+                     "negotiation deal industry lobby group official minister week today tomorrow meeting").split()
+
+_ai_mentions: list = ["AI", "artificial intelligence", "Artificial Intelligence", "A.I. systems", "AI tools"]
+_aiact_mentions: list = ["AI act", "AI Act", "artificial intelligence act", "Artificial Intelligence Act"]
+
+
+def _name_variant(name: str, rng: random.Random):
+    """ Returns a surface form of a rapporteur name as it could appear in a newsletter """
+    variant = rng.choice([name.title(), name.upper(), " ".join(i.capitalize() for i in name.split())])
+    return variant + rng.choice(["", "", "", "'s", ","])
+
+
+def generate_paragraph(rng: random.Random, rapporteurs: list, rapporteur_density: float = 0.05,
+                       ai_density: float = 0.03, aiact_density: float = 0.02, words: tuple = (8, 60)):
+    """ Returns one synthetic paragraph
+    :param rng: random.Random
+    :param rapporteurs: list of lower-case rapporteur names
+    :param rapporteur_density: float; probability that the paragraph mentions a rapporteur
+    :param ai_density: float; probability that the paragraph mentions AI (not the AI act)
+    :param aiact_density: float; probability that the paragraph mentions the AI act
+    :param words: tuple (min, max) number of filler words
+    :return: str
+    """
+    tokens: list = rng.choices(_vocabulary, k=rng.randint(*words))
+
+    if rng.random() < rapporteur_density:
+        for _ in range(rng.choice([1, 1, 1, 2])):
+            tokens.insert(rng.randrange(len(tokens) + 1), _name_variant(rng.choice(rapporteurs), rng))
+    if rng.random() < ai_density:
+        tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(_ai_mentions))
+    if rng.random() < aiact_density:
+        tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(_aiact_mentions))
+
+    text: str = " ".join(tokens)
+    return text[0].upper() + text[1:] + "."
+
+
+def generate_newsletters(n_newsletters: int = 1758, paragraphs: tuple = (20, 120), rapporteurs: list = None,
+                         rapporteur_density: float = 0.05, ai_density: float = 0.03, aiact_density: float = 0.02,
+                         boilerplate_share: float = 0.1, start_date: str = "2015-01-01", end_date: str = "2023-01-01",
+                         seed: int = 42):
+    """ Returns a list of newsletter records {'id', 'date', 'title', 'text'} (sorted by date)
+        Example:
+            generate_newsletters(n_newsletters=2, paragraphs=(2, 3))
+            return: [{'id': 1, 'date': '2015-03-02', 'title': 'Morning Tech 1', 'text': 'Data rules ...\\nVote ...'}, ...]
+    :param n_newsletters: int
+    :param paragraphs: tuple (min, max) number of paragraphs per newsletter
+    :param rapporteurs: list of lower-case rapporteur names (default: rapporteurs of the AI act)
+    :param rapporteur_density: float; share of paragraphs mentioning a rapporteur
+    :param ai_density: float; share of paragraphs mentioning AI
+    :param aiact_density: float; share of paragraphs mentioning the AI act
+    :param boilerplate_share: float; share of paragraphs that are repeated boilerplate (sign-offs, sponsor blocks)
+    :param start_date: str; first possible date
+    :param end_date: str; last possible date
+    :param seed: int
+    :return: list of dicts
+    """
+    rng = random.Random(seed)
+    rapporteurs = rapporteurs if rapporteurs is not None else rapporteurs_default
+
+    boilerplate: list = [generate_paragraph(rng, rapporteurs, 0, 0, 0) for _ in range(10)]  # recurring blocks
+
+    start = dt.date.fromisoformat(start_date)
+    n_days: int = (dt.date.fromisoformat(end_date) - start).days
+    dates: list = sorted(start + dt.timedelta(days=rng.randrange(n_days)) for _ in range(n_newsletters))
+
+    newsletters: list = []
+    for pos, date in enumerate(dates):
+        paras: list = []
+        for _ in range(rng.randint(*paragraphs)):
+            if rng.random() < boilerplate_share:
+                paras.append(rng.choice(boilerplate))
+            else:
+                paras.append(generate_paragraph(rng, rapporteurs, rapporteur_density, ai_density, aiact_density))
+
+        text: str = "".join(para + rng.choice(["\n", "\n", "\n", "\n\n"]) for para in paras)
+        newsletters.append({'id': pos + 1, 'date': date.isoformat(), 'title': f"Morning Tech {pos + 1}", 'text': text})
+
+    return newsletters
+
+
+def write_newsletters(newsletters: list, path: str, json_lines: bool = False):
+    """ Writes newsletter records as a JSON array (like the raw data) or as JSON Lines
+    :param newsletters: list of dicts
+    :param path: str
+    :param json_lines: bool
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        if json_lines:
+            for record in newsletters:
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+        else:
+            json.dump(newsletters, f, ensure_ascii=False)
+
+
+def write_entity_catalogue(path: str, rapporteurs: list = None):
+    """ Writes an entity catalogue in the format of ./data/preprocessed/entity_catalogue.json
+        (see helpers/entity_catalogue.py and helpers/create_regex_patterns_rapporteurs.py)
+    :param path: str
+    :param rapporteurs: list of lower-case rapporteur names (default: rapporteurs of the AI act)
+    """
+    rapporteurs = rapporteurs if rapporteurs is not None else rapporteurs_default
+
+    entities: list = [{'id': rapp.replace(" ", "_"), 'name': " ".join(i.capitalize() for i in rapp.split()),
+                       'type': 'rapporteur', 'aliases': [rapp]} for rapp in rapporteurs]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entities, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic newsletter corpus.")
+    parser.add_argument("--n-newsletters", type=int, default=1758)
+    parser.add_argument("--min-paragraphs", type=int, default=20)
+    parser.add_argument("--max-paragraphs", type=int, default=120)
+    parser.add_argument("--rapporteur-density", type=float, default=0.05)
+    parser.add_argument("--ai-density", type=float, default=0.03)
+    parser.add_argument("--aiact-density", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json-lines", action="store_true")
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    write_newsletters(generate_newsletters(n_newsletters=args.n_newsletters,
+                                           paragraphs=(args.min_paragraphs, args.max_paragraphs),
+                                           rapporteur_density=args.rapporteur_density, ai_density=args.ai_density,
+                                           aiact_density=args.aiact_density, seed=args.seed),
+                      args.output, json_lines=args.json_lines)
@@ -0,0 +1,115 @@
+"""
+    This file: command-line entry point of the pipeline (run from the repository root)
+        python cli.py patterns                            rapporteur patterns & entity catalogue (helpers/create_regex_patterns_rapporteurs.py)
+        python cli.py retrieve --model sm --workers 4     mentions, co-occurrence, index, topic tokens & vectors (0-entity-retrieval_spacy.py)
+        python cli.py terms                               term counts & top terms (1-retrieval-words.py without topic models)
+        python cli.py topics --lda-workers 8              term counts, top terms & LDA topics (1-retrieval-words.py)
+        python cli.py topics --method clusters            ... & topic clusters of the paragraph vectors instead of LDA
+        python cli.py query "benifei AND AIact" --per M   query the mention index (helpers/mention_index.py)
+        python cli.py rollup --per M --types AIact        roll up the daily mention cube (helpers/mention_cube.py)
+    every subcommand runs its script with the options given as settings (see helpers/script_settings.py); options
+    that are not given keep the value set in the script; only the modules of the chosen subcommand are imported
+    --model selects the spaCy pipeline: 'lg' (en_core_web_lg), 'sm' (en_core_web_sm), 'blank' (tokenizer only,
+    no download) or any model name or path; it is loaded once per process
+"""
+
+import argparse
+import os
+import runpy
+import sys
+import timeit
+
+repo_dir: str = os.path.dirname(os.path.abspath(__file__))
+
+scripts: dict = {'patterns': "helpers/create_regex_patterns_rapporteurs.py",
+                 'retrieve': "0-entity-retrieval_spacy.py",
+                 'terms': "1-retrieval-words.py",
+                 'topics': "1-retrieval-words.py"}
+modules: dict = {'query': "helpers.mention_index", 'rollup': "helpers.mention_cube"}  # run with their own options
+
+# option name: setting name in the script
+retrieve_settings: dict = {'model': 'spacy_model', 'mode': 'matching_mode', 'engine': 'matching_engine',
+                           'newsletters': 'newsletters_path', 'chunksize': 'newsletters_chunksize',
+                           'workers': 'n_workers', 'batch_size': 'pipe_batch_size', 'incremental': 'incremental_mode',
+                           'prefilter': 'use_prefilter', 'window': 'cooccurrence_window',
+                           'profile_stage': 'profile_stage'}
+words_settings: dict = {'tokens': 'topic_tokens_path', 'output': 'root_path', 'lda_workers': 'lda_n_workers',
+                        'coarse_step': 'lda_coarse_step', 'method': 'topic_method', 'clusters': 'cluster_n',
+                        'vectors': 'paragraph_vectors_path', 'profile_stage': 'profile_stage'}
+
+
+def build_parser():
+    """ Returns the argument parser of the subcommands """
+    parser = argparse.ArgumentParser(description="Entity retrieval pipeline: patterns, retrieval, term counts & topics.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("patterns", help="create the rapporteur patterns and the entity catalogue")
+
+    retrieve = subparsers.add_parser("retrieve", help="retrieve rapporteur mentions from the newsletters")
+    retrieve.add_argument("--model", help="'lg', 'sm', 'blank' or a spaCy model name or path")
+    retrieve.add_argument("--mode", choices=["tokenizer", "full"])
+    retrieve.add_argument("--engine", choices=["token_store", "spacy"])
+    retrieve.add_argument("--newsletters", help="JSON array or JSON Lines file of newsletters")
+    retrieve.add_argument("--chunksize", type=int, help="newsletters split, parsed and matched at once")
+    retrieve.add_argument("--workers", type=int, help="worker processes (> 1: map-reduce over chunks)")
+    retrieve.add_argument("--batch-size", type=int, help="batch_size passed to nlp.pipe")
+    retrieve.add_argument("--incremental", action=argparse.BooleanOptionalAction, help="only process new newsletters")
+    retrieve.add_argument("--prefilter", action=argparse.BooleanOptionalAction, help="keyword prefilter on raw text")
+    retrieve.add_argument("--window", type=int, help="co-occurrence within blocks of this many sentences")
+    retrieve.add_argument("--profile-stage", help="cProfile dump of this stage")
+
+    for name, help_text in [("terms", "term counts & top terms per rapporteur and quarter"),
+                            ("topics", "term counts, top terms & LDA topics")]:
+        words = subparsers.add_parser(name, help=help_text)
+        words.add_argument("--tokens", help="topic tokens exported by 'retrieve'")
+        words.add_argument("--output", help="output directory")
+        words.add_argument("--profile-stage", help="cProfile dump of this stage")
+        if name == "topics":
+            words.add_argument("--lda-workers", type=int, help="processes of the LDA topic-number sweep")
+            words.add_argument("--coarse-step", type=int, help="coarse grid of the sweep, refined around its minima")
+            words.add_argument("--method", choices=["lda", "clusters"], help="LDA or k-means over the paragraph vectors stored by 'retrieve' (model with word vectors)")
+            words.add_argument("--clusters", type=int, help="number of topic clusters (method 'clusters')")
+            words.add_argument("--vectors", help="paragraph vectors stored by 'retrieve' (method 'clusters')")
+
+    query = subparsers.add_parser("query", help="query the mention index (options: python cli.py query -h)",
+                                  add_help=False)
+    query.add_argument("query_args", nargs=argparse.REMAINDER)
+
+    rollup = subparsers.add_parser("rollup", help="roll up the daily mention cube (options: python cli.py rollup -h)",
+                                   add_help=False)
+    rollup.add_argument("query_args", nargs=argparse.REMAINDER)
+
+    return parser
+
+
+def script_overrides(args, settings: dict):
+    """ Returns the settings given on the command line (options that are None are left to the script) """
+    return {setting: getattr(args, option) for option, setting in settings.items()
+            if getattr(args, option, None) is not None}
+
+
+def main(argv: list = None):
+    starttime = timeit.default_timer()
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv[:1] and argv[0] in modules:  # options are passed on as they are (leading options included)
+        sys.argv = [modules[argv[0]].replace(".", "/") + ".py"] + argv[1:]
+        runpy.run_module(modules[argv[0]], run_name="__main__")
+        return
+
+    args = build_parser().parse_args(argv)
+
+    from helpers.script_settings import overrides
+
+    if args.command == "retrieve":
+        overrides.update(script_overrides(args, retrieve_settings))
+    elif args.command in ("terms", "topics"):
+        overrides.update(script_overrides(args, words_settings))
+        overrides['topic_model'] = args.command == "topics"
+
+    runpy.run_path(os.path.join(repo_dir, scripts[args.command]), run_name="__main__")
+    print(f"'{args.command}' took {timeit.default_timer() - starttime:.3f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
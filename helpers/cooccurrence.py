@@ -0,0 +1,153 @@
+"""
+    This file: provide a sparse co-occurrence engine for matched entities (rapporteurs) and topics (AIact, AIgen)
+        units are paragraphs or windows of consecutive sentences within a paragraph; every unit counts once per pair
+            unit x entity and unit x topic indicator matrices (binarised match counts)
+            per quarter: co-occurrence = (unit x entity)^T @ (unit x topic) over the units of the quarter
+        all quarters are computed in one sparse product: the entity columns are shifted by quarter
+        (column q x n entities + e), so (shifted unit x entity)^T @ (unit x topic) stacks the per-quarter matrices
+        results are returned in long format (one row per quarter and pair with a non-zero count)
+            entity x topic:  newsletter_date, rapporteur, topic, cooccurrences
+            entity x entity: newsletter_date, rapporteur, rapporteur_other, cooccurrences (each pair once)
+        sentences are found by rule (a sentence starts after '.', '!' or '?'), so they are available in tokenizer mode
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from spacy.strings import hash_string
+
+from helpers.token_store import TokenStore
+
+sentence_end_tokens: tuple = (".", "!", "?")
+
+
+def sentence_starts(store: TokenStore, end_tokens: tuple = sentence_end_tokens):
+    """ Returns the token positions at which sentences start, one array per document of the store
+        (the first token of a document and every token following a sentence end token)
+        Example:
+            store of ["Voss said no. The vote is today.", "AI act"]
+            return: [array([0, 4]), array([0])]
+    :param store: TokenStore with the column LOWER
+    :param end_tokens: tuple of lower-case tokens ending a sentence
+    :return: list of np.ndarray
+    """
+    is_end = np.isin(store.columns["LOWER"], np.array([hash_string(i) for i in end_tokens], dtype=np.uint64))
+    is_start = np.zeros(store.n_tokens, dtype=bool)
+    is_start[1:] = is_end[:-1]
+    is_start[store.doc_offsets[:-1][np.diff(store.doc_offsets) > 0]] = True  # first token of every non-empty document
+
+    token_docs = store.token_docs()
+    starts = np.flatnonzero(is_start)
+    local = starts - store.doc_offsets[token_docs[starts]]
+
+    return np.split(local, np.searchsorted(token_docs[starts], np.arange(1, len(store))))
+
+
+def _flat_matches(matches):
+    """ Returns the paragraph, match id and start token of every match as flat arrays """
+    matches = list(matches)
+    lengths = np.fromiter((len(lst) for lst in matches), dtype=np.int64, count=len(matches))
+    rows = np.repeat(np.arange(len(matches), dtype=np.int64), lengths)
+    ids = np.fromiter((match[0] for lst in matches for match in lst), dtype=np.int64, count=lengths.sum())
+    starts = np.fromiter((match[1] for lst in matches for match in lst), dtype=np.int64, count=lengths.sum())
+
+    return rows, ids, starts
+
+
+def unit_matrices(match_columns: list, values: list, starts_per_paragraph=None, window: int = None):
+    """ Builds the binarised unit x pattern matrices of several match columns with shared units
+        units: paragraphs (window None) or blocks of 'window' consecutive sentences of a paragraph
+        Returns (matrices, unit_paragraph): one CSR matrix (n units x len(values[i])) per match column and the
+        paragraph position of every unit
+        Example:
+            match_columns: [[[(1001, 0, 1)], [(1002, 7, 8)]], [[(100, 5, 6)], []]], values: [(1001, 1002), (100, 101)]
+            window None ==> units: the 2 paragraphs;  matrices: [csr([[1, 0], [0, 1]]), csr([[1, 0], [0, 0]])]
+            window 1, starts_per_paragraph: [[0, 3], [0]] ==> 3 units (paragraph 0, sentences 0 & 1; paragraph 1)
+    :param match_columns: list of iterables of lists of (match_id, start, end) tuples (one list per paragraph)
+    :param values: list of tuples of match ids (columns of each matrix)
+    :param starts_per_paragraph: iterable of arrays of sentence start tokens per paragraph (see sentence_starts)
+    :param window: int; number of sentences per unit; None: one unit per paragraph
+    :return: tuple (list of scipy.sparse.csr_matrix, np.ndarray)
+    """
+    match_columns = [list(matches) for matches in match_columns]
+    flat: list = [_flat_matches(matches) for matches in match_columns]
+
+    if window is None:
+        units: list = [rows for rows, _, _ in flat]
+        unit_paragraph = np.arange(len(match_columns[0]), dtype=np.int64)
+    else:
+        # sentence of every match: sentence starts of all paragraphs as one sorted key array (paragraph, token)
+        starts_per_paragraph = list(starts_per_paragraph)
+        n_sentences = np.fromiter((len(i) for i in starts_per_paragraph), dtype=np.int64, count=len(starts_per_paragraph))
+        sentence_keys = (np.repeat(np.arange(len(n_sentences), dtype=np.int64), n_sentences) << 32) | \
+            np.concatenate([np.asarray(i, dtype=np.int64) for i in starts_per_paragraph] + [np.zeros(0, dtype=np.int64)])
+        first_sentence = np.concatenate([[0], np.cumsum(n_sentences)])
+
+        blocks: list = []
+        for rows, _, starts in flat:
+            sentence = np.searchsorted(sentence_keys, (rows << 32) | starts, side='right') - 1 - first_sentence[rows]
+            blocks.append((rows << 32) | (np.maximum(sentence, 0) // window))
+
+        unit_keys, codes = np.unique(np.concatenate(blocks), return_inverse=True)  # units with at least one match
+        units = np.split(codes.ravel(), np.cumsum([len(i) for i in blocks])[:-1])
+        unit_paragraph = unit_keys >> 32
+
+    matrices: list = []
+    for (rows, ids, _), unit, vals in zip(flat, units, values):
+        vals_arr = np.asarray(vals, dtype=np.int64)
+        order = np.argsort(vals_arr)
+        pos = np.searchsorted(vals_arr[order], ids).clip(max=len(vals_arr) - 1)
+        keep = vals_arr[order][pos] == ids  # ids not in values are dropped
+
+        matrix = sparse.csr_matrix((np.ones(keep.sum(), dtype=np.int64), (unit[keep], order[pos[keep]])),
+                                   shape=(len(unit_paragraph), len(vals_arr)))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1  # every unit counts once
+        matrices.append(matrix)
+
+    return matrices, unit_paragraph
+
+
+def cooccurrence_cube(left, right, groups: pd.Series):
+    """ Per group (quarter) co-occurrence counts of the columns of two binarised unit x column matrices
+        Returns (cube, labels): CSR matrix (n groups x n left columns, n right columns) whose row g x n_left + i holds
+        the number of units of group g containing both left column i and right column j; labels: the sorted groups
+    :param left: scipy.sparse matrix (units x n_left)
+    :param right: scipy.sparse matrix (units x n_right)
+    :param groups: pd.Series of group labels (one per unit)
+    :return: tuple (scipy.sparse.csr_matrix, pd.Index)
+    """
+    codes, labels = pd.factorize(groups, sort=True)  # units with missing group labels are dropped
+    left = sparse.csr_matrix(left)
+    n_left: int = left.shape[1]
+
+    unit_codes = np.repeat(codes, np.diff(left.indptr))
+    valid = unit_codes >= 0
+    rows = np.repeat(np.arange(left.shape[0]), np.diff(left.indptr))[valid]
+    shifted = sparse.csr_matrix((left.data[valid], (rows, unit_codes[valid] * n_left + left.indices[valid])),
+                                shape=(left.shape[0], len(labels) * n_left))
+
+    return (shifted.T @ sparse.csr_matrix(right)).tocsr(), pd.Index(labels, name=groups.name)
+
+
+def cooccurrence_long(cube, labels: pd.Index, left_names: list, right_names: list,
+                      columns: tuple = ('rapporteur', 'topic'), symmetric: bool = False):
+    """ Turns a co-occurrence cube (see cooccurrence_cube) into a long data frame with the columns
+        <group name>, columns[0], columns[1], 'cooccurrences' (non-zero counts only)
+    :param cube: scipy.sparse matrix
+    :param labels: pd.Index of the groups
+    :param left_names: list (one per left column)
+    :param right_names: list (one per right column)
+    :param columns: tuple of the names of the left & right columns
+    :param symmetric: bool; left and right are the same matrix: only pairs (i, j) with i < j are kept
+    :return: pd.DataFrame
+    """
+    cube = sparse.coo_matrix(cube)
+    group, left_pos = np.divmod(cube.row, len(left_names))
+    keep = np.flatnonzero((cube.data > 0) & ((left_pos < cube.col) if symmetric else True))
+    keep = keep[np.lexsort((cube.col[keep], left_pos[keep], group[keep]))]  # by group, then in the order of the names
+
+    return pd.DataFrame({labels.name or 'group': labels[group[keep]],
+                         columns[0]: np.asarray(left_names, dtype=object)[left_pos[keep]],
+                         columns[1]: np.asarray(right_names, dtype=object)[cube.col[keep]],
+                         'cooccurrences': cube.data[keep].astype(np.int64)})
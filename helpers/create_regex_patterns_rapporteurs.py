@@ -7,8 +7,13 @@
         otherwise, the second word is also capitalized in the second entity
                 e.g.    de lastname, de Lastname DE LASTNAME
                         last name, Last Name, LAST NAME
+    creates ./data/preprocessed/entity_catalogue.json (see helpers/entity_catalogue.py) with one entity per rapporteur
+        {"id": "van_sparrentak", "name": <name>, "type": "rapporteur", "aliases": ["van sparrentak"]}
+        (matched case-insensitively on the last name, as the patterns above)
 """
 
+import json
+
 import pandas as pd
 
 #%% load raw data to pandas data frame
@@ -38,3 +43,10 @@ with open("./data/preprocessed/rapporteur_patterns.txt", "w") as f:
         f.write(write_pat)
         f.write('\n')
 
+
+#%% entity catalogue (read by 0-entity-retrieval_spacy.py)
+entities: list = [{'id': rapp_k.replace(" ", "_"), 'name': rapporteurs_dict[rapp_k]['name'], 'type': 'rapporteur',
+                   'aliases': [rapp_k]} for rapp_k in rapporteurs_dict.keys()]
+
+with open("./data/preprocessed/entity_catalogue.json", "w", encoding="utf-8") as f:
+    json.dump(entities, f, ensure_ascii=False, indent=1)
@@ -0,0 +1,133 @@
+"""
+    This file: provide an on-disk parse cache for spaCy Doc objects based on spaCy's DocBin
+        the cache is keyed by
+            the model (language, name, version and active pipeline components) ==> one cache directory per model
+            the paragraph content (sha1 hash of the text) ==> one entry per distinct paragraph
+        every call only parses paragraphs that are not yet in the cache and appends them as a new shard
+            ./data/cache/docbin/<model key>/shard-<id>.spacy  (DocBin holding the parsed docs)
+            ./data/cache/docbin/<model key>/shard-<id>.txt    (one content hash per line, same order as the docs)
+        shard ids are random, so several processes can add shards to the same cache
+        only the (small) hash files are read up front; a shard's docs are loaded when one of its docs is requested
+"""
+
+import hashlib
+import os
+import timeit
+import uuid
+
+from spacy.tokens import DocBin
+
+
+def text_hash(text: str):
+    """ Takes in a string. Returns the hex sha1 hash of its utf-8 encoding (used as the cache key of a paragraph)
+    :param text: str
+    :return: str
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def model_cache_key(nlp):
+    """ Takes in a spaCy Language object. Returns a file system safe key identifying the model and its active pipes
+        Example:
+            nlp = spacy.load('en_core_web_lg')
+            return: 'en_core_web_lg-3.7.1_3f2a9c01'
+    :param nlp: spacy.language.Language
+    :return: str
+    """
+    meta_name: str = f"{nlp.meta.get('lang', 'xx')}_{nlp.meta.get('name', 'pipeline')}-{nlp.meta.get('version', '0.0.0')}"
+    pipes_hash: str = text_hash(",".join(nlp.pipe_names))[:8]  # disabled/excluded components change the annotation
+
+    return f"{meta_name}_{pipes_hash}"
+
+
+class DocBinCache:
+    """ On-disk cache of parsed docs for one spaCy pipeline
+        Example:
+            doc_cache = DocBinCache(nlp, cache_dir="./data/cache/docbin")
+            docs = doc_cache.pipe(paragraphs, batch_size=1000)  # list of Docs, only unseen paragraphs are parsed
+    """
+
+    def __init__(self, nlp, cache_dir: str = "./data/cache/docbin"):
+        self.nlp = nlp
+        self.model_dir: str = os.path.join(cache_dir, model_cache_key(nlp))
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        self.shard_names: list = sorted(i[:-len(".spacy")] for i in os.listdir(self.model_dir) if i.endswith(".spacy"))
+
+        self.index: dict = {}  # content hash: shard name
+        for shard in self.shard_names:
+            with open(os.path.join(self.model_dir, shard + ".txt"), "r") as f:
+                self.index.update((line.strip(), shard) for line in f)
+
+    def _load(self, hashes: set):
+        """ Returns a dict (content hash: Doc) of the cached docs in 'hashes'; only shards holding them are read """
+        docs: dict = {}
+
+        for shard in sorted({self.index[hsh] for hsh in hashes}):
+            with open(os.path.join(self.model_dir, shard + ".txt"), "r") as f:
+                shard_hashes = [line.strip() for line in f]
+
+            shard_docs = DocBin().from_disk(os.path.join(self.model_dir, shard + ".spacy")).get_docs(self.nlp.vocab)
+            docs.update((hsh, doc) for hsh, doc in zip(shard_hashes, shard_docs) if hsh in hashes)
+
+        return docs
+
+    def _store(self, docs: dict):
+        """ Writes the docs (content hash: Doc) as a new shard """
+        shard = f"shard-{uuid.uuid4().hex[:16]}"
+        doc_bin = DocBin(store_user_data=False)
+        for doc in docs.values():
+            doc_bin.add(doc)
+
+        with open(os.path.join(self.model_dir, shard + ".txt"), "w") as f:  # hashes first: a shard only counts once its .spacy file exists
+            f.write("\n".join(docs.keys()))
+            f.write("\n")
+        doc_bin.to_disk(os.path.join(self.model_dir, shard + ".spacy"))
+
+        self.shard_names.append(shard)
+        self.index.update((hsh, shard) for hsh in docs.keys())
+
+    def pipe(self, texts: list, **pipe_kwargs):
+        """ Drop-in replacement for list(nlp.pipe(texts)) that reuses previously parsed docs from disk
+            takes in
+                'texts' (list) of strings to be parsed
+                'pipe_kwargs' passed on to nlp.pipe (e.g. batch_size, n_process)
+            returns list of spacy.tokens.Doc in the order of 'texts'
+            only texts whose hash is not found in the cache are parsed; they are stored as a new shard afterwards
+        :return: list
+        """
+        starttime = timeit.default_timer()
+
+        hashes: list = [text_hash(text) for text in texts]
+
+        docs: dict = self._load({hsh for hsh in hashes if hsh in self.index})  # content hash: Doc
+
+        # parse docs that are not cached yet (each distinct text only once)
+        new_texts: dict = {}  # content hash: text
+        for hsh, text in zip(hashes, texts):
+            if hsh not in docs and hsh not in new_texts:
+                new_texts[hsh] = text
+
+        if len(new_texts) > 0:
+            new_docs = dict(zip(new_texts.keys(), self.nlp.pipe(list(new_texts.values()), **pipe_kwargs)))
+            self._store(new_docs)
+            docs.update(new_docs)
+
+        print(f"Parsed {len(new_texts)} of {len(texts)} texts; {len(texts) - len(new_texts)} taken from the cache "
+              f"({timeit.default_timer() - starttime:.3f} seconds).")
+
+        return [docs[hsh] for hsh in hashes]
+
+
+def nlp_pipe_cached(nlp, texts: list, cache_dir: str = "./data/cache/docbin", **pipe_kwargs):
+    """ Drop-in replacement for list(nlp.pipe(texts)) that reuses previously parsed docs from disk
+        takes in
+            'nlp' (spacy.language.Language) the pipeline used for parsing
+            'texts' (list) of strings to be parsed
+            'cache_dir' (str) root directory of the cache; a sub-directory per model is created
+            'pipe_kwargs' passed on to nlp.pipe (e.g. batch_size, n_process)
+        returns list of spacy.tokens.Doc in the order of 'texts'
+        (for repeated calls, e.g. one per chunk, create one DocBinCache and call its pipe method instead)
+    :return: list
+    """
+    return DocBinCache(nlp, cache_dir=cache_dir).pipe(texts, **pipe_kwargs)
@@ -0,0 +1,139 @@
+"""
+    This file: provide a sparse document-term engine for the term statistics and the topic model corpus
+        one CSR matrix (paragraphs x terms) with a shared vocabulary is built in a single pass over a TokenStore;
+        every other view is a sparse row-group sum of it (indicator matrix @ document-term matrix)
+            quarters x terms          ==> quarterly documents (gensim corpus of the topic models) & top terms per quarter
+            rapporteurs x terms       ==> top terms per rapporteur (a paragraph counts for every rapporteur it mentions)
+            column sums               ==> top terms overall
+        the vocabulary is ordered by first occurrence, so ties are ranked like collections.Counter.most_common
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from helpers.token_store import TokenStore, term_codes
+
+
+def document_term_matrix(store: TokenStore, keep_pos: tuple = ("NOUN", ), exclude: tuple = (), attr: str = "LEMMA"):
+    """ Counts the terms (see helpers/token_store.extract_terms) of every document of the store
+        Returns (matrix, vocabulary): CSR matrix (n documents x n terms, int64) and the terms (np.ndarray of str)
+    :param store: TokenStore
+    :param keep_pos: tuple of POS names
+    :param exclude: tuple of lower-case strings
+    :param attr: str
+    :return: tuple
+    """
+    keep, codes, terms = term_codes(store, keep_pos=keep_pos, exclude=exclude, attr=attr)
+    token_codes = codes[keep]
+    token_docs = store.token_docs()[keep]
+
+    # columns in the order of the first occurrence of the terms
+    used, first = np.unique(token_codes, return_index=True)
+    used = used[np.argsort(first, kind='stable')]
+    columns = np.full(len(terms), -1, dtype=np.int64)
+    columns[used] = np.arange(len(used))
+
+    matrix = sparse.csr_matrix((np.ones(len(token_codes), dtype=np.int64), (token_docs, columns[token_codes])),
+                               shape=(len(store), len(used)))
+    matrix.sum_duplicates()
+
+    return matrix, terms[used]
+
+
+def group_rows(matrix, groups, rows=None):
+    """ Sums the rows of a sparse matrix by group. Returns (grouped matrix, labels) with one row per label (sorted)
+        Example:
+            matrix: csr_matrix([[1, 0], [2, 1], [0, 3]]), groups: ['2022Q1', '2022Q1', '2022Q2']
+            return: csr_matrix([[3, 1], [0, 3]]), Index(['2022Q1', '2022Q2'])
+    :param matrix: scipy.sparse matrix
+    :param groups: array-like; the group of every row (or of every entry of 'rows')
+    :param rows: array-like of row positions (many-to-many groupings, e.g. one entry per paragraph and rapporteur)
+    :return: tuple (scipy.sparse.csr_matrix, pd.Index)
+    """
+    rows = np.arange(matrix.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+    codes, labels = pd.factorize(pd.Series(groups).to_numpy(), sort=True)
+
+    indicator = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (codes, rows)), shape=(len(labels), matrix.shape[0]))
+
+    return (indicator @ matrix).tocsr(), pd.Index(labels)
+
+
+def top_terms(matrix, vocabulary, k: int = 1000, labels=None):
+    """ Returns the k most frequent terms of every row (ties: in the order of the vocabulary) as a long data frame
+        with the columns 'group' (label of the row; only if labels are given), 'term' and 'counts'
+        Example:
+            top_terms(matrix.sum(axis=0), vocabulary, k=1000)  # top terms overall
+            top_terms(*group_rows(matrix, rapporteurs, rows=paragraph_ids), k=1)  # top term per rapporteur
+    :param matrix: scipy.sparse matrix or 2D array (rows x terms)
+    :param vocabulary: array-like of terms (one per column)
+    :param k: int
+    :param labels: array-like (one per row)
+    :return: pd.DataFrame
+    """
+    matrix = sparse.csr_matrix(matrix)
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    frames: list = []
+
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        cols, counts = matrix.indices[start:end], matrix.data[start:end]
+        nonzero = counts > 0
+        cols, counts = cols[nonzero], counts[nonzero]
+
+        order = np.lexsort((cols, -counts))[:k]  # count descending, then vocabulary order
+        frame = pd.DataFrame({'term': vocabulary[cols[order]], 'counts': counts[order]})
+        if labels is not None:
+            frame.insert(0, 'group', labels[row])
+        frames.append(frame)
+
+    if len(frames) == 0:
+        return pd.DataFrame(columns=(['group'] if labels is not None else []) + ['term', 'counts'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def gensim_vocabulary(matrix, vocabulary, no_below: int = 5, no_above: float = 0.5, keep_n: int = 1000):
+    """ Selects the columns that gensim's Dictionary(documents).filter_extremes(no_below, no_above, keep_n) keeps
+        Returns the selected column positions in the order of their gensim ids
+        (gensim numbers tokens by their first document, alphabetically within it; filter_extremes keeps the tokens
+        that occur in at least no_below and at most no_above x n documents, the keep_n with the highest document
+        frequency, and renumbers them in the order of their old ids)
+    :param matrix: scipy.sparse matrix (documents x terms)
+    :param vocabulary: array-like of terms
+    :param no_below: int
+    :param no_above: float
+    :param keep_n: int or None
+    :return: np.ndarray
+    """
+    matrix = sparse.csc_matrix(matrix)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    vocabulary = np.asarray(vocabulary, dtype=object)
+
+    doc_freq = np.diff(matrix.indptr)
+    first_doc = np.where(doc_freq > 0, matrix.indices[np.minimum(matrix.indptr[:-1], max(matrix.nnz - 1, 0))], matrix.shape[0])
+    gensim_order = np.lexsort((vocabulary, first_doc))  # columns in the order of their gensim ids
+    gensim_order = gensim_order[doc_freq[gensim_order] > 0]
+
+    good = gensim_order[(doc_freq[gensim_order] >= no_below) & (doc_freq[gensim_order] <= int(no_above * matrix.shape[0]))]
+    good = good[np.argsort(-doc_freq[good], kind='stable')]  # by document frequency (ties: gensim id)
+    if keep_n is not None:
+        good = good[:keep_n]
+
+    return gensim_order[np.isin(gensim_order, good)]
+
+
+def bow_corpus(matrix, columns):
+    """ Returns the rows of the matrix as a gensim bag-of-words corpus restricted to 'columns'
+        (term id i = columns[i]; each document: list of (term id, count) sorted by term id, like Dictionary.doc2bow)
+    :param matrix: scipy.sparse matrix (documents x terms)
+    :param columns: array-like of column positions (e.g. output of gensim_vocabulary)
+    :return: list of lists of tuples
+    """
+    sub = sparse.csr_matrix(matrix)[:, np.asarray(columns, dtype=np.int64)]
+    sub.eliminate_zeros()
+    sub.sort_indices()
+
+    return [list(zip(sub.indices[sub.indptr[row]:sub.indptr[row + 1]].tolist(),
+                     sub.data[sub.indptr[row]:sub.indptr[row + 1]].tolist())) for row in range(sub.shape[0])]
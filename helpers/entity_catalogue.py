@@ -0,0 +1,147 @@
+"""
+    This file: provide a structured entity catalogue and the phrase matchers compiled from it
+        the catalogue is a JSON array of entities (e.g. ./data/preprocessed/entity_catalogue.json)
+            {"id": "van_sparrentak", "name": "Kim van Sparrentak", "type": "rapporteur", "aliases": ["van sparrentak"]}
+            id:      unique name of the entity (column name of the counts)
+            name:    display name
+            type:    e.g. 'rapporteur', 'mep', 'commission', 'company'
+            aliases: surface forms to match (any number of tokens; case-insensitive); default: [name]
+        the aliases are tokenized once with the tokenizer of the pipeline; the tokenized aliases (match id: phrases)
+        are cached in <cache dir>/<catalogue hash>_<model key>.json, so a known catalogue loads without tokenizing
+        the phrases are matched by a spaCy PhraseMatcher (engine 'spacy') or a TokenStorePhraseMatcher (engine
+        'token_store'); both look phrases up instead of trying one rule per entity, so matching time hardly grows
+        with the number of entities (see benchmarks/benchmark_entity_catalogue.py)
+        token patterns (e.g. the topic patterns of 0-entity-retrieval_spacy.py) are compiled by build_matcher
+"""
+
+import hashlib
+import json
+import os
+
+from spacy.matcher import Matcher, PhraseMatcher
+from spacy.tokens import Doc
+
+from helpers.docbin_cache import model_cache_key
+from helpers.token_store import TokenStoreMatcher, TokenStorePhraseMatcher
+
+
+def read_entity_catalogue(path: str, types: tuple = None):
+    """ Reads an entity catalogue (JSON array, see above). Returns the list of entities (dicts with id, name, type, aliases)
+    :param path: str
+    :param types: tuple of entity types to keep (None: all)
+    :return: list
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        records: list = json.load(f)
+
+    entities: list = []
+    seen: set = set()
+    for record in records:
+        if 'id' not in record or 'type' not in record:
+            raise ValueError(f"Entity without 'id' or 'type' in {path}: {record}")
+        if record['id'] in seen:
+            raise ValueError(f"Duplicate entity id '{record['id']}' in {path}.")
+        seen.add(record['id'])
+
+        aliases: list = record.get('aliases') or [record.get('name', record['id'])]
+        entity: dict = {'id': record['id'], 'name': record.get('name', record['id']), 'type': record['type'],
+                        'aliases': [alias for alias in aliases if alias.strip() != ""]}
+        if types is None or entity['type'] in types:
+            entities.append(entity)
+
+    return entities
+
+
+def catalogue_hash(entities: list, first_id: int = 1001):
+    """ Returns a key identifying the entities (ids, types & aliases in order) and their match ids """
+    return hashlib.sha1(repr((first_id, [(i['id'], i['type'], i['aliases']) for i in entities])).encode("utf-8"))\
+        .hexdigest()[:16]
+
+
+def compile_entity_phrases(entities: list, nlp, first_id: int = 1001, cache_dir: str = "./data/cache/entity_matcher"):
+    """ Tokenizes the aliases of the entities. Returns a dict (match id: list of phrases, i.e. lists of lower-case tokens)
+        the match id of the i-th entity is first_id + i; the result is cached per catalogue and tokenizer
+        Example:
+            entities: [{'id': 'voss', ..., 'aliases': ['voss']}, {'id': 'van_sparrentak', ..., 'aliases': ['van sparrentak']}]
+            return: {1001: [['voss']], 1002: [['van', 'sparrentak']]}
+    :param entities: list (output of read_entity_catalogue)
+    :param nlp: spacy.language.Language (only its tokenizer is used)
+    :param first_id: int
+    :param cache_dir: str; None: no cache
+    :return: dict
+    """
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, f"{catalogue_hash(entities, first_id)}_{model_cache_key(nlp)}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return {int(match_id): phrases for match_id, phrases in json.load(f).items()}
+
+    aliases: list = [alias for entity in entities for alias in entity['aliases']]
+    tokenized = iter([[token.lower_ for token in doc if not token.is_space] for doc in nlp.tokenizer.pipe(aliases)])
+
+    phrases: dict = {first_id + pos: [next(tokenized) for _ in entity['aliases']] for pos, entity in enumerate(entities)}
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(phrases, f, ensure_ascii=False)
+
+    return phrases
+
+
+class EntityPhraseMatcher:
+    """ spaCy PhraseMatcher on LOWER that returns the integer match ids of the phrases (PhraseMatcher keys are strings)
+        Example:
+            matcher = EntityPhraseMatcher(nlp.vocab, {1002: [['van', 'sparrentak']]})
+            matcher(nlp("Van Sparrentak said"))
+            return: [(1002, 0, 2)]
+    """
+
+    def __init__(self, vocab, phrases: dict):
+        self.matcher = PhraseMatcher(vocab, attr="LOWER")
+        self.match_ids: dict = {}  # string hash of the key: int match id
+        for match_id, phrs in phrases.items():
+            self.match_ids[vocab.strings.add(f"entity-{match_id}")] = match_id
+            self.matcher.add(f"entity-{match_id}", [Doc(vocab, words=phrase) for phrase in phrs])
+
+    def __call__(self, doc):
+        return [(self.match_ids[key], start, end) for key, start, end in self.matcher(doc)]
+
+
+def build_matcher(vocab, patterns: dict, engine: str = "spacy"):
+    """ Takes in a spaCy vocab and a dict of patterns (match id: list of token patterns). Returns a matcher
+        engine "spacy":       spacy.matcher.Matcher (applied to every Doc)
+        engine "token_store": TokenStoreMatcher (applied to the token attributes of all Docs of a chunk at once)
+    :param vocab: spacy.vocab.Vocab
+    :param patterns: dict, e.g. {101: [[{'LOWER': 'ai'}, {'LOWER': 'act'}]]}
+    :param engine: str
+    :return: spacy.matcher.Matcher or TokenStoreMatcher
+    """
+    if engine == "token_store":
+        return TokenStoreMatcher(patterns)
+    elif engine != "spacy":
+        raise ValueError(f"Unknown matching engine '{engine}'; use 'spacy' or 'token_store'.")
+
+    matcher = Matcher(vocab)
+    for match_id, patt in patterns.items():
+        matcher.add(match_id, patt)
+
+    return matcher
+
+
+def build_phrase_matcher(vocab, phrases: dict, engine: str = "spacy"):
+    """ Takes in a spaCy vocab and a dict of phrases (match id: list of lists of lower-case tokens). Returns a matcher
+        engine "spacy":       EntityPhraseMatcher (spaCy PhraseMatcher on LOWER; applied to every Doc)
+        engine "token_store": TokenStorePhraseMatcher (applied to the token attributes of all Docs of a chunk at once)
+    :param vocab: spacy.vocab.Vocab
+    :param phrases: dict, e.g. {1002: [['van', 'sparrentak']]}
+    :param engine: str
+    :return: EntityPhraseMatcher or TokenStorePhraseMatcher
+    """
+    if engine == "token_store":
+        return TokenStorePhraseMatcher(phrases, attr="LOWER")
+    elif engine != "spacy":
+        raise ValueError(f"Unknown matching engine '{engine}'; use 'spacy' or 'token_store'.")
+
+    return EntityPhraseMatcher(vocab, phrases)
@@ -0,0 +1,117 @@
+"""
+    This file: provide a raw-text prefilter that finds paragraphs which can possibly be matched by the spaCy Matchers
+        all lower-cased keywords (e.g. rapporteur last names, 'ai', 'artificial') are compiled into one multi-pattern
+        automaton (Aho-Corasick via pyahocorasick if installed; otherwise one compiled regular expression);
+        a keyword only counts if it is not directly preceded or followed by a letter or digit (word boundary)
+        only candidate paragraphs need to be parsed and matched; the spaCy Matcher remains responsible for the exact
+        match, the prefilter only has to be conservative: every token a Matcher pattern can match on is a keyword
+"""
+
+import re
+import timeit
+
+import numpy as np
+
+try:
+    import ahocorasick  # pip install pyahocorasick
+except ImportError:  # fall back to a single regular expression
+    ahocorasick = None
+
+
+def build_keyword_automaton(keywords: dict):
+    """ Takes in a dict of keyword groups. Returns an automaton to be passed to keyword_prefilter
+        Example:
+            keywords = {'rapporteur': ['benifei', 'sparrentak'], 'topic': ['ai', 'artificial']}
+    :param keywords: dict (group name: list of lower-case keywords)
+    :return: tuple (automaton, list of group names)
+    """
+    groups: list = list(keywords.keys())
+
+    keyword_groups: dict = {}  # keyword: set of group positions (one keyword can belong to several groups)
+    for group_pos, group in enumerate(groups):
+        for keyword in keywords[group]:
+            keyword_groups.setdefault(keyword.lower(), set()).add(group_pos)
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for keyword, group_pos in keyword_groups.items():
+            automaton.add_word(keyword, (len(keyword), tuple(group_pos)))
+        automaton.make_automaton()
+
+    else:  # longest keywords first so that the alternation prefers them
+        pattern = "|".join(re.escape(i) for i in sorted(keyword_groups.keys(), key=len, reverse=True))
+        automaton = (re.compile(r"(?<![^\W_])(?:" + pattern + r")(?![^\W_])"), keyword_groups)
+
+    return automaton, groups
+
+
+def _text_groups(text: str, automaton):
+    """ Returns the set of group positions with at least one keyword in 'text' (respecting word boundaries) """
+    found: set = set()
+
+    if ahocorasick is not None:
+        for end, (length, group_pos) in automaton.iter(text):
+            start = end - length + 1
+            if (start == 0 or not text[start - 1].isalnum()) and (end + 1 == len(text) or not text[end + 1].isalnum()):
+                found.update(group_pos)
+
+    else:
+        regex, keyword_groups = automaton
+        for match in regex.finditer(text):
+            found.update(keyword_groups[match.group(0)])
+
+    return found
+
+
+def keyword_prefilter(texts: list, automaton):
+    """ Takes in a list of texts and the output of build_keyword_automaton
+        Returns a dict of boolean numpy arrays (group name: True where the text contains a keyword of that group)
+    :param texts: list of strings
+    :param automaton: tuple returned by build_keyword_automaton
+    :return: dict
+    """
+    automaton, groups = automaton
+
+    hits = np.zeros((len(texts), len(groups)), dtype=bool)
+    for text_pos, text in enumerate(texts):
+        for group_pos in _text_groups(text.lower(), automaton):
+            hits[text_pos, group_pos] = True
+
+    return {group: hits[:, group_pos] for group_pos, group in enumerate(groups)}
+
+
+def benchmark_prefilter(texts: list, nlp, matchers: list, automaton, require: str, **pipe_kwargs):
+    """ Compares parsing & matching all texts with parsing & matching only the prefiltered candidates
+        prints the fraction of texts skipped, both durations and the speedup; checks that all matches are identical
+    :param texts: list of strings (e.g. a sample of paragraphs)
+    :param nlp: spacy.language.Language
+    :param matchers: list of spacy Matchers to apply
+    :param automaton: tuple returned by build_keyword_automaton
+    :param require: str; name of the keyword group a text must contain to be a candidate
+    :param pipe_kwargs: passed on to nlp.pipe
+    :return: dict (skipped fraction, durations, speedup)
+    """
+    # 1) all texts
+    starttime = timeit.default_timer()
+    matches_all = [[matcher(doc) for matcher in matchers] for doc in nlp.pipe(texts, **pipe_kwargs)]
+    duration_all = timeit.default_timer() - starttime
+
+    # 2) prefiltered texts
+    starttime = timeit.default_timer()
+    candidates = keyword_prefilter(texts, automaton)[require]
+    docs = iter(nlp.pipe([text for text, cand in zip(texts, candidates) if cand], **pipe_kwargs))
+    matches_pre = [[matcher(next(docs)) for matcher in matchers] if cand else [[] for _ in matchers]
+                   for cand in candidates]
+    duration_pre = timeit.default_timer() - starttime
+
+    results: dict = {'skipped_fraction': 1 - candidates.mean() if len(texts) > 0 else 0.0,
+                     'duration_all': duration_all,
+                     'duration_prefilter': duration_pre,
+                     'speedup': duration_all / duration_pre if duration_pre > 0 else float("inf"),
+                     'identical': matches_all == matches_pre}
+
+    print(f"Prefilter skipped {results['skipped_fraction']:.1%} of {len(texts)} texts; "
+          f"all: {duration_all:.3f} seconds, prefiltered: {duration_pre:.3f} seconds "
+          f"(speedup {results['speedup']:.1f}x); identical matches: {results['identical']}.")
+
+    return results
@@ -0,0 +1,142 @@
+"""
+    This file: provide a parallel, resumable sweep over the number of topics of an LDA model (u_mass coherence)
+        the corpus is serialized once as a Matrix Market file (MmCorpus, read from disk by every worker)
+        candidate numbers of topics are trained in a pool of processes; every (num_topics, coherence) result is
+        appended to <sweep dir>/results.jsonl as soon as it is finished, so an interrupted sweep resumes where it stopped
+        the sweep directory is keyed by the corpus and the LDA settings (other corpus or settings ==> new sweep)
+        instead of every number of topics, a coarse grid can be trained first and refined around its local minima
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import timeit
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from helpers.topic_inference import corpus_key
+
+
+def sweep_key(corpus: list, n_terms: int, lda_kwargs: dict):
+    """ Returns a key identifying the corpus (see corpus_key in helpers/topic_inference.py) and the LDA settings """
+    return hashlib.sha1(repr((corpus_key(corpus, n_terms), sorted(lda_kwargs.items()))).encode("utf-8")).hexdigest()[:16]
+
+
+def _fit_coherence(sweep_dir: str, num_topics: int, lda_kwargs: dict, workers_per_model: int):
+    """ Trains one LDA model on the serialized corpus. Returns (num_topics, u_mass coherence, seconds) """
+    from gensim.corpora import Dictionary, MmCorpus
+    from gensim.models import CoherenceModel, LdaModel, LdaMulticore
+
+    starttime = timeit.default_timer()
+    corpus = MmCorpus(os.path.join(sweep_dir, "corpus.mm"))
+    dictionary = Dictionary.load(os.path.join(sweep_dir, "dictionary.dict"))
+
+    if workers_per_model > 1:
+        lda_model = LdaMulticore(corpus=corpus, id2word=dictionary, num_topics=num_topics, workers=workers_per_model,
+                                 **lda_kwargs)
+    else:
+        lda_model = LdaModel(corpus=corpus, id2word=dictionary, num_topics=num_topics, **lda_kwargs)
+
+    coherence = CoherenceModel(model=lda_model, corpus=corpus, dictionary=dictionary, coherence='u_mass').get_coherence()
+
+    return num_topics, float(coherence), timeit.default_timer() - starttime
+
+
+def _load_results(path: str):
+    """ Returns the stored results (num_topics: record) of a sweep """
+    results: dict = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():  # a line cut off by a crash is not valid JSON
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    results[record['num_topics']] = record
+
+    return results
+
+
+def local_minima(results: pd.DataFrame):
+    """ Returns the numbers of topics whose coherence is lower than that of both neighbours (in the evaluated grid)
+    :param results: pd.DataFrame with columns 'num_topics' and 'coherence'
+    :return: list
+    """
+    results = results.sort_values('num_topics').reset_index(drop=True)
+    score = results['coherence'].tolist()
+
+    return [int(results['num_topics'][i]) for i in range(len(score))
+            if (i == 0 or score[i] < score[i - 1]) and (i == len(score) - 1 or score[i] < score[i + 1])]
+
+
+def run_lda_sweep(corpus: list, dictionary, sweep_dir: str = "./data/cache/lda_sweep", topic_range: tuple = (1, 54),
+                  coarse_step: int = None, n_workers: int = None, workers_per_model: int = 1, lda_kwargs: dict = None):
+    """ Computes the u_mass coherence of LDA models for a range of numbers of topics
+        takes in
+            'corpus' (list) bag-of-words corpus & 'dictionary' (gensim Dictionary)
+            'sweep_dir' (str) root directory of the stored sweeps
+            'topic_range' (tuple) smallest & largest number of topics
+            'coarse_step' (int) None: every number of topics; else every coarse_step-th number first, then all numbers
+                          within coarse_step of the local minima of the coarse grid
+            'n_workers' (int) number of processes (default: number of CPUs // workers_per_model)
+            'workers_per_model' (int) 1: LdaModel; > 1: LdaMulticore with this many workers per model
+            'lda_kwargs' (dict) passed on to the model, e.g. {'iterations': 10, 'passes': 10, 'random_state': 100}
+        returns pd.DataFrame with columns 'num_topics', 'coherence' and 'seconds' (sorted by num_topics)
+        results already stored for the same corpus and settings are not recomputed
+    :return: pd.DataFrame
+    """
+    from gensim.corpora import MmCorpus
+
+    starttime = timeit.default_timer()
+    lda_kwargs = lda_kwargs if lda_kwargs is not None else {}
+    n_workers = n_workers if n_workers is not None else max(1, multiprocessing.cpu_count() // workers_per_model)
+    mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+
+    sweep_dir = os.path.join(sweep_dir, sweep_key(corpus, len(dictionary), {**lda_kwargs, 'workers_per_model': workers_per_model}))
+    os.makedirs(sweep_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(sweep_dir, "dictionary.dict")):  # serialize the corpus once
+        MmCorpus.serialize(os.path.join(sweep_dir, "corpus.mm"), corpus)
+        dictionary.save(os.path.join(sweep_dir, "dictionary.dict"))
+
+    results_path: str = os.path.join(sweep_dir, "results.jsonl")
+    results: dict = _load_results(results_path)
+    n_stored: int = len(results)
+
+    def evaluate(candidates: list):
+        todo: list = [i for i in candidates if i not in results]
+        if len(todo) == 0:
+            return
+
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context) as pool, open(results_path, "a") as f:
+            futures = [pool.submit(_fit_coherence, sweep_dir, i, lda_kwargs, workers_per_model) for i in todo]
+            for future in as_completed(futures):
+                num_topics, coherence, seconds = future.result()
+                results[num_topics] = {'num_topics': num_topics, 'coherence': coherence, 'seconds': seconds}
+                f.write(json.dumps(results[num_topics]) + "\n")
+                f.flush()  # persisted as soon as it is finished
+                print(f"{num_topics} topics: coherence {coherence:.4f} ({seconds:.1f} seconds)")
+
+    low, high = topic_range
+    if coarse_step is None:
+        evaluate(list(range(low, high + 1)))
+    else:
+        coarse: list = list(range(low, high + 1, coarse_step))
+        if coarse[-1] != high:  # the largest number of topics is always part of the coarse grid
+            coarse.append(high)
+        evaluate(coarse)
+
+        coarse_results = pd.DataFrame([results[i] for i in coarse])
+        refine: set = set()
+        for minimum in local_minima(coarse_results):
+            refine |= set(range(max(low, minimum - coarse_step + 1), min(high, minimum + coarse_step - 1) + 1))
+        evaluate(sorted(refine))
+
+    print(f"LDA sweep: {len(results) - n_stored} models trained, {n_stored} taken from {sweep_dir} "
+          f"({timeit.default_timer() - starttime:.3f} seconds).")
+
+    in_range = [record for num_topics, record in results.items() if low <= num_topics <= high]
+    return pd.DataFrame(in_range, columns=['num_topics', 'coherence', 'seconds']).sort_values('num_topics')\
+        .reset_index(drop=True)
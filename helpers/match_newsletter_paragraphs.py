@@ -0,0 +1,139 @@
+"""
+    This file: provide function to turn a chunk of newsletters into matched paragraphs
+        1) cleans the newsletters (id, date, text)
+        2) splits them into paragraphs (tokenize_df_explode)
+        3) prefilters the paragraphs on raw text (optional; keyword_prefilter)
+        4) converts the candidate paragraphs to spaCy objects (optionally through a DocBinCache)
+        5) applies the matchers (spaCy Matchers to every Doc; TokenStoreMatchers to the TokenStore of the chunk)
+    the spaCy objects are dropped after matching, so memory is bounded by the chunk size; if all matchers are
+    TokenStoreMatchers, every Doc is reduced to its token attributes as soon as it is parsed
+    steps 2) to 5) are recorded as stages 'split', 'prefilter', 'parse' and 'match_<name>' if a RunMetrics is passed
+    optionally, the sentence start tokens of every paragraph are added (for co-occurrence in sentence windows)
+    optionally, the mean word vector of every parsed paragraph is added (see helpers/paragraph_vectors.py)
+    steps 3) to 5) run once per distinct paragraph text; the results are fanned out to all occurrences (stage 'dedup';
+    with a ParagraphCache, paragraphs matched in earlier chunks are not processed again; see helpers/paragraph_dedup.py)
+"""
+
+import numpy as np
+import pandas as pd
+
+from helpers.cooccurrence import sentence_starts
+from helpers.keyword_prefilter import keyword_prefilter
+from helpers.paragraph_vectors import paragraph_vectors
+from helpers.run_metrics import track
+from helpers.token_store import TokenStore, TokenStoreMatcher
+from helpers.tokenize_df_explode import tokenize_df_explode
+
+
+def match_newsletter_paragraphs(newsletters: pd.DataFrame, nlp, matchers: dict, automaton=None, require: str = None,
+                                doc_cache=None, split_on: str = "new_line", sentences: bool = False,
+                                vectors: bool = False, paragraph_cache=None, metrics=None, **pipe_kwargs):
+    """ Takes in a data frame of newsletters (columns 'id', 'date', 'text'). Returns one row per paragraph with
+            'newsletter_id', 'newsletter_date', 'paragraph', 'paragraph_pos' and one column 'matches_<name>' per matcher (list of tuples)
+        paragraphs that are not candidates of the prefilter are not parsed and get empty match lists
+    :param newsletters: pd.DataFrame
+    :param nlp: spacy.language.Language
+    :param matchers: dict (name: spacy Matcher or TokenStoreMatcher), e.g. {'topic': matcher_topic, 'rapp': matcher_rapps}
+    :param automaton: tuple returned by build_keyword_automaton; None parses all paragraphs
+    :param require: str or tuple; keyword group(s) a paragraph must contain (any of them) to be parsed (used with automaton)
+    :param doc_cache: DocBinCache or None
+    :param split_on: str passed to tokenize_df_explode
+    :param sentences: bool; add the column 'sentence_starts' (np.ndarray of the sentence start tokens; see
+                      helpers/cooccurrence.sentence_starts; empty for paragraphs that are not parsed)
+    :param vectors: bool; add the column 'vector' (float32 mean word vector of the paragraph from nlp.vocab.vectors;
+                    None for paragraphs that are not parsed)
+    :param paragraph_cache: ParagraphCache or None (results of paragraphs of earlier chunks)
+    :param metrics: RunMetrics or None
+    :param pipe_kwargs: passed on to nlp.pipe (e.g. batch_size, n_process)
+    :return: pd.DataFrame
+    """
+    # clean data
+    newsletters = newsletters.set_index('id')  # set index
+    newsletters['date'] = pd.to_datetime(newsletters['date']).dt.date
+    newsletters = newsletters[['date', 'text']]
+
+    # split into paragraphs
+    with track(metrics, "split", rows_in=newsletters.shape[0]) as record:
+        paragraphs: pd.DataFrame = tokenize_df_explode(df=newsletters, textcol_in="text", split_on=split_on, textcol_out="paragraph")
+        record['rows_out'] = paragraphs.shape[0]
+    paragraphs = paragraphs.rename(columns={"date": "newsletter_date", "old_id": "newsletter_id"})
+    paragraphs = paragraphs[['newsletter_id', 'newsletter_date', 'paragraph']]
+    paragraphs['newsletter_date'] = pd.to_datetime(pd.to_datetime(paragraphs['newsletter_date']).dt.date)
+    paragraphs['paragraph_pos'] = paragraphs.groupby('newsletter_id').cumcount()  # position within newsletter
+
+    # deduplicate paragraphs: every distinct text (not yet in the paragraph cache) is prefiltered, parsed & matched once
+    with track(metrics, "dedup", rows_in=paragraphs.shape[0]) as record:
+        codes, distinct = pd.factorize(paragraphs['paragraph'])
+        distinct = distinct.tolist()
+        results: list = paragraph_cache.get(distinct) if paragraph_cache is not None else [None] * len(distinct)
+        new: list = [pos for pos, result in enumerate(results) if result is None]
+        texts: list = [distinct[pos] for pos in new]
+        record['rows_out'] = len(texts)
+
+    # prefilter paragraphs
+    with track(metrics, "prefilter", rows_in=len(texts)) as record:
+        if automaton is not None:
+            hits: dict = keyword_prefilter(texts, automaton)
+            candidates: np.ndarray = np.logical_or.reduce([hits[group] for group in np.atleast_1d(require)])
+        else:
+            candidates = np.ones(len(texts), dtype=bool)
+        record['rows_out'] = int(candidates.sum())
+
+    # convert candidate paragraphs to spacy objects
+    candidate_texts: list = [texts[pos] for pos in np.flatnonzero(candidates)]
+    store_attrs: set = set()  # token attributes needed by TokenStoreMatchers (and sentence_starts)
+    for matcher in matchers.values():
+        store_attrs |= matcher.attrs() if isinstance(matcher, TokenStoreMatcher) else set()
+    store_attrs |= {"LOWER"} if sentences else set()
+    store_attrs |= {"ORTH"} if vectors else set()
+    keep_docs: bool = len(store_attrs) == 0 or not all(isinstance(matcher, TokenStoreMatcher) for matcher in matchers.values())
+
+    with track(metrics, "parse", rows_in=len(candidate_texts)) as record:
+        if doc_cache is not None:
+            docs = doc_cache.pipe(candidate_texts, **pipe_kwargs)
+        else:
+            docs = nlp.pipe(candidate_texts, **pipe_kwargs)
+
+        docs = list(docs) if keep_docs else docs
+        store = TokenStore.from_docs(docs, attrs=tuple(sorted(store_attrs))) if len(store_attrs) > 0 else None
+        record['rows_out'] = len(docs) if keep_docs else len(store)
+
+    # apply matchers to the new distinct paragraphs (skipped paragraphs have no matches)
+    new_results: list = [{} for _ in range(len(texts))]
+    for name, matcher in matchers.items():
+        with track(metrics, "match_" + name, rows_in=len(candidate_texts)) as record:
+            matches: list = [[] for _ in range(len(texts))]
+            doc_matches = matcher(store) if isinstance(matcher, TokenStoreMatcher) else (matcher(doc) for doc in docs)
+            for text_pos, doc_match in zip(np.flatnonzero(candidates), doc_matches):
+                matches[text_pos] = doc_match
+            record['rows_out'] = sum(len(i) > 0 for i in matches)  # paragraphs with at least one match
+
+        for result, match in zip(new_results, matches):
+            result['matches_' + name] = match
+
+    if sentences:
+        starts: list = [np.zeros(0, dtype=np.int64) for _ in range(len(texts))]
+        for text_pos, doc_starts in zip(np.flatnonzero(candidates), sentence_starts(store)):
+            starts[text_pos] = doc_starts
+        for result, start in zip(new_results, starts):
+            result['sentence_starts'] = start
+
+    if vectors:
+        para_vectors: list = [None] * len(texts)
+        for text_pos, vector in zip(np.flatnonzero(candidates), paragraph_vectors(store, nlp.vocab.vectors)):
+            para_vectors[text_pos] = vector
+        for result, vector in zip(new_results, para_vectors):
+            result['vector'] = vector
+
+    if paragraph_cache is not None:
+        paragraph_cache.put(texts, new_results)
+
+    # fan the results of the distinct paragraphs out to all their occurrences
+    for pos, result in zip(new, new_results):
+        results[pos] = result
+    for column in (['matches_' + name for name in matchers.keys()] + (['sentence_starts'] if sentences else []) +
+                   (['vector'] if vectors else [])):
+        distinct_values: list = [result[column] for result in results]
+        paragraphs[column] = [distinct_values[code] for code in codes]
+
+    return paragraphs
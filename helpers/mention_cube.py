@@ -0,0 +1,206 @@
+"""
+    This file: provide the daily mention cube and its rollups to arbitrary periods
+        the cube holds the integer mention counts per (date, entity, mention type), non-zero counts only
+            overall_total:     number of matches of the entity
+            overall_paragraph: number of paragraphs mentioning the entity
+            AIact / AIgen:     number of paragraphs mentioning the entity and the topic (see helpers/cooccurrence.py)
+        and the days with at least one paragraph (periods without any paragraph are not reported, periods with
+        paragraphs but no mentions count 0)
+        it is computed once per chunk from the sparse paragraph x entity/topic matrices (one sparse product per
+        mention type, grouped by day); cubes of different newsletters are merged by adding them
+        rollups (week, month, quarter, year, ...) and rolling windows are computed from the cube, not the paragraphs
+            cube.rollup("M", entities=['benifei', 'voss'], types=['AIact'])
+            cube.rolling(28, freq="W")  # sum of the last 28 days, sampled weekly
+        the cube is written to ./data/output_ready/mentions_daily_cube/ (counts.parquet, days.parquet, entities.parquet)
+    usage (from the repository root):
+        python -m helpers.mention_cube --per M --entities benifei voss --types AIact AIgen
+        python -m helpers.mention_cube --rolling 90 --per W --types overall_paragraph
+"""
+
+import argparse
+import os
+import timeit
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from helpers.cooccurrence import cooccurrence_cube
+from helpers.parquet_tables import read_table, write_table
+
+mention_types: list = ['overall_total', 'overall_paragraph', 'AIact', 'AIgen']
+
+
+class MentionCube:
+    """ Daily mention counts (date, entity, mention type) with rollups
+        Example:
+            cube = MentionCube.from_matrices(paragraphs['newsletter_date'], rapp_matrix, rapp_matrix_para,
+                                             topic_matrix_para, topic_values, topic_colmapper, rapp_names)
+            cube.rollup("Q")
+            return: pd.DataFrame with the columns 'newsletter_date' (Period), 'rapporteur', 'mention_type', 'mentions'
+    """
+
+    def __init__(self, counts: pd.DataFrame, days, entities: list):
+        self.counts: pd.DataFrame = counts  # columns 'newsletter_date' (day), 'rapporteur', 'mention_type', 'mentions'
+        self.days = pd.DatetimeIndex(np.unique(days), name='newsletter_date')  # days with at least one paragraph (sorted)
+        self.entities: list = list(entities)  # all entities (also those without mentions)
+
+    @classmethod
+    def from_matrices(cls, dates: pd.Series, rapp_matrix, rapp_matrix_para, topic_matrix_para, topic_values: tuple,
+                      topic_colmapper: dict, rapp_names: list):
+        """ Returns the cube of matched paragraphs
+        :param dates: pd.Series of the newsletter date of every paragraph
+        :param rapp_matrix: scipy.sparse paragraph x rapporteur match counts (see sparse_match_matrix)
+        :param rapp_matrix_para: scipy.sparse binarised rapp_matrix
+        :param topic_matrix_para: scipy.sparse binarised paragraph x topic matrix
+        :param topic_values: tuple of topic match ids (columns of topic_matrix_para)
+        :param topic_colmapper: dict (topic match id: topic name, i.e. 'AIgen' or 'AIact')
+        :param rapp_names: list of rapporteur names (columns of rapp_matrix)
+        :return: MentionCube
+        """
+        days: pd.Series = pd.to_datetime(dates).dt.normalize().rename('newsletter_date')  # grouping variable
+        topic_types = np.asarray([mention_types.index(topic_colmapper[i]) for i in topic_values], dtype=np.int64)
+        parts: list = []
+
+        # overall_total & overall_paragraph: day x rapporteur sums; AIact & AIgen: paragraphs containing both the
+        # rapporteur and the topic (day x rapporteur rows, topic columns; see cooccurrence_cube)
+        for mention_type, matrix in [('overall_total', rapp_matrix), ('overall_paragraph', rapp_matrix_para)]:
+            cube, labels = cooccurrence_cube(matrix, np.ones((matrix.shape[0], 1), dtype=np.int64), days)
+            parts.append((cube, labels, np.full(1, mention_types.index(mention_type))))
+        parts.append((*cooccurrence_cube(rapp_matrix_para, topic_matrix_para, days), topic_types))
+
+        frames: list = []
+        for cube, labels, type_codes in parts:
+            cube = sparse.coo_matrix(cube)
+            keep = cube.data > 0
+            day, rapp = np.divmod(cube.row[keep], len(rapp_names))
+            frames.append(pd.DataFrame({'newsletter_date': labels[day],
+                                        'rapporteur': np.asarray(rapp_names, dtype=object)[rapp],
+                                        'mention_type': np.asarray(mention_types, dtype=object)[type_codes[cube.col[keep]]],
+                                        'mentions': cube.data[keep].astype(np.int64)}))
+
+        return cls(pd.concat(frames, ignore_index=True), days.dropna().unique(), rapp_names)
+
+    @classmethod
+    def merge(cls, cubes: list):
+        """ Returns the sum of cubes of different newsletters (None entries are skipped) """
+        cubes = [i for i in cubes if i is not None]
+        counts = pd.concat([i.counts for i in cubes], ignore_index=True)
+        counts = counts.groupby(['newsletter_date', 'rapporteur', 'mention_type'], sort=True)['mentions'].sum()\
+            .reset_index()
+        entities: list = list(dict.fromkeys(entity for i in cubes for entity in i.entities))
+
+        return cls(counts, np.concatenate([i.days.to_numpy() for i in cubes]), entities)
+
+    def total(self, mention_type: str = 'overall_total'):
+        """ Returns the number of mentions of one type over all days and entities """
+        return int(self.counts.loc[self.counts['mention_type'] == mention_type, 'mentions'].sum())
+
+    def _select(self, entities: list = None, types: list = None, start=None, end=None):
+        """ Returns the counts and days of the given entities, mention types and dates (both inclusive) """
+        counts, days = self.counts, self.days
+        if entities is not None:
+            counts = counts[counts['rapporteur'].isin(entities)]
+        if types is not None:
+            counts = counts[counts['mention_type'].isin(types)]
+        if start is not None:
+            counts, days = counts[counts['newsletter_date'] >= pd.Timestamp(start)], days[days >= pd.Timestamp(start)]
+        if end is not None:
+            counts, days = counts[counts['newsletter_date'] <= pd.Timestamp(end)], days[days <= pd.Timestamp(end)]
+
+        return counts, days
+
+    def _complete(self, sums: pd.Series, periods, entities: list, types: list):
+        """ Returns the long data frame of all periods x entities x types (missing: 0), sorted by type, period, entity """
+        grid = pd.MultiIndex.from_product([types, periods, sorted(entities)],
+                                          names=['mention_type', 'newsletter_date', 'rapporteur'])
+        long = sums.rename('mentions').reorder_levels(grid.names).reindex(grid, fill_value=0).reset_index()
+
+        return long[['newsletter_date', 'rapporteur', 'mention_type', 'mentions']].astype({'mentions': np.int64})
+
+    def rollup(self, freq: str = "Q", entities: list = None, types: list = None, start=None, end=None):
+        """ Returns the mentions per period (pandas frequency, e.g. 'W', 'M', 'Q', 'Y'), entity and mention type
+            (one row per period with at least one paragraph, entity and mention type; no mentions: 0)
+        :param freq: str
+        :param entities: list (None: all)
+        :param types: list of mention types (None: all, in the order overall_total, overall_paragraph, AIact, AIgen)
+        :param start: date-like or None
+        :param end: date-like or None (inclusive)
+        :return: pd.DataFrame with the columns 'newsletter_date' (Period), 'rapporteur', 'mention_type', 'mentions'
+        """
+        counts, days = self._select(entities, types, start, end)
+        sums = counts.groupby([counts['newsletter_date'].dt.to_period(freq), 'rapporteur', 'mention_type'])['mentions']\
+            .sum()
+
+        return self._complete(sums, days.to_period(freq).unique().sort_values(),
+                              self.entities if entities is None else entities,
+                              mention_types if types is None else types)
+
+    def rolling(self, window: int, freq: str = "D", entities: list = None, types: list = None, start=None,
+                end=None):
+        """ Returns the mentions in the last 'window' days (incl. the day itself) of every day between the first and
+            the last day, sampled at the end of every period of 'freq' (e.g. window 28, freq 'W': 4 weeks, weekly)
+        :param window: int; number of days
+        :param freq: str; pandas frequency of the rows ('D': every day)
+        :return: pd.DataFrame with the columns 'newsletter_date' (Period), 'rapporteur', 'mention_type', 'mentions'
+        """
+        counts, days = self._select(entities, types, start, end)
+        types: list = mention_types if types is None else types
+        entities = sorted(self.entities if entities is None else entities)
+        if len(days) == 0:
+            return self._complete(counts.set_index(['newsletter_date', 'rapporteur', 'mention_type'])['mentions'],
+                                  pd.PeriodIndex([], freq=freq), entities, types)
+
+        daily = counts.pivot_table(index='newsletter_date', columns=['mention_type', 'rapporteur'], values='mentions',
+                                   aggfunc='sum', fill_value=0)
+        daily = daily.reindex(index=pd.date_range(days.min(), days.max(), freq="D", name='newsletter_date'),
+                              columns=pd.MultiIndex.from_product([types, entities], names=['mention_type', 'rapporteur']),
+                              fill_value=0)
+        windowed = daily.rolling(window, min_periods=1).sum()
+        sampled = windowed.groupby(windowed.index.to_period(freq)).last()  # value at the end of every period
+
+        return self._complete(sampled.stack(['mention_type', 'rapporteur'], future_stack=True).astype(np.int64),
+                              sampled.index, entities, types)
+
+    def save(self, path: str):
+        """ Writes the cube to the directory 'path' (counts.parquet, days.parquet, entities.parquet) """
+        os.makedirs(path, exist_ok=True)
+        write_table(self.counts, os.path.join(path, "counts.parquet"), quarter_column='newsletter_date',
+                    categories=('rapporteur', 'mention_type'))
+        write_table(pd.DataFrame({'newsletter_date': self.days}), os.path.join(path, "days.parquet"),
+                    quarter_column='newsletter_date')
+        write_table(pd.DataFrame({'rapporteur': self.entities}), os.path.join(path, "entities.parquet"))
+
+    @classmethod
+    def load(cls, path: str, quarters: list = None):
+        """ Reads a cube written by save (only the given quarters, e.g. ['2022Q3'], if not None) """
+        counts = read_table(os.path.join(path, "counts.parquet"), quarters=quarters,
+                            columns=['newsletter_date', 'rapporteur', 'mention_type', 'mentions'])
+        counts = counts.astype({'rapporteur': object, 'mention_type': object})
+        days = read_table(os.path.join(path, "days.parquet"), quarters=quarters, columns=['newsletter_date'])
+
+        return cls(counts, days['newsletter_date'], read_table(os.path.join(path, "entities.parquet"))['rapporteur'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up the daily mention cube.")
+    parser.add_argument("--cube", default="./data/output_ready/mentions_daily_cube")
+    parser.add_argument("--per", default="Q", help="period (pandas frequency: D, W, M, Q, Y)")
+    parser.add_argument("--rolling", type=int, default=None, help="sum of the last N days, sampled once per period")
+    parser.add_argument("--entities", nargs="+", default=None)
+    parser.add_argument("--types", nargs="+", default=None, choices=mention_types)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    args = parser.parse_args()
+
+    starttime = timeit.default_timer()
+    cube = MentionCube.load(args.cube)
+    if args.rolling is None:
+        result = cube.rollup(args.per, entities=args.entities, types=args.types, start=args.start, end=args.end)
+    else:
+        result = cube.rolling(args.rolling, freq=args.per, entities=args.entities, types=args.types,
+                              start=args.start, end=args.end)
+
+    print(result.pivot_table(index='newsletter_date', columns=['mention_type', 'rapporteur'], values='mentions',
+                             aggfunc='sum').to_string())
+    print(f"Rollup took {(timeit.default_timer() - starttime) * 1000:.1f} ms.")
@@ -0,0 +1,314 @@
+"""
+    This file: provide an inverted index of the matched paragraphs and a local query command on top of it
+        the index maps every term (rapporteur id or topic name) to the ids of the paragraphs mentioning it
+        (posting lists) and every paragraph id to its newsletter id, date, position and text
+        it is written by 0-entity-retrieval_spacy.py to ./data/output_ready/mention_index/
+            meta.json            terms (in posting order), term types, number of paragraphs, date range
+            dates.npy            int32 days since 1970-01-01 per paragraph (paragraph ids are sorted by date)
+            newsletters.npy      int32 position of the newsletter id in newsletter_ids.json per paragraph
+            paragraph_pos.npy    int32 position of the paragraph within its newsletter
+            term_offsets.npy     int64; the postings of term t are postings[term_offsets[t]:term_offsets[t + 1]]
+            postings.npy         int32 sorted paragraph ids per term
+            text_offsets.npy     int64 byte offsets of the paragraph texts in texts.bin (utf-8)
+        the arrays are memory-mapped, so a query only reads the posting lists & dates it needs
+        only paragraphs with at least one match are indexed; when an index is written, paragraphs with a rapporteur or
+        a topic keyword pass the prefilter, so topic-only queries count all paragraphs mentioning the topic
+        paragraphs without any match are not indexed, so NOT is only defined relative to a term: a query must contain
+        a term that is not negated (e.g. 'benifei NOT AIgen'); queries such as 'NOT voss' are refused
+    queries are boolean expressions of terms with AND, OR, NOT and parentheses (adjacent terms: AND; terms are
+    case-insensitive; quote terms with spaces), restricted to a date range
+    usage (from the repository root):
+        python -m helpers.mention_index "benifei AND AIact" --start 2022-07-01 --end 2022-09-30 --per Q
+        python -m helpers.mention_index "(voss OR benifei) NOT AIgen" --paragraphs --limit 5
+"""
+
+import argparse
+import json
+import os
+import re
+import timeit
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def partial_mention_index(paragraphs: pd.DataFrame, matrices: list, names: list):
+    """ Takes in matched paragraphs and their binarised paragraph x pattern matrices. Returns the paragraphs with at
+        least one match (columns 'newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph') and the column
+        'terms' (tuple of the names of the patterns matched in the paragraph); partial indexes are concatenated
+        Example:
+            matrices: [csr([[1, 0], [0, 0]]), csr([[1], [0]])], names: [['benifei', 'voss'], ['AIact']]
+            return: 1 row (paragraph 0) with terms ('benifei', 'AIact')
+    :param paragraphs: pd.DataFrame (output of match_newsletter_paragraphs)
+    :param matrices: list of scipy.sparse matrices (n paragraphs x len(names[i]))
+    :param names: list of lists of term names (one per column of each matrix)
+    :return: pd.DataFrame
+    """
+    combined = sparse.csr_matrix(sparse.hstack(matrices, format="csr"))
+    combined.eliminate_zeros()
+    rows: np.ndarray = np.flatnonzero(np.diff(combined.indptr) > 0)
+
+    term_names = np.asarray([name for lst in names for name in lst], dtype=object)
+    terms: list = [tuple(term_names[combined.indices[combined.indptr[row]:combined.indptr[row + 1]]]) for row in rows]
+
+    index_paragraphs = paragraphs.iloc[rows][['newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph']]\
+        .reset_index(drop=True)
+    index_paragraphs['terms'] = terms
+
+    return index_paragraphs
+
+
+def write_mention_index(index_paragraphs: pd.DataFrame, path: str, term_types: dict = None):
+    """ Writes the inverted index of the indexed paragraphs (output of partial_mention_index, merged) to the directory
+        'path' (see above); an existing index is replaced
+    :param index_paragraphs: pd.DataFrame
+    :param path: str
+    :param term_types: dict (term: type, e.g. {'benifei': 'rapporteur', 'AIact': 'topic'})
+    """
+    index_paragraphs = index_paragraphs.sort_values(['newsletter_date', 'newsletter_id', 'paragraph_pos'], kind='stable')\
+        .reset_index(drop=True)
+    days: np.ndarray = (index_paragraphs['newsletter_date'].to_numpy().astype('datetime64[D]')
+                        .astype(np.int64)).astype(np.int32)
+    newsletter_codes, newsletter_ids = pd.factorize(index_paragraphs['newsletter_id'])
+
+    # postings: (term, paragraph id) pairs sorted by term, then paragraph id
+    lengths = index_paragraphs['terms'].apply(len).to_numpy()
+    term_codes, terms = pd.factorize(np.asarray([term for lst in index_paragraphs['terms'] for term in lst], dtype=object),
+                                     sort=True)
+    paragraph_ids = np.repeat(np.arange(index_paragraphs.shape[0], dtype=np.int32), lengths)
+    order = np.lexsort((paragraph_ids, term_codes))
+    term_offsets = np.concatenate([[0], np.cumsum(np.bincount(term_codes, minlength=len(terms)))]).astype(np.int64)
+
+    texts: list = [text.encode("utf-8") for text in index_paragraphs['paragraph']]
+    text_offsets = np.concatenate([[0], np.cumsum([len(text) for text in texts], dtype=np.int64)]).astype(np.int64)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "dates.npy"), days)
+    np.save(os.path.join(path, "newsletters.npy"), newsletter_codes.astype(np.int32))
+    np.save(os.path.join(path, "paragraph_pos.npy"), index_paragraphs['paragraph_pos'].to_numpy().astype(np.int32))
+    np.save(os.path.join(path, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(path, "postings.npy"), paragraph_ids[order])
+    np.save(os.path.join(path, "text_offsets.npy"), text_offsets)
+    with open(os.path.join(path, "texts.bin"), "wb") as f:
+        f.write(b"".join(texts))
+    with open(os.path.join(path, "newsletter_ids.json"), "w", encoding="utf-8") as f:
+        json.dump([str(i) for i in newsletter_ids], f)
+
+    meta: dict = {'terms': list(terms), 'term_types': {term: (term_types or {}).get(term) for term in terms},
+                  'n_paragraphs': int(index_paragraphs.shape[0]),
+                  'first_date': str(np.datetime64(int(days.min()), 'D')) if len(days) > 0 else None,
+                  'last_date': str(np.datetime64(int(days.max()), 'D')) if len(days) > 0 else None}
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:  # written last: marks a complete index
+        json.dump(meta, f, indent=2)
+
+
+_token_pattern = re.compile(r'\(|\)|"[^"]*"|[^\s()]+')
+
+
+def parse_query(expression: str):
+    """ Parses a boolean query into a nested tuple
+        Example:
+            expression: 'benifei AND (AIact OR AIgen) NOT voss'
+            return: ('and', ('and', ('term', 'benifei'), ('or', ('term', 'AIact'), ('term', 'AIgen'))), ('not', ('term', 'voss')))
+    :param expression: str
+    :return: tuple
+    """
+    matches: list = list(_token_pattern.finditer(expression))
+    tokens: list = [i.group() for i in matches]
+    pos: int = 0
+
+    def where():
+        return f"character {matches[pos].start() + 1}" if pos < len(tokens) else "the end"
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        node = parse_and()
+        while peek() is not None and peek().upper() == "OR":
+            pos += 1
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        nonlocal pos
+        node = parse_not()
+        while peek() is not None and peek() != ")" and peek().upper() != "OR":
+            if peek().upper() == "AND":
+                pos += 1
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        nonlocal pos
+        if peek() is not None and peek().upper() == "NOT":
+            pos += 1
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        nonlocal pos
+        token = peek()
+        if token is None or token == ")" or token.upper() in ("AND", "OR"):
+            raise ValueError(f"Expected a term or '(' at {where()} of the query '{expression}'.")
+        pos += 1
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError(f"Missing ')' at {where()} of the query '{expression}'.")
+            pos += 1
+            return node
+        return ('term', token.strip('"'))
+
+    tree = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Unexpected '{tokens[pos]}' at {where()} of the query '{expression}'.")
+
+    return tree
+
+
+class MentionIndex:
+    """ Read access to an inverted index written by write_mention_index (arrays are memory-mapped)
+        Example:
+            index = MentionIndex("./data/output_ready/mention_index")
+            index.counts("benifei AND AIact", freq="Q", start="2022-01-01")
+            index.paragraphs(index.query("benifei AND AIact", start="2022-07-01", end="2022-09-30"))
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta: dict = json.load(f)
+        with open(os.path.join(path, "newsletter_ids.json"), "r", encoding="utf-8") as f:
+            self.newsletter_ids: list = json.load(f)
+
+        self.path: str = path
+        self.terms: list = self.meta['terms']
+        self._term_pos: dict = {term.lower(): pos for pos, term in enumerate(self.terms)}
+        for name in ["dates", "newsletters", "paragraph_pos", "term_offsets", "postings", "text_offsets"]:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode='r'))
+
+    def __len__(self):
+        return self.meta['n_paragraphs']
+
+    def id_range(self, start=None, end=None):
+        """ Returns the paragraph ids [first, last) of the paragraphs dated between start and end (both inclusive) """
+        first: int = 0 if start is None else int(np.searchsorted(self.dates, _day(start), side='left'))
+        last: int = len(self) if end is None else int(np.searchsorted(self.dates, _day(end), side='right'))
+        return first, max(first, last)
+
+    def postings_of(self, term: str, first: int = 0, last: int = None):
+        """ Returns the sorted ids of the paragraphs in [first, last) mentioning the term """
+        if term.lower() not in self._term_pos:
+            raise ValueError(f"Unknown term '{term}'; known terms: {', '.join(self.terms)}.")
+
+        pos: int = self._term_pos[term.lower()]
+        postings = self.postings[self.term_offsets[pos]:self.term_offsets[pos + 1]]
+        last = len(self) if last is None else last
+
+        return np.asarray(postings[np.searchsorted(postings, first, side='left'):np.searchsorted(postings, last, side='left')])
+
+    def query(self, expression: str, start=None, end=None):
+        """ Returns the sorted ids of the paragraphs dated between start and end that match the boolean expression
+        :param expression: str, e.g. 'benifei AND (AIact OR AIgen)'
+        :param start: date-like or None
+        :param end: date-like or None (inclusive)
+        :return: np.ndarray
+        """
+        tree = parse_query(expression)
+        if not _anchored(tree):
+            raise ValueError(f"The query '{expression}' also selects paragraphs without any rapporteur or topic match, "
+                             f"which are not indexed; combine NOT with a term, e.g. 'benifei NOT AIgen'.")
+        first, last = self.id_range(start, end)
+
+        def evaluate(node):
+            if node[0] == 'term':
+                return self.postings_of(node[1], first, last)
+            elif node[0] == 'and':
+                return np.intersect1d(evaluate(node[1]), evaluate(node[2]), assume_unique=True)
+            elif node[0] == 'or':
+                return np.union1d(evaluate(node[1]), evaluate(node[2]))
+            return np.setdiff1d(np.arange(first, last, dtype=np.int32), evaluate(node[1]), assume_unique=True)
+
+        return evaluate(tree).astype(np.int32)
+
+    def counts(self, expression: str, freq: str = "Q", start=None, end=None):
+        """ Returns the number of paragraphs matching the expression per period (pandas frequency, e.g. 'D', 'W', 'M',
+            'Q', 'Y'); periods between the first and the last match without matches count 0
+        :return: pd.Series (index: pd.PeriodIndex named 'newsletter_date')
+        """
+        dates = pd.to_datetime(np.asarray(self.dates[self.query(expression, start, end)]).astype('datetime64[D]'))
+        counts = pd.Series(1, index=dates).groupby(dates.to_period(freq)).sum()
+
+        if counts.shape[0] > 0:
+            counts = counts.reindex(pd.period_range(counts.index.min(), counts.index.max(), freq=counts.index.freq),
+                                    fill_value=0)
+
+        return counts.rename_axis('newsletter_date').rename('paragraphs').astype(np.int64)
+
+    def paragraphs(self, ids):
+        """ Returns the newsletter id, date, paragraph position & text of the paragraphs with the given ids """
+        ids = np.asarray(ids, dtype=np.int64)
+        texts: list = []
+        with open(os.path.join(self.path, "texts.bin"), "rb") as f:
+            for i in ids:
+                f.seek(int(self.text_offsets[i]))
+                texts.append(f.read(int(self.text_offsets[i + 1] - self.text_offsets[i])).decode("utf-8"))
+
+        return pd.DataFrame({'newsletter_id': [self.newsletter_ids[i] for i in np.asarray(self.newsletters[ids])],
+                             'newsletter_date': pd.to_datetime(np.asarray(self.dates[ids]).astype('datetime64[D]')),
+                             'paragraph_pos': np.asarray(self.paragraph_pos[ids]),
+                             'paragraph': texts}, index=pd.Index(ids, name='paragraph_id'))
+
+
+def _anchored(node):
+    """ Returns True if every paragraph matching the parsed query mentions at least one of its terms (no NOT-only
+        branch), i.e. the query can be answered from the indexed paragraphs """
+    if node[0] == 'term':
+        return True
+    elif node[0] == 'and':
+        return _anchored(node[1]) or _anchored(node[2])
+    elif node[0] == 'or':
+        return _anchored(node[1]) and _anchored(node[2])
+    return False
+
+
+def _day(date):
+    """ Returns a date-like value as days since 1970-01-01 """
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the inverted index of the matched paragraphs.")
+    parser.add_argument("query", help="boolean query of terms, e.g. 'benifei AND (AIact OR AIgen)'")
+    parser.add_argument("--index", default="./data/output_ready/mention_index")
+    parser.add_argument("--start", default=None, help="first date (inclusive), e.g. 2022-07-01")
+    parser.add_argument("--end", default=None, help="last date (inclusive), e.g. 2022-09-30")
+    parser.add_argument("--per", default="Q", help="period of the counts (pandas frequency: D, W, M, Q, Y)")
+    parser.add_argument("--paragraphs", action="store_true", help="print the matching paragraphs instead of counts")
+    parser.add_argument("--limit", type=int, default=20, help="maximum number of paragraphs printed")
+    args = parser.parse_args()
+
+    starttime = timeit.default_timer()
+    index = MentionIndex(args.index)
+    try:  # malformed query or unknown term: usage error
+        if not _anchored(parse_query(args.query)):
+            parser.error(f"'{args.query}' needs paragraphs without matches, which are not indexed; "
+                         f"combine NOT with a term, e.g. 'benifei NOT AIgen'.")
+        if args.paragraphs:
+            ids = index.query(args.query, start=args.start, end=args.end)
+        else:
+            counts = index.counts(args.query, freq=args.per, start=args.start, end=args.end)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.paragraphs:
+        for paragraph_id, row in index.paragraphs(ids[:args.limit]).iterrows():
+            print(f"[{row['newsletter_date'].date()} | newsletter {row['newsletter_id']} | paragraph {row['paragraph_pos']}] {row['paragraph']}")
+        print(f"{len(ids)} paragraphs match (showing {min(len(ids), args.limit)}).")
+    else:
+        print(counts.to_string())
+        print(f"{counts.sum()} paragraphs match.")
+
+    print(f"Query took {(timeit.default_timer() - starttime) * 1000:.1f} ms.")
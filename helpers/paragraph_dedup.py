@@ -0,0 +1,58 @@
+"""
+    This file: provide the paragraph deduplication of match_newsletter_paragraphs
+        newsletters repeat a lot of identical paragraphs (sign-offs, sponsor blocks, recurring headers); every distinct
+        paragraph text is prefiltered, parsed and matched once per chunk and its match results are fanned out to all
+        its occurrences (each with its own newsletter id & date), so all counts stay the same
+        ParagraphCache keeps the match results of distinct paragraphs (keyed by content hash) across the chunks of a
+        run (one cache per process and set of matchers), so a repeated paragraph is matched once per run
+        dedup_summary turns the stage records of a run into the dedup ratio and an estimate of the time saved
+"""
+
+from helpers.docbin_cache import text_hash
+
+
+class ParagraphCache:
+    """ Match results of distinct paragraph texts, shared by all chunks of a run
+        Example:
+            paragraph_cache = ParagraphCache()
+            match_newsletter_paragraphs(newsletters, nlp, matchers, paragraph_cache=paragraph_cache)  # for every chunk
+    """
+
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries: int = max_entries  # memory bound: results of further paragraphs are not kept
+        self.results: dict = {}  # content hash: dict of results (column name: value)
+
+    def get(self, texts: list):
+        """ Returns the cached results of every text (None if not cached) """
+        return [self.results.get(text_hash(text)) for text in texts]
+
+    def put(self, texts: list, results: list):
+        """ Caches the results of the texts (as long as the cache is not full) """
+        for text, result in zip(texts, results):
+            if len(self.results) >= self.max_entries:
+                break
+            self.results[text_hash(text)] = result
+
+
+def dedup_summary(stages: dict):
+    """ Takes in the stage records of a run (RunMetrics.stages). Returns the deduplication statistics
+            'paragraphs':              number of paragraphs (after splitting)
+            'processed':               number of paragraphs prefiltered, parsed & matched (distinct, not cached)
+            'dedup_ratio':             share of paragraphs that were not processed
+            'estimated_seconds_saved': wall time of prefilter, parse & match per processed paragraph x paragraphs
+                                       not processed
+        returns None if the run has no 'dedup' stage
+    :param stages: dict
+    :return: dict or None
+    """
+    if 'dedup' not in stages or not stages['dedup']['rows_in']:
+        return None
+
+    n_paragraphs: int = stages['dedup']['rows_in']
+    n_processed: int = stages['dedup']['rows_out']
+    seconds: float = sum(record['wall_seconds'] for name, record in stages.items()
+                         if name in ('prefilter', 'parse') or name.startswith('match_'))
+
+    return {'paragraphs': n_paragraphs, 'processed': n_processed,
+            'dedup_ratio': 1 - n_processed / n_paragraphs,
+            'estimated_seconds_saved': seconds / n_processed * (n_paragraphs - n_processed) if n_processed > 0 else 0.0}
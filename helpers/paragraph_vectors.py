@@ -0,0 +1,120 @@
+"""
+    This file: provide the paragraph vectors of all paragraphs parsed in 0-entity-retrieval_spacy.py
+        the vector of a paragraph is the mean of the static word vectors of its tokens (as doc.vector of spaCy
+        models with vectors, e.g. en_core_web_lg; tokens without a vector count as zeros)
+        they are computed while matching (see helpers/match_newsletter_paragraphs.py): all vectors of a chunk at once
+        from the ORTH column of its TokenStore, i.e. a sparse paragraph x vector-row count matrix times the vector
+        table (no per-token Python work, no n tokens x dimensions intermediate)
+        every parsed paragraph (prefilter candidate) gets a vector, keyed by newsletter id and paragraph position like
+        the mention index (see helpers/mention_index.py); partial vectors of chunks, workers and runs are concatenated
+        they are saved as one float32 matrix (sorted by date) and its keys, and memory-mapped when loaded
+            <path>/keys.parquet    newsletter_id, paragraph_pos, newsletter_date (row i: vector i)
+            <path>/vectors.npy     float32 paragraph vectors
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from helpers.parquet_tables import read_table, write_table
+from helpers.token_store import TokenStore
+
+
+def has_vectors(nlp):
+    """ Returns True if the pipeline has static word vectors (e.g. en_core_web_lg; not en_core_web_sm or blank) """
+    return nlp.vocab.vectors.shape[0] > 0 and nlp.vocab.vectors.shape[1] > 0
+
+
+def paragraph_vectors(store: TokenStore, vectors, attr: str = "ORTH"):
+    """ Returns the mean word vector of every document of the store (float32 matrix, n documents x dimensions)
+        Example:
+            paragraph_vectors(TokenStore.from_docs(docs, attrs=("ORTH", )), nlp.vocab.vectors)
+            return: np.ndarray equal to np.stack([doc.vector for doc in docs])
+    :param store: TokenStore with the column 'attr'
+    :param vectors: spacy.vectors.Vectors (nlp.vocab.vectors)
+    :param attr: str; key of the vectors (spaCy looks vectors up by ORTH)
+    :return: np.ndarray
+    """
+    table = np.asarray(vectors.data, dtype=np.float32)
+    rows = np.asarray(vectors.find(keys=np.asarray(store.columns[attr], dtype=np.uint64)), dtype=np.int64)
+    known = rows >= 0
+
+    counts = sparse.csr_matrix((np.ones(known.sum(), dtype=np.float32), (store.token_docs()[known], rows[known])),
+                               shape=(len(store), table.shape[0]))
+    lengths = np.diff(store.doc_offsets).astype(np.float32)
+
+    return (np.asarray(counts @ table, dtype=np.float32) / np.maximum(lengths, 1)[:, None]).astype(np.float32)
+
+
+def partial_paragraph_vectors(paragraphs: pd.DataFrame):
+    """ Takes in matched paragraphs with the column 'vector' (see match_newsletter_paragraphs). Returns the parsed
+        paragraphs (columns 'newsletter_id', 'paragraph_pos', 'newsletter_date', 'vector'); paragraphs that were not
+        parsed (vector None) are dropped
+    :param paragraphs: pd.DataFrame
+    :return: pd.DataFrame
+    """
+    parsed: np.ndarray = paragraphs['vector'].notna().to_numpy()
+
+    return paragraphs.loc[parsed, ['newsletter_id', 'paragraph_pos', 'newsletter_date', 'vector']].reset_index(drop=True)
+
+
+def save_paragraph_vectors(vector_paragraphs: pd.DataFrame, path: str):
+    """ Writes the paragraph vectors (output of partial_paragraph_vectors, merged) to the directory 'path' (see above);
+        existing vectors are replaced
+    :param vector_paragraphs: pd.DataFrame
+    :param path: str
+    """
+    vector_paragraphs = vector_paragraphs.sort_values(['newsletter_date', 'newsletter_id', 'paragraph_pos'], kind='stable')\
+        .reset_index(drop=True)
+    matrix = np.stack(vector_paragraphs['vector'].tolist()).astype(np.float32) if vector_paragraphs.shape[0] > 0 \
+        else np.zeros((0, 0), dtype=np.float32)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "vectors.npy"), matrix)
+    write_table(vector_paragraphs[['newsletter_id', 'paragraph_pos', 'newsletter_date']], os.path.join(path, "keys.parquet"))
+
+
+def remove_paragraph_vectors(path: str):
+    """ Removes the paragraph vectors in 'path' (e.g. of an earlier run with a model with vectors) """
+    for name in ("vectors.npy", "keys.parquet"):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+
+
+def load_paragraph_vectors(path: str, mmap: bool = True):
+    """ Loads the paragraph vectors saved by save_paragraph_vectors. Returns (keys, vectors) or None if there are none
+    :param path: str
+    :param mmap: bool
+    :return: tuple (pd.DataFrame, np.ndarray) or None
+    """
+    if not os.path.exists(os.path.join(path, "keys.parquet")):
+        return None
+
+    keys = read_table(os.path.join(path, "keys.parquet"), columns=['newsletter_id', 'paragraph_pos', 'newsletter_date'])
+
+    return keys, np.load(os.path.join(path, "vectors.npy"), mmap_mode='r' if mmap else None)
+
+
+def vectors_of(paragraphs: pd.DataFrame, keys: pd.DataFrame, vectors):
+    """ Returns the vectors of the given paragraphs (one row per row of 'paragraphs', matched on newsletter id and
+        paragraph position; paragraphs without a vector get zeros, which helpers/topic_clusters.py ignores)
+        Example:
+            keys, vectors = load_paragraph_vectors("./data/preprocessed/paragraph_vectors")
+            vectors_of(topic_paragraphs, keys, vectors)
+    :param paragraphs: pd.DataFrame with columns 'newsletter_id' and 'paragraph_pos'
+    :param keys: pd.DataFrame (see load_paragraph_vectors)
+    :param vectors: np.ndarray (may be memory-mapped)
+    :return: np.ndarray (float32)
+    """
+    columns: list = ['newsletter_id', 'paragraph_pos']
+    positions = pd.Series(np.arange(keys.shape[0]), index=pd.MultiIndex.from_frame(keys[columns]))
+    positions = positions[~positions.index.duplicated(keep='first')]
+    rows = positions.reindex(pd.MultiIndex.from_frame(paragraphs[columns])).to_numpy()
+    found = ~np.isnan(rows)
+
+    result = np.zeros((paragraphs.shape[0], vectors.shape[1]), dtype=np.float32)
+    result[found] = vectors[rows[found].astype(np.int64)]
+
+    return result
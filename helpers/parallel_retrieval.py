@@ -0,0 +1,130 @@
+"""
+    This file: provide a process-parallel (map-reduce) runner for the retrieval in 0-entity-retrieval_spacy.py
+        map:    the newsletters are streamed from the JSON file in chunks (i.e. partitioned by position in the file,
+                which is a date range for a chronological archive); every chunk is sent to a worker process that runs
+                split -> prefilter -> parse -> match -> per-quarter partial aggregation
+        reduce: the main process merges the partial aggregates (see merge_partial_aggregates)
+    every worker loads the spaCy pipeline and compiles the matchers once (from picklable pattern dicts)
+    the stage metrics of every chunk (see helpers/run_metrics.py) are sent back and added to the metrics of the run
+"""
+
+import multiprocessing
+import os
+import timeit
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from helpers.docbin_cache import DocBinCache
+from helpers.entity_catalogue import build_matcher, build_phrase_matcher
+from helpers.keyword_prefilter import build_keyword_automaton
+from helpers.load_spacy_pipeline import load_spacy_pipeline
+from helpers.match_newsletter_paragraphs import match_newsletter_paragraphs
+from helpers.paragraph_dedup import ParagraphCache
+from helpers.quarterly_aggregates import merge_partial_aggregates, partial_quarterly_aggregates
+from helpers.read_json_records import read_json_chunks
+from helpers.run_metrics import RunMetrics
+
+_worker: dict = {}  # pipeline, matchers & settings of the current worker process
+
+
+def _init_worker(config: dict):
+    """ Loads the spaCy pipeline and compiles the matchers of a worker process (see run_parallel_retrieval) """
+    nlp = load_spacy_pipeline(model=config['spacy_model'], mode=config['matching_mode'])
+
+    _worker['nlp'] = nlp
+    _worker['config'] = config
+    _worker['matchers'] = {'topic': build_matcher(nlp.vocab, config['topic_patterns'], engine=config['matching_engine']),
+                           'rapp': build_phrase_matcher(nlp.vocab, config['rapp_phrases'], engine=config['matching_engine'])}
+    _worker['automaton'] = build_keyword_automaton(config['prefilter_keywords']) if config['use_prefilter'] else None
+    _worker['doc_cache'] = DocBinCache(nlp, cache_dir=config['cache_dir']) if config['cache_dir'] is not None else None
+    _worker['paragraph_cache'] = ParagraphCache()  # paragraphs repeated across the chunks of this worker
+
+
+def _retrieve_chunk(newsletters):
+    """ Map step: returns the partial aggregates, the number of paragraphs and the stage metrics of one chunk """
+    config: dict = _worker['config']
+    metrics = RunMetrics(profile_stage=config['profile_stage'],
+                         profile_dir=os.path.join(config['profile_dir'], f"worker-{os.getpid()}"))
+
+    paragraphs = match_newsletter_paragraphs(newsletters, _worker['nlp'], matchers=_worker['matchers'],
+                                             automaton=_worker['automaton'], require=config['prefilter_require'],
+                                             doc_cache=_worker['doc_cache'], split_on=config['split_on'],
+                                             sentences=config['cooccurrence_window'] is not None,
+                                             vectors=config['with_vectors'],
+                                             paragraph_cache=_worker['paragraph_cache'], metrics=metrics,
+                                             batch_size=config['pipe_batch_size'])
+
+    with metrics.stage("aggregate", rows_in=paragraphs.shape[0]) as record:
+        aggregates: dict = partial_quarterly_aggregates(paragraphs, config['topic_values'], config['topic_colmapper'],
+                                                        config['rapp_values'], config['rapp_names'],
+                                                        window=config['cooccurrence_window'], with_index=config['with_index'],
+                                                        with_vectors=config['with_vectors'])
+        record['rows_out'] = aggregates['topic_paragraphs_rapp'].shape[0]
+
+    return aggregates, paragraphs.shape[0], metrics.stages
+
+
+def run_parallel_retrieval(newsletters_path: str, config: dict, n_workers: int = None, chunksize: int = 250,
+                           skip_ids: set = frozenset(), metrics=None):
+    """ Runs the retrieval on all newsletters of 'newsletters_path' with a pool of 'n_workers' processes
+        takes in
+            'newsletters_path' (str) JSON array or JSON Lines file
+            'config' (dict) with the keys
+                'spacy_model', 'matching_mode', 'matching_engine', 'pipe_batch_size', 'split_on', 'cache_dir' (None: no DocBin cache),
+                'use_prefilter', 'prefilter_keywords', 'prefilter_require', 'topic_patterns', 'topic_values', 'topic_colmapper',
+                'rapp_phrases', 'rapp_values', 'rapp_names', 'cooccurrence_window' (None: co-occurrence per paragraph),
+                'with_index' (build the paragraphs of the mention index),
+                'with_vectors' (keep the vectors of the parsed paragraphs; the model needs word vectors),
+                'profile_stage' (None: no profiling), 'profile_dir' (one sub-directory per worker process)
+            'n_workers' (int) number of worker processes (default: number of CPUs)
+            'chunksize' (int) number of newsletters per task
+            'skip_ids' (set) newsletter ids not to process (e.g. processed in a previous run)
+            'metrics' (RunMetrics) the stage metrics of all workers are added to it (times are summed over workers)
+        returns
+            merged partial aggregates (see partial_quarterly_aggregates) of all processed newsletters
+            list of all newsletter ids in the order of the file (incl. skipped ones)
+        at most 2 x n_workers chunks are in flight, so memory is bounded by the chunk size
+        the script is not import-safe, so the pool is forked where possible
+    :return: tuple (dict, list)
+    """
+    starttime = timeit.default_timer()
+
+    n_workers = n_workers if n_workers is not None else multiprocessing.cpu_count()
+    mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+
+    partials: list = []
+    newsletter_order: list = []
+    n_paragraphs: int = 0
+
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context,
+                             initializer=_init_worker, initargs=(config, )) as pool:
+        pending: set = set()
+
+        for newsletters in read_json_chunks(newsletters_path, columns=('id', 'date', 'text'), chunksize=chunksize):
+            newsletter_order.extend(newsletters['id'].tolist())
+            newsletters = newsletters.loc[~newsletters['id'].isin(skip_ids), :]  # skip processed newsletters
+
+            if newsletters.shape[0] == 0:
+                continue
+
+            if len(pending) >= 2 * n_workers:  # bound the number of chunks in flight
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    aggregates, n_chunk, stages = future.result()
+                    partials.append(aggregates)
+                    n_paragraphs += n_chunk
+                    if metrics is not None:
+                        metrics.merge(stages)
+
+            pending.add(pool.submit(_retrieve_chunk, newsletters))
+
+        for future in pending:
+            aggregates, n_chunk, stages = future.result()
+            partials.append(aggregates)
+            n_paragraphs += n_chunk
+            if metrics is not None:
+                metrics.merge(stages)
+
+    print(f"{n_workers} workers split, parsed and matched {n_paragraphs} paragraphs in "
+          f"{timeit.default_timer() - starttime:.3f} seconds.")
+
+    return merge_partial_aggregates(partials), newsletter_order
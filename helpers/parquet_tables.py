@@ -0,0 +1,82 @@
+"""
+    This file: provide functions to write and read the tables passed between the stages as typed, compressed Parquet
+        (read by 1-retrieval-words.py and 2-visualize.R instead of CSVs with a stray index column)
+        quarterly tables get a string column 'quarter' (e.g. '2022Q3'); Period columns are stored as the first day of
+        the period (date), repeated strings (e.g. rapporteur, mention type) as categories (dictionary-encoded)
+        large quarterly tables are partitioned by quarter (hive layout: <path>/quarter=2022Q3/part-0.parquet),
+        small ones are single files; both are read the same way (pyarrow datasets / arrow::open_dataset in R)
+        reading loads only the requested columns; filters on 'quarter' skip the other partitions and filters on
+        other columns skip row groups by their statistics (predicate pushdown)
+            read_table("./data/output_ready/mentions_qrtr_rapp_type.parquet", columns=['rapporteur', 'mentions'],
+                       quarters=['2022Q3', '2022Q4'])
+            R: open_dataset("./data/output_ready/mentions_qrtr_rapp_type.parquet") %>%
+                   filter(quarter %in% c("2022Q3", "2022Q4")) %>% select(rapporteur, mentions) %>% collect()
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+def write_table(df: pd.DataFrame, path: str, quarter_column: str = None, partition: bool = False,
+                categories: tuple = (), compression: str = "zstd"):
+    """ Writes a data frame as Parquet to 'path' (a file, or a directory if partitioned); an existing table is replaced
+        Example:
+            write_table(rapp_q_mentions_long, "./data/output_ready/mentions_qrtr_rapp_type.parquet",
+                        quarter_column='newsletter_date', categories=('rapporteur', 'mention_type'))
+    :param df: pd.DataFrame (the index is not written)
+    :param path: str
+    :param quarter_column: str; date or Period column from which the column 'quarter' is derived (None: no quarter)
+    :param partition: bool; partition by 'quarter' (needs quarter_column)
+    :param categories: tuple of columns stored as categories
+    :param compression: str, e.g. 'zstd', 'snappy'
+    """
+    df = df.reset_index(drop=True)
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.PeriodDtype):
+            df[column] = df[column].dt.start_time.astype('datetime64[s]')
+    if quarter_column is not None:
+        df[quarter_column] = pd.to_datetime(df[quarter_column])
+        df['quarter'] = df[quarter_column].dt.to_period("Q").astype(str)
+    for column in categories:
+        df[column] = df[column].astype('category')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.cast(pa.schema([pa.field(field.name, pa.date32()) if pa.types.is_timestamp(field.type) else field
+                                  for field in table.schema], metadata=table.schema.metadata))  # dates without time
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if partition:
+        if quarter_column is None:
+            raise ValueError("Partitioning needs a quarter_column.")
+        ds.write_dataset(table, path, format="parquet", partitioning=["quarter"], partitioning_flavor="hive",
+                         file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+                         basename_template="part-{i}.parquet", existing_data_behavior="delete_matching")
+    else:
+        pq.write_table(table, path, compression=compression)
+
+
+def read_table(path: str, columns: list = None, quarters: list = None, filters=None):
+    """ Reads a table written by write_table. Returns a data frame with the requested columns and rows
+        Example:
+            read_table("./data/preprocessed/quarterly-topics", columns=['rapporteur', 'paragraph'], quarters=['2022Q3'])
+    :param path: str
+    :param columns: list of columns (None: all)
+    :param quarters: list of quarters, e.g. ['2022Q3'] (None: all)
+    :param filters: pyarrow.dataset expression, e.g. pyarrow.dataset.field('mentions') > 0
+    :return: pd.DataFrame
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+
+    if quarters is not None:
+        quarter_filter = ds.field('quarter').isin([str(i) for i in quarters])
+        filters = quarter_filter if filters is None else filters & quarter_filter
+
+    return dataset.to_table(columns=columns, filter=filters).to_pandas(date_as_object=False)
@@ -0,0 +1,180 @@
+"""
+    This file: provide functions to merge partial quarterly aggregates and to store them between runs
+        partial mention counts are daily mention cubes (see helpers/mention_cube.py; rolled up to quarters or any other
+        period when written); counts of different sets of newsletters are merged by adding them, so that
+            merge(counts(newsletters A), counts(newsletters B)) == counts(newsletters A and B)
+        partial aggregates (mention counts and the non-AI rapporteur paragraphs) of any partition of the newsletters
+        (chunks, worker processes, previous runs) are merged with merge_partial_aggregates
+        the state of the incremental mode (processed newsletter ids and partial aggregates) is stored in one pickle file
+        co-occurrence counts (see helpers/cooccurrence.py) are long data frames; they are merged by summing per key
+        the matched paragraphs of the mention index (see helpers/mention_index.py) are concatenated; they hold the text
+        of every matched paragraph, so they are only built if an index is written (with_index)
+        the vectors of the parsed paragraphs (see helpers/paragraph_vectors.py) are concatenated as well; they are only
+        kept if vectors are written (with_vectors)
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from helpers.cooccurrence import cooccurrence_cube, cooccurrence_long, unit_matrices
+from helpers.mention_cube import MentionCube
+from helpers.mention_index import partial_mention_index
+from helpers.paragraph_vectors import partial_paragraph_vectors
+from helpers.sparse_match_matrix import binarize_sparse, sparse_match_matrix
+
+
+def merge_cooccurrence(frames: list):
+    """ Takes in long co-occurrence data frames (see cooccurrence_long) of different paragraphs. Returns their sum
+        (one row per quarter and pair, sorted)
+    :param frames: list of pd.DataFrame with the same columns (3 keys & 'cooccurrences')
+    :return: pd.DataFrame
+    """
+    merged = pd.concat(frames, ignore_index=True)
+    return merged.groupby(list(merged.columns[:3]), sort=True)['cooccurrences'].sum().reset_index()
+
+
+def partial_quarterly_aggregates(paragraphs: pd.DataFrame, topic_values: tuple, topic_colmapper: dict,
+                                 rapp_values: tuple, rapp_names: list, window: int = None, with_index: bool = True,
+                                 with_vectors: bool = False):
+    """ Takes in matched paragraphs (output of match_newsletter_paragraphs). Returns their partial aggregates
+            'mention_cube':          MentionCube of the daily mention counts per rapporteur and mention type
+            'cooccurrence':          dict of long co-occurrence counts per quarter (see helpers/cooccurrence.py)
+                                     'rapporteur_topic' & 'rapporteur_rapporteur' (units: paragraphs or sentence windows)
+            'topic_paragraphs':      paragraphs mentioning a rapporteur but not AI(act)
+                                     (columns 'newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph')
+            'topic_paragraphs_rapp': one row per such paragraph and rapporteur mentioned in it (+ column 'rapporteur')
+            'mention_index':         paragraphs with a rapporteur or topic match and their terms (see partial_mention_index);
+                                     None without with_index
+            'paragraph_vectors':     parsed paragraphs and their vectors (see partial_paragraph_vectors); None without
+                                     with_vectors
+    :param paragraphs: pd.DataFrame with columns 'newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph',
+                       'matches_topic' and 'matches_rapp' (and 'vector' with with_vectors)
+    :param topic_values: tuple of topic match ids
+    :param topic_colmapper: dict (topic match id: topic name, i.e. 'AIgen' or 'AIact')
+    :param rapp_values: tuple of rapporteur match ids
+    :param rapp_names: list of rapporteur names (in the order of rapp_values)
+    :param window: int; co-occurrence within blocks of 'window' sentences (needs the column 'sentence_starts');
+                   None: within paragraphs
+    :param with_index: bool; build the paragraphs of the mention index
+    :param with_vectors: bool; keep the vectors of the parsed paragraphs
+    :return: dict
+    """
+    # aggregate matches: paragraph x pattern count matrices
+    topic_matrix_para = binarize_sparse(sparse_match_matrix(paragraphs['matches_topic'], topic_values))  # count each paragraph mentioning a topic only once
+    rapp_matrix = sparse_match_matrix(paragraphs['matches_rapp'], tuple(rapp_values))
+
+    quarters: pd.Series = paragraphs['newsletter_date'].dt.to_period("Q")  # grouping variable (one per paragraph)
+    rapp_matrix_para = binarize_sparse(rapp_matrix)  # each paragraph counts once per rapporteur
+
+    # daily mentions: overall (mere name count), paragraph (each paragraph counts once) and AIact & AIgen (paragraphs
+    # containing both the rapporteur and the topic); rolled up to quarters when written
+    mention_cube = MentionCube.from_matrices(paragraphs['newsletter_date'], rapp_matrix, rapp_matrix_para,
+                                             topic_matrix_para, topic_values, topic_colmapper, rapp_names)
+
+    # co-occurrence in long format (rapporteur x topic & rapporteur x rapporteur), per paragraph or sentence window
+    topic_names: list = [topic_colmapper[i] for i in topic_values]
+    if window is None:
+        rapp_units, topic_units, unit_quarters = rapp_matrix_para, topic_matrix_para, quarters
+        cube, labels = cooccurrence_cube(rapp_units, topic_units, unit_quarters)
+    else:
+        (rapp_units, topic_units), unit_paragraph = unit_matrices(
+            [paragraphs['matches_rapp'], paragraphs['matches_topic']], [tuple(rapp_values), topic_values],
+            starts_per_paragraph=paragraphs['sentence_starts'], window=window)
+        unit_quarters = quarters.iloc[unit_paragraph].reset_index(drop=True)
+        cube, labels = cooccurrence_cube(rapp_units, topic_units, unit_quarters)
+
+    cooccurrence: dict = {
+        'rapporteur_topic': cooccurrence_long(cube, labels, rapp_names, topic_names, columns=('rapporteur', 'topic')),
+        'rapporteur_rapporteur': cooccurrence_long(*cooccurrence_cube(rapp_units, rapp_units, unit_quarters),
+                                                   rapp_names, rapp_names, columns=('rapporteur', 'rapporteur_other'),
+                                                   symmetric=True)}
+
+    # non-AI paragraphs: keep rows with a rapporteur but not AI(act)
+    topic_rows: np.ndarray = \
+        ((paragraphs['matches_rapp'].apply(len) > 0) & (paragraphs['matches_topic'].apply(len) < 1)).to_numpy()
+
+    topic_paragraphs = paragraphs.loc[topic_rows, ['newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph']]
+
+    para_pos, rapp_pos = rapp_matrix_para[topic_rows].nonzero()  # one row per paragraph and rapporteur mentioned in it
+    topic_paragraphs_rapp = topic_paragraphs.iloc[para_pos].reset_index(drop=True)
+    topic_paragraphs_rapp.insert(3, 'rapporteur', np.asarray(rapp_names, dtype=object)[rapp_pos])
+
+    return {'mention_cube': mention_cube,
+            'cooccurrence': cooccurrence,
+            'topic_paragraphs': topic_paragraphs.reset_index(drop=True),
+            'topic_paragraphs_rapp': topic_paragraphs_rapp,
+            'mention_index': partial_mention_index(paragraphs, [rapp_matrix_para, topic_matrix_para], [rapp_names, topic_names])
+            if with_index else None,
+            'paragraph_vectors': partial_paragraph_vectors(paragraphs) if with_vectors else None}
+
+
+def merge_partial_aggregates(aggregates: list):
+    """ Takes in a list of partial aggregates (see partial_quarterly_aggregates; None entries are skipped)
+        Returns the aggregates of all partitions: counts are added, paragraphs are concatenated
+        (the paragraphs are not sorted; see sort_by_newsletter_order)
+    :param aggregates: list of dicts
+    :return: dict (None if there are no aggregates)
+    """
+    aggregates = [i for i in aggregates if i is not None]
+
+    if len(aggregates) == 0:  # nothing processed
+        return None
+
+    cooccurrence: dict = {kind: merge_cooccurrence([aggr['cooccurrence'][kind] for aggr in aggregates])
+                          for kind in aggregates[0]['cooccurrence'].keys()}
+
+    return {'mention_cube': MentionCube.merge([aggr['mention_cube'] for aggr in aggregates]),
+            'cooccurrence': cooccurrence,
+            'topic_paragraphs': pd.concat([aggr['topic_paragraphs'] for aggr in aggregates], ignore_index=True),
+            'topic_paragraphs_rapp': pd.concat([aggr['topic_paragraphs_rapp'] for aggr in aggregates], ignore_index=True),
+            'mention_index': pd.concat([aggr['mention_index'] for aggr in aggregates], ignore_index=True)
+            if all(aggr.get('mention_index') is not None for aggr in aggregates) else None,
+            'paragraph_vectors': pd.concat([aggr['paragraph_vectors'] for aggr in aggregates], ignore_index=True)
+            if all(aggr.get('paragraph_vectors') is not None for aggr in aggregates) else None}
+
+
+def sort_by_newsletter_order(df: pd.DataFrame, newsletter_order: list):
+    """ Sorts rows by the position of their 'newsletter_id' in newsletter_order, then by 'paragraph_pos'
+        (i.e. in the order in which a full run reads the paragraphs); unknown ids are put last
+    :param df: pd.DataFrame with columns 'newsletter_id' and 'paragraph_pos'
+    :param newsletter_order: list of newsletter ids in the order of the input file
+    :return: pd.DataFrame
+    """
+    order = pd.Series(range(len(newsletter_order)), index=pd.Index(newsletter_order))
+    order = order[~order.index.duplicated(keep='first')]
+
+    return df.assign(_order=df['newsletter_id'].map(order))\
+        .sort_values(['_order', 'paragraph_pos'], kind='stable', na_position='last')\
+        .drop(columns='_order')
+
+
+def load_incremental_state(path: str, state_key: str):
+    """ Loads the state of a previous run; returns None if there is none or if it was created with other patterns
+    :param path: str; path of the pickle file
+    :param state_key: str identifying the rapporteur and topic patterns
+    :return: dict or None
+    """
+    if not os.path.exists(path):
+        print(f"No stored state found at {path}; all newsletters are processed.")
+        return None
+
+    state: dict = pd.read_pickle(path)
+
+    if state.get('state_key') != state_key:
+        print("The stored state was created with other patterns; all newsletters are processed.")
+        return None
+
+    return state
+
+
+def save_incremental_state(path: str, state: dict):
+    """ Stores the state of this run (dict with 'state_key', 'processed_ids' and 'aggregates') for the next
+        incremental run
+    :param path: str; path of the pickle file
+    :param state: dict
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pd.to_pickle(state, path + ".tmp")
+    os.replace(path + ".tmp", path)  # replace the old state only once the new one is complete
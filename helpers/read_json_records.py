@@ -0,0 +1,88 @@
+"""
+    This file: provide functions to stream records from a JSON file without loading the whole file
+        supported formats (detected from the first non-whitespace character)
+            JSON array:  [{"id": 1, "date": "...", "text": "..."}, {...}, ...]   (e.g. Newsletters - Morning tech.json)
+            JSON Lines:  one JSON object per line
+        only the requested fields of every record are kept
+"""
+
+import json
+
+import pandas as pd
+
+
+def iter_json_records(path: str, fields: tuple = None, buffer_size: int = 1 << 20):
+    """ Takes in the path of a JSON array or JSON Lines file. Yields one dict per record (reads the file incrementally)
+        Example:
+            for record in iter_json_records("./data/raw/Newsletters - Morning tech.json", fields=('id', 'date', 'text')):
+                record  # {'id': 1, 'date': '2022-01-03', 'text': '...'}
+    :param path: str
+    :param fields: tuple of keys to keep (missing keys are set to None); None keeps all keys
+    :param buffer_size: int; number of characters read at once
+    :return: generator of dicts
+    """
+    decoder = json.JSONDecoder()
+
+    def project(record):
+        return record if fields is None else {field: record.get(field) for field in fields}
+
+    with open(path, "r", encoding="utf-8") as f:
+        buf: str = f.read(buffer_size)
+        pos: int = len(buf) - len(buf.lstrip())
+
+        if buf[pos:pos + 1] != "[":  # JSON Lines
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield project(json.loads(line))
+            return
+
+        pos += 1  # skip opening bracket of the array
+        eof: bool = False
+
+        while True:
+            # skip separators between records
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos < len(buf) and buf[pos] == "]":  # end of array
+                return
+
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("Buffer exhausted", buf, pos)
+                record, pos = decoder.raw_decode(buf, pos)
+
+            except json.JSONDecodeError:  # record incomplete: read more
+                if eof:
+                    raise
+                more: str = f.read(buffer_size)
+                eof = len(more) == 0
+                buf, pos = buf[pos:] + more, 0
+                continue
+
+            yield project(record)
+
+            if pos > buffer_size:  # drop consumed part of the buffer
+                buf, pos = buf[pos:], 0
+
+
+def read_json_chunks(path: str, columns: tuple = ("id", "date", "text"), chunksize: int = 500):
+    """ Takes in the path of a JSON array or JSON Lines file. Yields data frames with 'chunksize' records each
+        only 'columns' are kept, so memory use is bounded by the chunk size (and not by the file size)
+    :param path: str
+    :param columns: tuple of columns to keep
+    :param chunksize: int; number of records per data frame
+    :return: generator of pd.DataFrame
+    """
+    records: list = []
+
+    for record in iter_json_records(path, fields=tuple(columns)):
+        records.append(record)
+
+        if len(records) == chunksize:
+            yield pd.DataFrame.from_records(records, columns=list(columns))
+            records = []
+
+    if len(records) > 0:
+        yield pd.DataFrame.from_records(records, columns=list(columns))
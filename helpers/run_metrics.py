@@ -0,0 +1,157 @@
+"""
+    This file: provide per-stage instrumentation of a pipeline run and its export as a JSON run report
+        for every stage (e.g. split, parse, match_rapp, aggregate, export_counts) the following is recorded
+            wall time & CPU time (seconds; summed over all calls of the stage, e.g. one call per chunk)
+            peak RSS of the process (MB; high-water mark at the end of the stage) & its growth during the stage
+            rows in & out and rows (docs) per second of wall time
+        stages are measured either with start/stop (fits the #%% cells of the scripts) or as a context manager;
+        one stage can be run under cProfile, its stats (accumulated over all calls of the stage) are dumped to
+            <profile_dir>/<stage>.prof (see pstats / snakeviz)
+        helpers take an optional 'metrics' argument; track() returns a no-op when it is None
+"""
+
+import contextlib
+import cProfile
+import datetime as dt
+import json
+import os
+import sys
+import time
+import timeit
+
+try:
+    import resource  # not available on Windows: peak RSS is reported as None
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """ Returns the peak resident set size of the current process in MB (None where it cannot be determined) """
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 ** 2 if sys.platform == "darwin" else maxrss / 1024  # bytes on macOS, KB on Linux
+
+
+class RunMetrics:
+    """ Collects the metrics of the stages of one run
+        Example:
+            metrics = RunMetrics(script="0-entity-retrieval_spacy.py", profile_stage="parse")
+            metrics.start("parse", rows_in=len(texts))
+            docs = list(nlp.pipe(texts))
+            metrics.stop("parse", rows_out=len(docs))
+            with metrics.stage("aggregate", rows_in=paragraphs.shape[0]) as record:
+                ...
+                record['rows_out'] = counts.shape[0]
+            metrics.write_report("./data/reports/run_retrieval.json")
+    """
+
+    def __init__(self, script: str = None, profile_stage: str = None, profile_dir: str = "./data/reports/profiles",
+                 settings: dict = None):
+        self.meta: dict = {'script': script, 'started': dt.datetime.now().isoformat(timespec="seconds"),
+                           'python': sys.version.split()[0], 'pid': os.getpid(), 'settings': settings or {}}
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self._profiler = cProfile.Profile() if profile_stage is not None else None
+        self.stages: dict = {}  # stage name: aggregated record (in the order the stages were first started)
+        self._running: dict = {}  # stage name: (wall start, cpu start, peak RSS at start, rows in)
+
+    def start(self, name: str, rows_in: int = None):
+        """ Starts measuring the stage 'name' """
+        self._running[name] = (timeit.default_timer(), time.process_time(), peak_rss_mb(), rows_in)
+
+        if name == self.profile_stage:
+            self._profiler.enable()
+
+    def stop(self, name: str, rows_out: int = None):
+        """ Stops measuring the stage 'name' and adds the call to its record. Returns the record of the stage """
+        if name == self.profile_stage:
+            self._profiler.disable()
+
+        wall_start, cpu_start, rss_start, rows_in = self._running.pop(name)
+        wall: float = timeit.default_timer() - wall_start
+        cpu: float = time.process_time() - cpu_start
+        rss = peak_rss_mb()
+
+        if name == self.profile_stage:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self._profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))  # stats of all calls so far
+
+        return self.add(name, {'calls': 1, 'wall_seconds': wall, 'cpu_seconds': cpu, 'peak_rss_mb': rss,
+                               'rss_growth_mb': rss - rss_start if rss is not None else None,
+                               'rows_in': rows_in, 'rows_out': rows_out})
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """ Context manager measuring the stage 'name'; 'rows_out' can be set on the yielded dict """
+        record: dict = {'rows_out': None}
+        self.start(name, rows_in=rows_in)
+        try:
+            yield record
+        finally:
+            self.stop(name, rows_out=record['rows_out'])
+
+    def add(self, name: str, call: dict):
+        """ Adds one call (or the aggregated record of another RunMetrics, e.g. of a worker process) to the stage 'name'
+            times, rows and RSS growth are summed, the peak RSS is the maximum
+        :return: dict
+        """
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': None,
+                                 'rss_growth_mb': None, 'rows_in': None, 'rows_out': None}
+        record: dict = self.stages[name]
+
+        record['calls'] += call['calls']
+        record['wall_seconds'] += call['wall_seconds']
+        record['cpu_seconds'] += call['cpu_seconds']
+        for key in ['rss_growth_mb', 'rows_in', 'rows_out']:
+            if call[key] is not None:
+                record[key] = (record[key] or 0) + call[key]
+        if call['peak_rss_mb'] is not None:
+            record['peak_rss_mb'] = max(record['peak_rss_mb'] or 0, call['peak_rss_mb'])
+
+        record['docs_per_second'] = record['rows_in'] / record['wall_seconds']\
+            if record['rows_in'] is not None and record['wall_seconds'] > 0 else None
+
+        return record
+
+    def merge(self, stages: dict, prefix: str = ""):
+        """ Adds the aggregated records of another run (e.g. RunMetrics.stages of a worker process) """
+        for name, record in stages.items():
+            self.add(prefix + name, record)
+
+    def summary(self):
+        """ Prints one line per stage """
+        for name, record in self.stages.items():
+            rss: str = f"{record['peak_rss_mb']:9.1f} MB" if record['peak_rss_mb'] is not None else "        - MB"
+            rate: str = f", {record['docs_per_second']:.0f} docs/s" if record['docs_per_second'] is not None else ""
+            print(f"{name:<20} {record['wall_seconds']:9.3f} s wall {record['cpu_seconds']:9.3f} s CPU {rss} peak RSS"
+                  f"  rows in: {record['rows_in']}, rows out: {record['rows_out']}{rate}")
+
+    def write_report(self, path: str):
+        """ Writes the run report (meta data & stage records) as JSON to 'path' """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        report: dict = {'meta': {**self.meta, 'finished': dt.datetime.now().isoformat(timespec="seconds"),
+                                 'peak_rss_mb': peak_rss_mb()},
+                        'stages': self.stages}
+
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+def track(metrics, name: str, rows_in: int = None):
+    """ Returns metrics.stage(name, rows_in) or, if metrics is None, a context manager that does nothing
+        Example:
+            with track(metrics, "split", rows_in=newsletters.shape[0]) as record:
+                paragraphs = tokenize_df_explode(...)
+                record['rows_out'] = paragraphs.shape[0]
+    :param metrics: RunMetrics or None
+    :param name: str
+    :param rows_in: int
+    :return: context manager yielding a dict
+    """
+    if metrics is None:
+        return contextlib.nullcontext({'rows_out': None})
+
+    return metrics.stage(name, rows_in=rows_in)
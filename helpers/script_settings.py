@@ -0,0 +1,22 @@
+"""
+    This file: provide the settings given on the command line (see cli.py) to the scripts
+        the scripts keep their settings as annotated module-level variables (edited when run cell by cell);
+        cli.py stores the values of its options in 'overrides' and runs the script, which applies them right after
+        its settings with apply_overrides(globals()); without cli.py, 'overrides' is empty and nothing changes
+"""
+
+overrides: dict = {}  # setting name: value (set by cli.py before a script is run)
+
+
+def apply_overrides(namespace: dict):
+    """ Replaces the settings of a script by the values given on the command line
+        Example:
+            overrides: {'spacy_model': 'blank', 'n_workers': 4}
+            apply_overrides(globals())  # in 0-entity-retrieval_spacy.py, after the settings
+    :param namespace: dict (globals() of the script)
+    """
+    unknown: list = [name for name in overrides if name not in namespace]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown settings {unknown}; the script defines no variables with these names.")
+
+    namespace.update(overrides)
@@ -0,0 +1,56 @@
+"""
+    This file: provide functions to aggregate spaCy Matcher results in a sparse paragraph x pattern matrix
+        instead of one pd.Series per paragraph (see count_tup_first_values), all (match_id, start, end) tuples are
+        collected into flat arrays and counted at once; binarisation is computed directly on the sparse matrix
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def sparse_match_matrix(matches, values):
+    """ Takes in an iterable of lists of match tuples (one list per paragraph) and the match ids to be counted
+        Returns a scipy CSR matrix (n paragraphs x len(values)) with the number of matches of each id per paragraph
+        Example:
+            matches: [[(101, 0, 2), (102, 4, 6), (101, 8, 10)], [], [(102, 1, 2)]]
+            values: (101, 102, 103)
+            return: csr_matrix([[2, 1, 0],
+                                [0, 0, 0],
+                                [0, 1, 0]])
+    :param matches: iterable (e.g. pd.Series) of lists of tuples
+    :param values: tuple of match ids; column j of the result counts values[j]
+    :return: scipy.sparse.csr_matrix
+    """
+    matches = list(matches)
+    values_arr = np.asarray(values, dtype=np.uint64)
+    if len(values_arr) == 0:  # no match ids to count
+        return sparse.csr_matrix((len(matches), 0), dtype=np.int64)
+
+    lengths = np.fromiter((len(lst) for lst in matches), dtype=np.int64, count=len(matches))
+    rows = np.repeat(np.arange(len(matches), dtype=np.int64), lengths)  # paragraph of each match
+    ids = np.fromiter((match[0] for lst in matches for match in lst), dtype=np.uint64, count=lengths.sum())  # id of each match
+
+    # map match ids to column positions (ids not in values are dropped)
+    order = np.argsort(values_arr)
+    pos = np.searchsorted(values_arr[order], ids).clip(max=len(values_arr) - 1)
+    keep = values_arr[order][pos] == ids
+
+    counts = sparse.csr_matrix((np.ones(keep.sum(), dtype=np.int64), (rows[keep], order[pos[keep]])),
+                               shape=(len(matches), len(values_arr)))
+    counts.sum_duplicates()  # one entry per paragraph and pattern
+
+    return counts
+
+
+def binarize_sparse(counts):
+    """ Takes in a sparse count matrix. Returns a copy in which every non-zero count is 1
+        (e.g. 'paragraph mentions': one paragraph counts once, no matter how often the pattern matched)
+    :param counts: scipy.sparse matrix
+    :return: scipy.sparse.csr_matrix
+    """
+    binary = sparse.csr_matrix(counts, copy=True)
+    binary.eliminate_zeros()
+    binary.data[:] = 1
+
+    return binary
+
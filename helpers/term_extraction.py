@@ -0,0 +1,82 @@
+"""
+    This file: provide the term extraction of 1-retrieval-words.py as a spaCy pipeline component ('term_extractor')
+        terms are the lower-cased lemmas of the tokens whose POS is in keep_pos and whose lower-cased text and lemma are
+        not excluded (the same selection as extract_terms on a TokenStore; see term_mask in helpers/token_store.py)
+        per batch of Docs, POS, LOWER and LEMMA ids are read with doc.to_array into one integer table and filtered by a
+        vectorized mask against hashed exclusion sets (no per-token Python work); lemmas are lower-cased once per
+        distinct lemma (cached)
+        every Doc gets the array of its term ids (hashes of the lower-cased lemmas; uint64) as doc._.terms
+            nlp.add_pipe("term_extractor", config={'keep_pos': ["NOUN"], 'exclude': ["rapporteur", "politico"]})
+            doc = nlp("The rapporteur presented the proposal to the committee.")
+            doc._.terms  # array([hash('proposal'), hash('committee')], dtype=uint64)
+            terms_of(doc)  # ['proposal', 'committee']
+        the component needs POS and LEMMA (full pipeline, e.g. en_core_web_lg; see helpers/load_spacy_pipeline.py)
+        importing this module registers the component
+"""
+
+import numpy as np
+from spacy.language import Language
+from spacy.tokens import Doc
+from spacy.util import minibatch
+
+from helpers.token_store import term_mask
+
+if not Doc.has_extension("terms"):
+    Doc.set_extension("terms", default=None)
+
+
+class TermExtractor:
+    """ spaCy pipeline component setting doc._.terms (term ids of the Doc; see the file docstring) """
+
+    def __init__(self, vocab, keep_pos: tuple = ("NOUN", ), exclude: tuple = (), attr: str = "LEMMA"):
+        self.vocab = vocab
+        self.keep_pos: tuple = tuple(keep_pos)
+        self.exclude: tuple = tuple(exclude)
+        self.attr: str = attr
+        self._lower_of: dict = {}  # hash of an 'attr' string: hash of the lower-cased string (added to vocab.strings)
+
+    def _lower_hashes(self, values: np.ndarray):
+        """ Returns the hashes of the lower-cased strings of 'values' (one Python call per distinct new value) """
+        distinct, inverse = np.unique(values, return_inverse=True)
+        for hsh in distinct.tolist():
+            if hsh not in self._lower_of:
+                self._lower_of[hsh] = self.vocab.strings.add(self.vocab.strings[hsh].lower()) if hsh != 0 else 0
+
+        return np.array([self._lower_of[hsh] for hsh in distinct.tolist()], dtype=np.uint64)[inverse]
+
+    def _set_terms(self, docs: list):
+        """ Sets doc._.terms of a batch of Docs (one attribute table and one mask per batch) """
+        attrs: list = ["POS", "LOWER", self.attr]
+        table = np.concatenate([doc.to_array(attrs).reshape(len(doc), len(attrs)) for doc in docs] +
+                               [np.zeros((0, len(attrs)), dtype=np.uint64)])
+        offsets = np.concatenate([[0], np.cumsum([len(doc) for doc in docs], dtype=np.int64)])
+
+        term_lower = self._lower_hashes(table[:, 2])
+        keep = term_mask(table[:, 0], table[:, 1], term_lower, keep_pos=self.keep_pos, exclude=self.exclude)
+
+        for i, doc in enumerate(docs):
+            doc._.terms = term_lower[offsets[i]:offsets[i + 1]][keep[offsets[i]:offsets[i + 1]]]
+
+    def __call__(self, doc: Doc):
+        self._set_terms([doc])
+        return doc
+
+    def pipe(self, stream, batch_size: int = 1000):
+        """ Sets the terms of the Docs of 'stream' in batches (used by nlp.pipe) """
+        for docs in minibatch(stream, size=batch_size):
+            self._set_terms(docs)
+            yield from docs
+
+
+@Language.factory("term_extractor", default_config={'keep_pos': ["NOUN"], 'exclude': [], 'attr': "LEMMA"})
+def create_term_extractor(nlp: Language, name: str, keep_pos: list, exclude: list, attr: str):
+    return TermExtractor(nlp.vocab, keep_pos=tuple(keep_pos), exclude=tuple(exclude), attr=attr)
+
+
+def terms_of(doc: Doc):
+    """ Returns the terms of a Doc processed by the component as strings
+        Example:
+            terms_of(nlp("The rapporteur presented the proposal to the committee."))
+            return: ['proposal', 'committee']
+    """
+    return [doc.vocab.strings[hsh] for hsh in doc._.terms.tolist()]
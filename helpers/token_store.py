@@ -0,0 +1,368 @@
+"""
+    This file: provide a compact, columnar store of token attributes as a replacement for lists/columns of spaCy Docs
+        the attributes of all tokens of all documents (paragraphs) are kept in one flat numpy array per attribute
+            LOWER, LEMMA (string hashes; uint64), POS (part-of-speech id), IDX (character offset) and LENGTH
+        plus 'doc_offsets': tokens of document i are doc_offsets[i]:doc_offsets[i + 1]
+        and a string table (hash: string) of the hashes in the store, so no spaCy vocab is needed to read it
+        a store is saved as a directory of .npy files (+ strings.json) and loaded memory-mapped
+    on top of the store
+        TokenStoreMatcher: vectorized token pattern matching (the subset of Matcher patterns used in this repository)
+        TokenStorePhraseMatcher: vectorized phrase matching (like PhraseMatcher; time independent of the number of phrases)
+        extract_terms:     POS & exclusion filtering of lemmas (as in 1-retrieval-words.py) as array masks
+        term_codes:        the same selection as integer term codes (see helpers/document_term_matrix.py)
+        term_mask:         the selection itself (also used by the spaCy component in helpers/term_extraction.py)
+"""
+
+import json
+import os
+
+import numpy as np
+from spacy.parts_of_speech import IDS as POS_IDS
+from spacy.strings import hash_string
+
+default_attrs: tuple = ("LOWER", "LEMMA", "POS", "IDX", "LENGTH")
+hash_attrs: set = {"ORTH", "LOWER", "NORM", "LEMMA", "TAG", "DEP", "ENT_TYPE", "SHAPE", "PREFIX", "SUFFIX"}
+_dtypes: dict = {"POS": np.uint16, "IDX": np.uint32, "LENGTH": np.uint32}  # all other attributes: uint64
+
+
+class TokenStore:
+    """ Columnar token attributes of a sequence of documents
+        Example:
+            store = TokenStore.from_docs(nlp.pipe(paragraphs))  # the Docs are not kept
+            store.save("./data/preprocessed/token_store")
+            store = TokenStore.load("./data/preprocessed/token_store")  # memory-mapped
+            store.strings_of(0, "LEMMA")  # lemmas of the first paragraph
+    """
+
+    def __init__(self, columns: dict, doc_offsets: np.ndarray, strings: dict):
+        self.columns: dict = columns  # attribute name: np.ndarray (one value per token)
+        self.doc_offsets: np.ndarray = doc_offsets  # n documents + 1
+        self.strings: dict = strings  # hash (int): string
+
+    @classmethod
+    def from_docs(cls, docs, attrs: tuple = default_attrs):
+        """ Takes in an iterable of spaCy Docs (e.g. the generator nlp.pipe(texts)). Returns a TokenStore
+            the Docs are converted one by one (doc.to_array) and not referenced afterwards
+        :param docs: iterable of spacy.tokens.Doc
+        :param attrs: tuple of spaCy attribute names
+        :return: TokenStore
+        """
+        attrs = tuple(attrs)
+        arrays: list = []
+        lengths: list = []
+        vocab = None
+
+        for doc in docs:
+            arrays.append(doc.to_array(list(attrs)).reshape(len(doc), len(attrs)))
+            lengths.append(len(doc))
+            vocab = doc.vocab
+
+        table = np.concatenate(arrays) if len(arrays) > 0 else np.zeros((0, len(attrs)), dtype=np.uint64)
+        columns: dict = {attr: table[:, pos].astype(_dtypes.get(attr, np.uint64)) for pos, attr in enumerate(attrs)}
+        doc_offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+        # string table of all hashes in the store (0: no value, e.g. LEMMA without lemmatizer)
+        strings: dict = {}
+        for attr in set(attrs) & hash_attrs:
+            strings.update((int(hsh), vocab.strings[hsh] if hsh != 0 else "") for hsh in np.unique(columns[attr]))
+
+        return cls(columns, doc_offsets, strings)
+
+    @classmethod
+    def concat(cls, stores: list):
+        """ Returns one TokenStore holding the documents of all 'stores' (in this order) """
+        stores = [i for i in stores if i is not None]
+        columns: dict = {attr: np.concatenate([i.columns[attr] for i in stores]) for attr in stores[0].columns}
+
+        n_tokens = np.cumsum([0] + [i.n_tokens for i in stores[:-1]])
+        doc_offsets = np.concatenate([[0]] + [i.doc_offsets[1:] + shift for i, shift in zip(stores, n_tokens)])
+
+        strings: dict = {}
+        for i in stores:
+            strings.update(i.strings)
+
+        return cls(columns, doc_offsets.astype(np.int64), strings)
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    @property
+    def n_tokens(self):
+        return int(self.doc_offsets[-1])
+
+    def token_docs(self):
+        """ Returns the document position of every token (np.ndarray of length n_tokens) """
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.doc_offsets))
+
+    def subset(self, positions):
+        """ Returns a new TokenStore with the documents at 'positions' (in this order) """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts, ends = self.doc_offsets[positions], self.doc_offsets[positions + 1]
+        lengths = ends - starts
+
+        # token positions of the selected documents
+        token_pos = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(lengths.sum())
+
+        columns: dict = {attr: np.asarray(col[token_pos]) for attr, col in self.columns.items()}
+        doc_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+        return TokenStore(columns, doc_offsets, self.strings)
+
+    def strings_of(self, doc: int, attr: str = "LOWER"):
+        """ Returns the strings of the attribute 'attr' of the tokens of document 'doc' """
+        return [self.strings[int(hsh)] for hsh in self.columns[attr][self.doc_offsets[doc]:self.doc_offsets[doc + 1]]]
+
+    def save(self, path: str):
+        """ Saves the store as a directory of .npy files, strings.json and meta.json """
+        os.makedirs(path, exist_ok=True)
+        for attr, col in self.columns.items():
+            np.save(os.path.join(path, f"{attr}.npy"), col)
+        np.save(os.path.join(path, "doc_offsets.npy"), self.doc_offsets)
+
+        with open(os.path.join(path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump({str(hsh): string for hsh, string in self.strings.items()}, f, ensure_ascii=False)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({'attrs': list(self.columns.keys()), 'n_docs': len(self), 'n_tokens': self.n_tokens}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """ Loads a store saved with TokenStore.save; the attribute arrays are memory-mapped unless mmap is False """
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta: dict = json.load(f)
+        with open(os.path.join(path, "strings.json"), "r", encoding="utf-8") as f:
+            strings: dict = {int(hsh): string for hsh, string in json.load(f).items()}
+
+        mmap_mode = "r" if mmap else None
+        columns: dict = {attr: np.load(os.path.join(path, f"{attr}.npy"), mmap_mode=mmap_mode) for attr in meta['attrs']}
+
+        return cls(columns, np.load(os.path.join(path, "doc_offsets.npy")), strings)
+
+
+class TokenStoreMatcher:
+    """ Vectorized matching of token patterns on a TokenStore; returns the same (match_id, start, end) tuples as a
+        spaCy Matcher with the same patterns
+        supported: one attribute of the store per token pattern (e.g. {'LOWER': 'ai'}) and the operator '!'
+        (a token is required but its attribute must differ, e.g. {'LOWER': 'act', 'OP': '!'})
+        Example:
+            matcher = TokenStoreMatcher({101: [[{'LOWER': 'ai'}, {'LOWER': 'act'}]]})
+            matcher(store)
+            return: [[(101, 4, 6)], [], ...]  (one list per document)
+    """
+
+    def __init__(self, patterns: dict):
+        self.patterns: dict = {}  # match id: list of [(attribute, value, negate), ...]
+        for match_id, patts in patterns.items():
+            self.add(match_id, patts)
+
+    def add(self, match_id: int, patterns: list):
+        """ Adds token patterns (as for spacy.matcher.Matcher.add) for the match id """
+        compiled: list = []
+        for patt in patterns:
+            tokens: list = []
+            for tok in patt:
+                op = tok.get('OP')
+                attrs = [i for i in tok if i != 'OP']
+                if len(attrs) != 1 or op not in (None, '!') or not isinstance(tok[attrs[0]], str):
+                    raise ValueError(f"Unsupported token pattern for TokenStoreMatcher: {tok}")
+                attr = attrs[0].upper() if attrs[0].upper() != "TEXT" else "ORTH"
+                value = POS_IDS[tok[attrs[0]]] if attr == "POS" else hash_string(tok[attrs[0]])
+                tokens.append((attr, value, op == '!'))
+            compiled.append(tokens)
+
+        self.patterns.setdefault(match_id, []).extend(compiled)
+
+    def attrs(self):
+        """ Returns the set of attributes the patterns need in the store """
+        return {attr for patts in self.patterns.values() for patt in patts for attr, _, _ in patt}
+
+    def __call__(self, store: TokenStore):
+        """ Returns one list of (match_id, start, end) tuples per document of the store (start/end: token positions) """
+        token_docs = store.token_docs()
+        found: list = []  # arrays (match id, doc, start, end) of all patterns
+
+        for match_id, patts in self.patterns.items():
+            for patt in patts:
+                n: int = len(patt)
+                if store.n_tokens < n:
+                    continue
+                starts = np.arange(store.n_tokens - n + 1, dtype=np.int64)
+                hit = token_docs[starts] == token_docs[starts + n - 1]  # no match across documents
+                for k, (attr, value, negate) in enumerate(patt):
+                    col = store.columns[attr][k:k + len(starts)]
+                    hit &= (col != value) if negate else (col == value)
+
+                starts = starts[hit]
+                docs = token_docs[starts]
+                local = starts - store.doc_offsets[docs]
+                found.append(np.column_stack([np.full(len(starts), match_id, dtype=np.int64), docs, local, local + n]))
+
+        return _matches_per_doc(found, len(store))
+
+
+class TokenStorePhraseMatcher(TokenStoreMatcher):
+    """ Vectorized phrase matching on a TokenStore; returns the same (match_id, start, end) tuples as a spaCy
+        PhraseMatcher(vocab, attr=attr) with the same phrases
+        every window of n tokens of the store is reduced to one key (polynomial hash of its attribute hashes); a bitmap
+        indexed by the low bits of the keys discards most windows, the rest are looked up in the sorted keys of all
+        phrases of n tokens and verified token by token
+        ==> the time per token depends on the distinct phrase lengths, hardly on the number of phrases
+        Example:
+            matcher = TokenStorePhraseMatcher({1001: [['van', 'sparrentak']], 1002: [['voss']]})
+            matcher(store)
+            return: [[(1002, 3, 4)], [], ...]  (one list per document)
+    """
+
+    _multiplier = np.uint64(1099511628211)  # FNV prime
+
+    def __init__(self, phrases: dict, attr: str = "LOWER"):
+        self.attr: str = attr
+        self.phrases: dict = {}  # match id: list of phrases (lists of strings)
+        self._compiled: dict = {}  # phrase length: (bitmap, sorted keys, match ids, token hashes); built on first call
+        for match_id, phrs in phrases.items():
+            self.add(match_id, phrs)
+
+    def add(self, match_id: int, phrases: list):
+        """ Adds phrases (lists of token strings, e.g. [['van', 'sparrentak']]) for the match id """
+        if any(len(phrase) == 0 for phrase in phrases):
+            raise ValueError(f"Empty phrase for match id {match_id}.")
+        self.phrases.setdefault(match_id, []).extend(list(phrase) for phrase in phrases)
+        self._compiled = {}
+
+    def attrs(self):
+        """ Returns the set of attributes the phrases need in the store """
+        return {self.attr}
+
+    @classmethod
+    def _window_keys(cls, tokens: np.ndarray, n: int):
+        """ Returns the key of every window of n consecutive values of 'tokens' (uint64 arithmetic wraps around) """
+        keys = np.array(tokens[:len(tokens) - n + 1], dtype=np.uint64)
+        for k in range(1, n):
+            keys = keys * cls._multiplier + tokens[k:k + len(keys)]
+        return keys
+
+    def _compile(self):
+        """ Groups the phrases by length: bitmap of the keys, sorted keys, their match ids and token hashes """
+        by_length: dict = {}  # n tokens: list of (match id, token hashes)
+        for match_id, phrs in self.phrases.items():
+            for phrase in phrs:
+                by_length.setdefault(len(phrase), []).append((match_id, [hash_string(i) for i in phrase]))
+
+        for n, entries in by_length.items():
+            tokens = np.array([hashes for _, hashes in entries], dtype=np.uint64)
+            match_ids = np.array([match_id for match_id, _ in entries], dtype=np.int64)
+            keys = np.array([self._window_keys(row, n)[0] for row in tokens], dtype=np.uint64)
+            order = np.argsort(keys, kind='stable')
+
+            bitmap = np.zeros(max(4096, 1 << int(32 * len(keys)).bit_length()), dtype=bool)  # ~3% false positives at most
+            bitmap[keys & np.uint64(len(bitmap) - 1)] = True
+            self._compiled[n] = (bitmap, keys[order], match_ids[order], tokens[order])
+
+    def __call__(self, store: TokenStore):
+        """ Returns one list of (match_id, start, end) tuples per document of the store (start/end: token positions) """
+        if len(self._compiled) == 0:
+            self._compile()
+
+        token_docs = store.token_docs()
+        col = np.asarray(store.columns[self.attr], dtype=np.uint64)
+        found: list = []  # arrays (match id, doc, start, end) of all phrase lengths
+
+        for n, (bitmap, phrase_keys, match_ids, phrase_tokens) in self._compiled.items():
+            if store.n_tokens < n:
+                continue
+            window_keys = self._window_keys(col, n)
+            windows = np.flatnonzero(bitmap[window_keys & np.uint64(len(bitmap) - 1)])  # candidate windows
+            first = np.searchsorted(phrase_keys, window_keys[windows], side='left')
+            n_hits = np.searchsorted(phrase_keys, window_keys[windows], side='right') - first  # phrases can share a key
+
+            windows, first, counts = windows[n_hits > 0], first[n_hits > 0], n_hits[n_hits > 0]
+            starts = np.repeat(windows, counts)  # one row per (window, phrase with the same key)
+            phrase_pos = np.repeat(first, counts) + np.arange(len(starts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+            hit = token_docs[starts] == token_docs[starts + n - 1]  # no match across documents
+            for k in range(n):  # equal keys of different windows are possible, equal tokens are required
+                hit &= col[starts + k] == phrase_tokens[phrase_pos, k]
+
+            starts, phrase_pos = starts[hit], phrase_pos[hit]
+            docs = token_docs[starts]
+            local = starts - store.doc_offsets[docs]
+            found.append(np.column_stack([match_ids[phrase_pos], docs, local, local + n]))
+
+        return _matches_per_doc(found, len(store))
+
+
+def _matches_per_doc(found: list, n_docs: int):
+    """ Turns arrays of (match id, doc, start, end) rows into one sorted list of (match_id, start, end) per document """
+    matches: list = [[] for _ in range(n_docs)]
+    if len(found) == 0:
+        return matches
+
+    found_arr = np.unique(np.concatenate(found), axis=0)  # identical matches of several patterns count once
+    found_arr = found_arr[np.lexsort((found_arr[:, 0], found_arr[:, 3], found_arr[:, 2], found_arr[:, 1]))]
+    for match_id, doc, start, end in found_arr.tolist():
+        matches[doc].append((match_id, start, end))
+
+    return matches
+
+
+def term_codes(store: TokenStore, keep_pos: tuple = ("NOUN", ), exclude: tuple = (), attr: str = "LEMMA"):
+    """ Selects the tokens used as terms (see extract_terms) and codes their lower-cased 'attr' (lemma) strings
+        Returns (keep, codes, terms)
+            keep:  bool array (n_tokens) of the selected tokens
+            codes: int array (n_tokens) of the term of every token (index into 'terms'; also set for unselected tokens)
+            terms: array of the distinct lower-cased strings
+    :param store: TokenStore with the columns POS, LOWER and 'attr'
+    :param keep_pos: tuple of POS names
+    :param exclude: tuple of lower-case strings
+    :param attr: str
+    :return: tuple
+    """
+    # lower-cased lemma per distinct lemma hash (the string table is small compared to the tokens)
+    values, inverse = np.unique(np.asarray(store.columns[attr]), return_inverse=True)
+    terms, value_codes = np.unique(np.array([store.strings[int(hsh)].lower() for hsh in values], dtype=object),
+                                   return_inverse=True)
+
+    term_hashes = np.array([hash_string(i) for i in terms], dtype=np.uint64)
+    keep = term_mask(store.columns["POS"], store.columns["LOWER"], term_hashes[value_codes][inverse],
+                     keep_pos=keep_pos, exclude=exclude)
+
+    return keep, value_codes[inverse], terms
+
+
+def term_mask(pos: np.ndarray, lower: np.ndarray, term_lower: np.ndarray, keep_pos: tuple = ("NOUN", ),
+              exclude: tuple = ()):
+    """ Returns the bool mask of the tokens used as terms: POS in keep_pos, neither the lower-cased text nor the
+        lower-cased lemma in 'exclude' (one vectorized test per attribute; shared by term_codes and the spaCy
+        component in helpers/term_extraction.py)
+    :param pos: np.ndarray of POS ids (one per token)
+    :param lower: np.ndarray of LOWER hashes
+    :param term_lower: np.ndarray of the hashes of the lower-cased lemmas
+    :param keep_pos: tuple of POS names
+    :param exclude: tuple of lower-case strings
+    :return: np.ndarray (bool)
+    """
+    exclude_hashes = np.array([hash_string(i) for i in exclude], dtype=np.uint64)
+
+    keep = np.isin(pos, [POS_IDS[i] for i in keep_pos])
+    keep &= ~np.isin(lower, exclude_hashes)
+    keep &= ~np.isin(term_lower, exclude_hashes)
+
+    return keep
+
+
+def extract_terms(store: TokenStore, keep_pos: tuple = ("NOUN", ), exclude: tuple = (), attr: str = "LEMMA"):
+    """ Returns the lower-cased 'attr' (lemma) strings of the tokens whose POS is in keep_pos and whose lower-cased
+        text and lower-cased lemma are not in 'exclude'; one list per document
+        Example:
+            extract_terms(store, keep_pos=("NOUN", ), exclude=("rapporteur", ))
+            return: [['vote', 'committee', 'proposal'], ['data', 'rule'], ...]
+    :param store: TokenStore with the columns POS, LOWER and 'attr'
+    :param keep_pos: tuple of POS names
+    :param exclude: tuple of lower-case strings
+    :param attr: str
+    :return: list of lists
+    """
+    keep, codes, terms = term_codes(store, keep_pos=keep_pos, exclude=exclude, attr=attr)
+    kept_offsets = np.concatenate([[0], np.cumsum(keep)])[store.doc_offsets]  # kept tokens per document
+
+    kept_terms: list = terms[codes[keep]].tolist()
+    return [kept_terms[kept_offsets[i]:kept_offsets[i + 1]] for i in range(len(store))]
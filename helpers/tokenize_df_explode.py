@@ -1,57 +1,118 @@
 """
     This file: provide function to explode data set based on delimiter
+        the texts are split into flat lists of pieces (paragraph/sentence text and position of the parent row);
+        the exploded data frame is built from these flat lists, so memory grows with the number of pieces
+        (and not with number of rows x longest text as for a wide frame of pieces)
 """
 
+import re
+import timeit
+
 import nltk
+import numpy as np
 import pandas as pd
-import timeit
 
+_LINE_BREAKS = re.compile(r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")  # line boundaries as in str.splitlines
+_BLANK_LINES = re.compile(r"\s*\n\s*\n\s*")  # as in nltk.tokenize.BlanklineTokenizer
 
-def tokenize_df_explode(df: pd.DataFrame, split_on:str = "new_line", textcol_in: str = "text", textcol_out: str = "text_out"):
-    """ explode data set by sentencizing one column (textcol_in)
-        takes in
-            'df' (pd.DataFrame)
-            'textcol_in' (str) where df['textcol_in'] contains text
-            'split_on' (str) which must be "sent_break" or "new_line" or "empty_line";
-                indicates whether text should be split into sentences (on sentence breaks) or into paragraphs
-                (denoted by a line break (\n) or an empty line (\n\n)
-        returns data frame with a new column (df['sentencecol_out']) where each sentence in df['textcol_in'] is a row
-    """
-    starttime = timeit.default_timer()
 
-    indexname: str = df.index.name  # save to reset later
-    df.index.rename("index", inplace=True)  # for later melting when index becomes colum
+def _split_offsets(text: str, separator: re.Pattern):
+    """ Returns (start, end) offsets of the pieces of 'text' between matches of 'separator' """
+    offsets: list = []
+    start: int = 0
+
+    for sep in separator.finditer(text):
+        offsets.append((start, sep.start()))
+        start = sep.end()
+    offsets.append((start, len(text)))
+
+    return offsets
+
+
+def split_text(text: str, split_on: str = "new_line"):
+    """ Takes in a text. Returns the list of its sentences or paragraphs
+        equivalent to the nltk tokenizers
+            "sent_break": nltk.tokenize.sent_tokenize
+            "new_line":   nltk.tokenize.LineTokenizer(blanklines="discard") (blank lines are dropped)
+            "empty_line": nltk.tokenize.BlanklineTokenizer() (empty pieces are dropped)
+    :param text: str
+    :param split_on: str which must be "sent_break" or "new_line" or "empty_line"
+    :return: list of strings
+    """
+    if not isinstance(text, str):  # missing text: no pieces
+        return []
 
-    # instantiate needed tokenizer
     if split_on == "sent_break":  # sentence tokenizer
-        tmp_tokenizer = nltk.tokenize.sent_tokenize
-        out_series_list = df[textcol_in].apply(tmp_tokenizer)
+        return nltk.tokenize.sent_tokenize(text)
 
     elif split_on == "new_line":  # line tokenizer
-        tmp_tokenizer = nltk.tokenize.LineTokenizer(blanklines="discard")
-        out_series_list = df[textcol_in].apply(tmp_tokenizer.tokenize)
+        return [text[start:end] for start, end in _split_offsets(text, _LINE_BREAKS)
+                if text[start:end].rstrip()]
 
     elif split_on == "empty_line":  # blank line tokenizer
-        tmp_tokenizer = nltk.tokenize.BlanklineTokenizer()
-        out_series_list = df[textcol_in].apply(tmp_tokenizer.tokenize)
+        return [text[start:end] for start, end in _split_offsets(text, _BLANK_LINES) if end > start]
 
     else:  # if split_on is another value
         raise ValueError("Value of split_on is invalid. Must be sent_break, new_line or empty_line")
-        return -1
 
 
-    out_series: pd.Series = pd.Series(data=out_series_list.apply(pd.Series).reset_index().melt(
-        id_vars="index").dropna()[['index', 'value']].set_index('index')['value'], name=textcol_out)
+def _explode_rows(df: pd.DataFrame, split_on: str, textcol_in: str, textcol_out: str, start_index: int = 0):
+    """ Explodes all rows of df; returns the exploded data frame with a RangeIndex starting at start_index """
+    pieces: list = []  # flat list of piece texts
+    parent_pos: list = []  # flat list of the position of each piece's row in df
 
-    df: pd.DataFrame = pd.merge(df, out_series, left_index=True, right_index=True)
+    for pos, text in enumerate(df[textcol_in].tolist()):
+        row_pieces = split_text(text, split_on=split_on)
+        pieces.extend(row_pieces)
+        parent_pos.extend([pos] * len(row_pieces))
 
-    df.reset_index(inplace=True)  # reset index to unique indices
+    indexname: str = "old_" + (df.index.name if df.index.name is not None else "index")
 
-    if "index" in df.columns: # delete old index column
-        df.rename(columns={"index": "old_" + indexname}, inplace=True)
+    out: pd.DataFrame = df.take(np.asarray(parent_pos, dtype=np.int64))
+    out[textcol_out] = pieces
+    out.index.name = indexname
+    out.reset_index(inplace=True)  # old index becomes column 'old_<index name>'
+    out.index = pd.RangeIndex(start_index, start_index + len(out))
+
+    return out
 
-    print(f"The splitting took {timeit.default_timer() - starttime:.3f} seconds.")
 
-    del out_series_list, out_series, starttime, indexname, tmp_tokenizer
+def tokenize_df_explode(df: pd.DataFrame, split_on:str = "new_line", textcol_in: str = "text", textcol_out: str = "text_out",
+                        chunksize: int = None):
+    """ explode data set by sentencizing one column (textcol_in)
+        takes in
+            'df' (pd.DataFrame)
+            'textcol_in' (str) where df['textcol_in'] contains text
+            'split_on' (str) which must be "sent_break" or "new_line" or "empty_line";
+                indicates whether text should be split into sentences (on sentence breaks) or into paragraphs
+                (denoted by a line break (\n) or an empty line (\n\n)
+            'chunksize' (int) optional; if given, a generator is returned that yields the exploded data frame in chunks
+                of 'chunksize' rows of df (the index continues across chunks)
+        returns data frame with a new column (df['sentencecol_out']) where each sentence in df['textcol_in'] is a row
+    """
+    if split_on not in ("sent_break", "new_line", "empty_line"):  # if split_on is another value
+        raise ValueError("Value of split_on is invalid. Must be sent_break, new_line or empty_line")
+
+    if chunksize is not None:
+        return _tokenize_df_explode_chunks(df, split_on=split_on, textcol_in=textcol_in, textcol_out=textcol_out,
+                                           chunksize=chunksize)
+
+    starttime = timeit.default_timer()
+
+    df = _explode_rows(df, split_on=split_on, textcol_in=textcol_in, textcol_out=textcol_out)
+
+    print(f"The splitting took {timeit.default_timer() - starttime:.3f} seconds.")
 
     return df
+
+
+def _tokenize_df_explode_chunks(df: pd.DataFrame, split_on: str, textcol_in: str, textcol_out: str, chunksize: int):
+    """ generator behind tokenize_df_explode(..., chunksize=n) """
+    start_index: int = 0
+
+    for start in range(0, df.shape[0], chunksize):
+        chunk = _explode_rows(df.iloc[start:start + chunksize], split_on=split_on, textcol_in=textcol_in,
+                              textcol_out=textcol_out, start_index=start_index)
+        start_index += chunk.shape[0]
+
+        yield chunk
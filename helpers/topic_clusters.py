@@ -0,0 +1,144 @@
+"""
+    This file: provide a clustering-based topic mode over the paragraph vectors of stage 0 (see helpers/paragraph_vectors.py)
+        TopicClusters is a spherical minibatch k-means: vectors are scaled to unit length, every vector belongs to the
+        center with the largest dot product (cosine similarity), and each minibatch moves the centers to the running
+        mean of all vectors assigned to them so far (Sculley 2010, "Web-scale k-means clustering")
+        the model remembers the quarters it was fitted on; fit_quarters only fits the paragraphs of new quarters,
+        so topics of new quarters are assigned without retraining from scratch (the model is pickled between runs)
+        the vectors are read in minibatches, so a memory-mapped matrix is never loaded completely
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def _unit_rows(vectors):
+    """ Returns the rows scaled to unit length (float32) and a mask of the rows that are not all zero """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    return vectors / np.maximum(norms, 1e-12)[:, None], norms > 0
+
+
+class TopicClusters:
+    """ Spherical minibatch k-means with incremental fitting per quarter
+        Example:
+            clusters = TopicClusters.load(path) or TopicClusters(n_clusters=10)
+            clusters.fit_quarters(vectors, quarters)  # only quarters not fitted before
+            labels, similarity = clusters.predict(vectors)
+            clusters.save(path)
+    """
+
+    def __init__(self, n_clusters: int = 10, batch_size: int = 1024, random_state: int = 100):
+        self.n_clusters: int = n_clusters
+        self.batch_size: int = batch_size
+        self.rng = np.random.default_rng(random_state)
+        self.centers = None  # n_clusters x dimensions (unit length)
+        self.counts = None  # number of vectors assigned to each center so far
+        self.fitted_quarters: list = []
+
+    def _init_centers(self, x: np.ndarray):
+        """ k-means++ seeding on unit vectors (distance: 1 - cosine similarity) """
+        if x.shape[0] < self.n_clusters:
+            raise ValueError(f"{x.shape[0]} paragraphs with a vector are too few for {self.n_clusters} clusters.")
+
+        centers: list = [x[self.rng.integers(x.shape[0])]]
+        distance = np.maximum(1 - x @ centers[0], 0)
+        for _ in range(1, self.n_clusters):
+            prob = distance / distance.sum() if distance.sum() > 0 else None
+            centers.append(x[self.rng.choice(x.shape[0], p=prob)])
+            distance = np.minimum(distance, np.maximum(1 - x @ centers[-1], 0))
+
+        self.centers = np.stack(centers).astype(np.float32)
+        self.counts = np.zeros(self.n_clusters, dtype=np.int64)
+
+    def partial_fit(self, vectors):
+        """ Moves the centers by one minibatch of vectors (rows that are all zero are ignored) """
+        x, nonzero = _unit_rows(vectors)
+        x = x[nonzero]
+        if self.centers is None:
+            self._init_centers(x)
+        if x.shape[0] == 0:
+            return self
+
+        labels = np.argmax(x @ self.centers.T, axis=1)
+        n = np.bincount(labels, minlength=self.n_clusters)
+        sums = np.asarray(sparse.csr_matrix((np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))),
+                                            shape=(self.n_clusters, len(labels))) @ x)
+
+        updated = n > 0
+        self.centers[updated] = (self.centers[updated] * self.counts[updated, None] + sums[updated]) / \
+            (self.counts[updated] + n[updated])[:, None]  # running mean of all vectors assigned to each center
+        self.centers, _ = _unit_rows(self.centers)
+        self.counts += n
+
+        return self
+
+    def fit_quarters(self, vectors, quarters: pd.Series):
+        """ Fits the rows of the quarters the model has not been fitted on (in shuffled minibatches)
+        :param vectors: np.ndarray (may be memory-mapped), n paragraphs x dimensions
+        :param quarters: pd.Series of quarter labels (one per row of vectors)
+        :return: list of the newly fitted quarters
+        """
+        quarters = quarters.astype(str)
+        new: list = sorted(set(quarters) - set(self.fitted_quarters))
+        rows = self.rng.permutation(np.flatnonzero(quarters.isin(new).to_numpy()))
+
+        first: int = max(self.batch_size, 3 * self.n_clusters) if self.centers is None else self.batch_size
+        for start, end in zip([0] + list(range(first, len(rows), self.batch_size)),
+                              list(range(first, len(rows), self.batch_size)) + [len(rows)]):
+            self.partial_fit(vectors[np.sort(rows[start:end])])
+
+        self.fitted_quarters = sorted(set(self.fitted_quarters) | set(new))
+
+        return new
+
+    def predict(self, vectors, chunksize: int = 10000):
+        """ Returns the cluster of every row (-1 for rows without a vector) and its cosine similarity to the center """
+        labels = np.full(vectors.shape[0], -1, dtype=np.int64)
+        similarity = np.zeros(vectors.shape[0], dtype=np.float32)
+
+        for start in range(0, vectors.shape[0], chunksize):
+            x, nonzero = _unit_rows(vectors[start:start + chunksize])
+            scores = x @ self.centers.T
+            pos = np.arange(start, start + x.shape[0])[nonzero]
+            labels[pos] = np.argmax(scores[nonzero], axis=1)
+            similarity[pos] = scores[nonzero].max(axis=1)
+
+        return labels, similarity
+
+    def save(self, path: str):
+        """ Pickles the model to 'path' """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        pd.to_pickle(self, path)
+
+    @classmethod
+    def load(cls, path: str, n_clusters: int = None, dimensions: int = None):
+        """ Loads a pickled model; returns None if there is none or if it has another number of clusters or dimensions """
+        if not os.path.exists(path):
+            return None
+
+        model = pd.read_pickle(path)
+        if (n_clusters is not None and model.n_clusters != n_clusters) or \
+                (dimensions is not None and model.centers is not None and model.centers.shape[1] != dimensions):
+            print(f"The model at {path} has another number of clusters or dimensions; a new model is fitted.")
+            return None
+
+        return model
+
+
+def quarterly_cluster_topics(labels: np.ndarray, quarters: pd.Series):
+    """ Returns the most frequent cluster of every quarter ('topic', e.g. 'topic 3') and the share of the quarter's
+        paragraphs (with a vector) in it ('topic_probability'); one row per quarter ('newsletter_date')
+    :param labels: np.ndarray (output of TopicClusters.predict)
+    :param quarters: pd.Series of quarters (one per label)
+    :return: pd.DataFrame
+    """
+    assigned = labels >= 0
+    counts = pd.crosstab(quarters.to_numpy()[assigned], labels[assigned])
+
+    return pd.DataFrame({'newsletter_date': counts.index,
+                         'topic': ["topic " + str(i) for i in counts.idxmax(axis=1)],
+                         'topic_probability': (counts.max(axis=1) / counts.sum(axis=1)).to_numpy()})
@@ -0,0 +1,150 @@
+"""
+    This file: provide batched topic inference for a trained gensim LDA model
+        the document x topic probability matrix of a whole corpus is computed in one pass (in chunks of documents)
+        instead of one lazily transformed corpus per document (lda_model[corpus][i]); it is cached next to the model,
+        keyed by the model's topic-word weights and the corpus (a hash of the CSR arrays of its chunks, or the path,
+        size & modification time of a serialized corpus such as gensim's MmCorpus)
+        the variational updates of LdaModel.inference (which loops over the documents of a chunk in Python) run on
+        all documents of a chunk at once: the chunk is a sparse document-term matrix, only its non-zero entries are
+        updated (no dense documents x terms matrix) and documents drop out of the update as soon as they converge
+        topic assignment is an argmax (or top-k) over the rows of the matrix
+"""
+
+import hashlib
+import itertools
+import os
+
+import numpy as np
+from scipy import sparse
+from scipy.special import psi
+
+
+def _bow_matrix(chunk: list, n_terms: int):
+    """ Returns a list of bag-of-words documents as a CSR matrix (documents x terms) """
+    lengths = [len(doc) for doc in chunk]
+    ids = np.fromiter((i for doc in chunk for i, _ in doc), dtype=np.int64, count=sum(lengths))
+    counts = np.fromiter((c for doc in chunk for _, c in doc), dtype=np.float64, count=sum(lengths))
+    indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    return sparse.csr_matrix((counts, ids, indptr), shape=(len(chunk), n_terms))
+
+
+def _infer_chunk(lda_model, counts):
+    """ Variational inference (E-step of LdaModel.inference) for all documents of a chunk at once
+        Returns gamma (n documents x n topics): the unnormalized topic weights of every document
+    :param lda_model: gensim.models.LdaModel
+    :param counts: scipy.sparse.csr_matrix (documents x terms)
+    :return: np.ndarray
+    """
+    epsilon = np.finfo(np.float64).eps
+    exp_elog_beta = np.asarray(lda_model.expElogbeta, dtype=np.float64)  # n topics x n terms
+    exp_elog_beta_t = np.ascontiguousarray(exp_elog_beta.T)  # n terms x n topics (rows gathered per entry)
+    alpha = np.asarray(lda_model.alpha, dtype=np.float64)
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+
+    gamma = lda_model.random_state.gamma(100., 1. / 100., (counts.shape[0], lda_model.num_topics))
+    exp_elog_theta = np.exp(psi(gamma) - psi(gamma.sum(axis=1, keepdims=True)))
+    active = np.arange(counts.shape[0])
+
+    for _ in range(lda_model.iterations):
+        # phinorm of every non-zero (document, term) entry: sum over topics of exp(E[log theta_dk]) x exp(E[log beta_kw])
+        phinorm = np.einsum('ij,ij->i', exp_elog_theta[rows], exp_elog_beta_t[counts.indices]) + epsilon
+        weighted = sparse.csr_matrix((counts.data / phinorm, counts.indices, counts.indptr), shape=counts.shape)
+
+        last_gamma = gamma[active]
+        new_gamma = alpha + exp_elog_theta * (weighted @ exp_elog_beta.T)
+        gamma[active] = new_gamma
+        exp_elog_theta = np.exp(psi(new_gamma) - psi(new_gamma.sum(axis=1, keepdims=True)))
+
+        # documents whose gamma hardly changed are done
+        running = np.abs(new_gamma - last_gamma).mean(axis=1) >= lda_model.gamma_threshold
+        if not running.any():
+            break
+        if not running.all():
+            active, exp_elog_theta, counts = active[running], exp_elog_theta[running], counts[running]
+            rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+
+    return gamma
+
+
+def corpus_key(corpus, n_terms: int, chunksize: int = 2000):
+    """ Returns a hash identifying the corpus: path, size & modification time of a serialized corpus (e.g. MmCorpus),
+        otherwise a hash of the CSR arrays (indptr, indices, data) of its chunks (one pass, chunk by chunk)
+    :param corpus: re-iterable of bag-of-words documents (e.g. list or gensim corpus)
+    :param n_terms: int
+    :param chunksize: int
+    :return: str
+    """
+    digest = hashlib.sha1()
+    fname = getattr(corpus, 'input', None)  # path of a serialized gensim corpus (e.g. MmCorpus)
+
+    if isinstance(fname, str) and os.path.exists(fname):
+        stat = os.stat(fname)
+        digest.update(f"{os.path.abspath(fname)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+    else:
+        documents = iter(corpus)
+        while True:
+            chunk: list = list(itertools.islice(documents, chunksize))
+            if len(chunk) == 0:
+                break
+            counts = _bow_matrix(chunk, n_terms)
+            for array in (counts.indptr, counts.indices, counts.data):
+                digest.update(array.tobytes())
+
+    return digest.hexdigest()
+
+
+def document_topic_matrix(lda_model, corpus, chunksize: int = 2000, cache_path: str = None):
+    """ Returns the topic probabilities of every document of the corpus (np.ndarray, n documents x n topics, float32)
+        Example:
+            doc_topics = document_topic_matrix(lda_model, corpus, cache_path="./data/cache/lda_model/lda")
+            doc_topics[0]  # topic distribution of the first document
+    :param lda_model: gensim.models.LdaModel (or LdaMulticore)
+    :param corpus: re-iterable of bag-of-words documents (e.g. list or gensim corpus)
+    :param chunksize: int; number of documents inferred at once
+    :param cache_path: str; path of the saved model (the matrix is stored as <cache_path>.doc_topics-<key>.npy); None: no cache
+    :return: np.ndarray
+    """
+    cache_file = None
+    if cache_path is not None:
+        key = hashlib.sha1(lda_model.state.get_lambda().tobytes() +
+                           corpus_key(corpus, lda_model.num_terms, chunksize).encode("utf-8")).hexdigest()[:16]
+        cache_file = f"{cache_path}.doc_topics-{key}.npy"
+        if os.path.exists(cache_file):
+            return np.load(cache_file, mmap_mode="r")
+
+    blocks: list = []
+    documents = iter(corpus)
+    while True:
+        chunk: list = list(itertools.islice(documents, chunksize))
+        if len(chunk) == 0:
+            break
+        gamma = _infer_chunk(lda_model, _bow_matrix(chunk, lda_model.num_terms))
+        blocks.append((gamma / gamma.sum(axis=1, keepdims=True)).astype(np.float32))
+
+    matrix = np.vstack(blocks) if len(blocks) > 0 else np.zeros((0, lda_model.num_topics), dtype=np.float32)
+
+    if cache_file is not None:
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        np.save(cache_file, matrix)
+
+    return matrix
+
+
+def top_topics(doc_topics: np.ndarray, k: int = 1):
+    """ Returns the k most probable topics of every document and their probabilities
+        Example:
+            doc_topics: np.array([[0.1, 0.7, 0.2], [0.5, 0.1, 0.4]]), k=2
+            return: (np.array([[1, 2], [0, 2]]), np.array([[0.7, 0.2], [0.5, 0.4]]))
+    :param doc_topics: np.ndarray (n documents x n topics)
+    :param k: int
+    :return: tuple (topic ids, probabilities), both n documents x k
+    """
+    doc_topics = np.asarray(doc_topics)
+    k = min(k, doc_topics.shape[1])
+
+    candidates = np.argpartition(-doc_topics, k - 1, axis=1)[:, :k]  # k largest (unsorted)
+    candidate_probs = np.take_along_axis(doc_topics, candidates, axis=1)
+    order = np.argsort(-candidate_probs, axis=1, kind='stable')
+
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_probs, order, axis=1)
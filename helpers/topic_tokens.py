@@ -0,0 +1,95 @@
+"""
+    This file: provide functions to hand the annotated non-AI rapporteur paragraphs from 0-entity-retrieval_spacy.py
+    to 1-retrieval-words.py without re-parsing them
+        stage 0 parses every such paragraph once (full pipeline: LEMMA & POS) and saves
+            <path>/tokens/                      TokenStore (see helpers/token_store.py); document i = paragraph_id i
+            <path>/paragraphs/                  paragraph_id, newsletter_id, paragraph_pos, newsletter_date, paragraph
+                                                (Parquet, partitioned by quarter; see helpers/parquet_tables.py)
+            <path>/paragraph_rapporteurs.parquet paragraph_id, rapporteur (one row per paragraph and rapporteur)
+        (their paragraph vectors are stored with those of all other parsed paragraphs; see helpers/paragraph_vectors.py)
+        stage 1 filters the tokens of every paragraph once and builds the quarterly (and quarterly per-rapporteur)
+        token lists by grouping paragraph ids
+"""
+
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as pa_ds
+
+from helpers.parquet_tables import read_table, write_table
+from helpers.token_store import TokenStore
+
+
+def export_topic_tokens(topic_paragraphs: pd.DataFrame, topic_paragraphs_rapp: pd.DataFrame, nlp, path: str,
+                        doc_cache=None, **pipe_kwargs):
+    """ Parses the non-AI rapporteur paragraphs and saves their token attributes & ids (see above) to 'path'
+    :param topic_paragraphs: pd.DataFrame with columns 'newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph'
+    :param topic_paragraphs_rapp: pd.DataFrame with columns 'newsletter_id', 'paragraph_pos', 'rapporteur'
+    :param nlp: spacy.language.Language (with tagger & lemmatizer, i.e. mode "full")
+    :param path: str; output directory
+    :param doc_cache: DocBinCache of 'nlp' or None
+    :param pipe_kwargs: passed on to nlp.pipe (e.g. batch_size)
+    :return: TokenStore
+    """
+    paragraphs = topic_paragraphs[['newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph']].reset_index(drop=True)
+    paragraphs.insert(0, 'paragraph_id', np.arange(paragraphs.shape[0], dtype=np.int64))
+
+    texts: list = paragraphs['paragraph'].tolist()
+    docs = doc_cache.pipe(texts, **pipe_kwargs) if doc_cache is not None else nlp.pipe(texts, **pipe_kwargs)
+    store = TokenStore.from_docs(docs, attrs=("LOWER", "LEMMA", "POS", "IDX", "LENGTH"))
+
+    paragraph_rapporteurs = topic_paragraphs_rapp[['newsletter_id', 'paragraph_pos', 'rapporteur']]\
+        .merge(paragraphs[['newsletter_id', 'paragraph_pos', 'paragraph_id']], how='left', on=['newsletter_id', 'paragraph_pos'])
+    paragraph_rapporteurs = paragraph_rapporteurs[['paragraph_id', 'rapporteur']]
+
+    os.makedirs(path, exist_ok=True)
+    store.save(os.path.join(path, "tokens"))
+    write_table(paragraphs, os.path.join(path, "paragraphs"), quarter_column='newsletter_date', partition=True)
+    write_table(paragraph_rapporteurs, os.path.join(path, "paragraph_rapporteurs.parquet"), categories=('rapporteur', ))
+
+    print(f"Saved the tokens of {len(store)} paragraphs ({store.n_tokens} tokens) to {path}.")
+
+    return store
+
+
+def load_topic_tokens(path: str, mmap: bool = True, quarters: list = None):
+    """ Loads the output of export_topic_tokens. Returns (TokenStore, paragraphs, paragraph_rapporteurs)
+        with quarters, only the paragraphs (and their rapporteurs) of these quarters are read; the TokenStore always
+        holds all paragraphs (document 'paragraph_id')
+    :param path: str
+    :param mmap: bool; memory-map the token attributes
+    :param quarters: list of quarters, e.g. ['2022Q1', '2022Q2'] (None: all)
+    :return: tuple
+    """
+    paragraphs = read_table(os.path.join(path, "paragraphs"), quarters=quarters,
+                            columns=['paragraph_id', 'newsletter_id', 'paragraph_pos', 'newsletter_date', 'paragraph'])
+    paragraphs = paragraphs.sort_values('paragraph_id').reset_index(drop=True)
+
+    paragraph_rapporteurs = read_table(os.path.join(path, "paragraph_rapporteurs.parquet"),
+                                       filters=pa_ds.field('paragraph_id').isin(paragraphs['paragraph_id'].to_numpy())
+                                       if quarters is not None else None)
+
+    return TokenStore.load(os.path.join(path, "tokens"), mmap=mmap), paragraphs, paragraph_rapporteurs
+
+
+def quarterly_token_lists(paragraphs: pd.DataFrame, by: list = None):
+    """ Groups paragraphs by quarter (and the columns in 'by'). Returns one row per group with the joined paragraphs
+        and the concatenated token lists of its paragraphs (in the order of 'paragraphs')
+        Example:
+            paragraphs: pd.DataFrame({'newsletter_date': pd.to_datetime(['2022-01-03', '2022-02-01']),
+                                      'paragraph': ['Voss on data rules.', 'Vote on chips.'],
+                                      'tokens': [['data', 'rule'], ['vote', 'chip']]})
+            return: pd.DataFrame({'newsletter_date': [Period('2022Q1')], 'paragraph': ['Voss on data rules.\\nVote on chips.'],
+                                  'tokens': [['data', 'rule', 'vote', 'chip']]})
+    :param paragraphs: pd.DataFrame with columns 'newsletter_date', 'paragraph', 'tokens' (+ columns in 'by')
+    :param by: list of further grouping columns, e.g. ['rapporteur']
+    :return: pd.DataFrame
+    """
+    by = by if by is not None else []
+    groups: list = [paragraphs['newsletter_date'].dt.to_period("Q")] + [paragraphs[i] for i in by]
+
+    return paragraphs.groupby(groups)\
+        .agg(paragraph=('paragraph', '\n'.join), tokens=('tokens', lambda x: list(itertools.chain.from_iterable(x))))\
+        .reset_index()
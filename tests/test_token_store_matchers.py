@@ -0,0 +1,70 @@
+"""
+    This file: test that the TokenStore matchers (helpers/token_store.py) return the same matches as spaCy's
+    Matcher and PhraseMatcher on crafted texts (document ends, operator '!', multi-token aliases, empty docs)
+"""
+
+import pytest
+import spacy
+
+from helpers.entity_catalogue import build_matcher, build_phrase_matcher
+from helpers.token_store import TokenStore
+
+topic_patterns: dict = {100: [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act', 'OP': '!'}],
+                              [{'LOWER': 'ai'}, {'LOWER': 'act', 'OP': '!'}]],
+                        101: [[{'LOWER': 'artificial'}, {'LOWER': 'intelligence'}, {'LOWER': 'act'}],
+                              [{'LOWER': 'ai'}, {'LOWER': 'act'}]]}
+
+rapp_phrases: dict = {1001: [['van', 'sparrentak']], 1002: [['voss']], 1003: [['benifei'], ['brando', 'benifei']]}
+
+texts: list = ["AI act",
+               "We love AI",
+               "AI",
+               "",
+               "The AI Act and AI rules: artificial intelligence act, Artificial Intelligence.",
+               "Kim van Sparrentak met Voss and Brando Benifei; van der Sparrentak did not.",
+               "VAN SPARRENTAK",
+               "van",
+               "ai ai act ai"]
+
+
+@pytest.fixture(scope="module")
+def nlp():
+    return spacy.blank("en")
+
+
+def spacy_matches(matcher, docs: list):
+    return [sorted(matcher(doc)) for doc in docs]
+
+
+def store_matches(matcher, docs: list):
+    return [sorted(matches) for matches in matcher(TokenStore.from_docs(docs, attrs=tuple(sorted(matcher.attrs()))))]
+
+
+@pytest.mark.parametrize("text", texts)
+def test_token_store_matcher_single_doc(nlp, text):
+    docs = [nlp(text)]
+    assert store_matches(build_matcher(nlp.vocab, topic_patterns, engine="token_store"), docs) == \
+        spacy_matches(build_matcher(nlp.vocab, topic_patterns, engine="spacy"), docs)
+
+
+@pytest.mark.parametrize("text", texts)
+def test_token_store_phrase_matcher_single_doc(nlp, text):
+    docs = [nlp(text)]
+    assert store_matches(build_phrase_matcher(nlp.vocab, rapp_phrases, engine="token_store"), docs) == \
+        spacy_matches(build_phrase_matcher(nlp.vocab, rapp_phrases, engine="spacy"), docs)
+
+
+def test_matchers_across_documents(nlp):
+    """ All texts in one store: no match may span two documents (e.g. 'AI' at the end of one, 'act' at the start of
+        the next) and empty documents keep their (empty) match lists """
+    docs = [nlp(text) for text in texts + ["act", "", "sparrentak voss"]]
+
+    assert store_matches(build_matcher(nlp.vocab, topic_patterns, engine="token_store"), docs) == \
+        spacy_matches(build_matcher(nlp.vocab, topic_patterns, engine="spacy"), docs)
+    assert store_matches(build_phrase_matcher(nlp.vocab, rapp_phrases, engine="token_store"), docs) == \
+        spacy_matches(build_phrase_matcher(nlp.vocab, rapp_phrases, engine="spacy"), docs)
+
+
+def test_matchers_without_documents(nlp):
+    assert build_matcher(nlp.vocab, topic_patterns, engine="token_store")(TokenStore.from_docs([], attrs=("LOWER", ))) == []
+    assert build_phrase_matcher(nlp.vocab, rapp_phrases, engine="token_store")(TokenStore.from_docs([], attrs=("LOWER", ))) == []